@@ -0,0 +1,119 @@
+"""
+JWT authentication that resolves users without querying the database on every request.
+
+CachedJWTAuthentication keeps the fields of authenticated users in the configured Django cache for
+AUTHENTICATION_USER_CACHE_TIMEOUT seconds keyed by user ID, so authenticated requests cost no query once their user
+is cached. Saving or deleting a user drops its entry, which covers deactivation and password changes, while updates
+that send no signals are picked up once the entry expires. Password hashes are left out unless tokens are revoked on
+password changes, and the rebuilt users load a missing field on first access.
+
+With AUTHENTICATION_TRUST_TOKEN_CLAIMS the user is built from the claims that add_user_claims signs into the tokens
+instead, which needs neither cache nor database but keeps a deactivated user authenticated until the access token
+expires. Tokens issued without those claims, and every token when tokens are revoked on password changes, are
+resolved through the cache.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from authentication.constants import (TRUST_TOKEN_CLAIMS, USER_CACHE_ALIAS, USER_CACHE_KEY_PREFIX, USER_CACHE_TIMEOUT,
+                                      USER_CLAIMS)
+from authentication.models import User
+
+
+def get_user_cache():
+    return caches[getattr(settings, 'AUTHENTICATION_USER_CACHE_ALIAS', USER_CACHE_ALIAS)]
+
+
+def get_user_cache_key(user_id):
+    return f'{USER_CACHE_KEY_PREFIX}:{user_id}'
+
+
+def get_cached_field_names():
+    """ Returns the fields of a user kept in the cache, the password hash only when token revocation compares it. """
+
+    return [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname != 'password' or api_settings.CHECK_REVOKE_TOKEN
+    ]
+
+
+def build_user(values):
+    """ Returns a user loaded from the given field values, the fields missing from them are deferred. """
+
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(router.db_for_read(User), field_names, [values[name] for name in field_names])
+
+
+def cache_user(user):
+    """ Stores the fields of the user in the cache. """
+
+    values = {name: getattr(user, name) for name in get_cached_field_names()}
+    timeout = getattr(settings, 'AUTHENTICATION_USER_CACHE_TIMEOUT', USER_CACHE_TIMEOUT)
+    get_user_cache().set(get_user_cache_key(user.pk), values, timeout)
+
+
+def get_cached_user(user_id):
+    """ Returns the cached user with given ID, or None when it is not cached. """
+
+    values = get_user_cache().get(get_user_cache_key(user_id))
+    return build_user(values) if values is not None else None
+
+
+def delete_cached_user(user_id):
+    get_user_cache().delete(get_user_cache_key(user_id))
+
+
+def invalidate_cached_user(user_id):
+    """
+    Drops the cached user now and again when the current transaction commits, so that a user read before the commit
+    is not kept.
+    """
+
+    delete_cached_user(user_id)
+    transaction.on_commit(lambda: delete_cached_user(user_id))
+
+
+def get_user_from_claims(validated_token):
+    """ Returns the user described by the claims of the token, or None when the token lacks any of them. """
+
+    if any(claim not in validated_token for claim in USER_CLAIMS):
+        return None
+    user_id_field = User._meta.get_field(api_settings.USER_ID_FIELD)
+    values = {claim: validated_token[claim] for claim in USER_CLAIMS}
+    values[user_id_field.attname] = user_id_field.to_python(validated_token[api_settings.USER_ID_CLAIM])
+    return build_user(values)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """ Authenticates JWT access tokens like JWTAuthentication, resolving users from token claims or the cache. """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = None
+        trust_claims = getattr(settings, 'AUTHENTICATION_TRUST_TOKEN_CLAIMS', TRUST_TOKEN_CLAIMS)
+        if trust_claims and not api_settings.CHECK_REVOKE_TOKEN:
+            user = get_user_from_claims(validated_token)
+        if user is None and api_settings.USER_ID_FIELD == User._meta.pk.name:
+            user = get_cached_user(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache_user(user)
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
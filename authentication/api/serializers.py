@@ -1,8 +1,11 @@
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenBlacklistSerializer, TokenObtainPairSerializer
 
 from authentication.models import User
+from authentication.revocation import RevocableRefreshToken
+from authentication.utils import add_user_claims
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -43,3 +46,19 @@ class SignupSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         user.save()
         return user
+
+
+class LoginSerializer(TokenObtainPairSerializer):
+    """ Validates the credentials of a user and issues tokens carrying the claims that authentication may trust. """
+
+    token_class = RevocableRefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class LogoutSerializer(TokenBlacklistSerializer):
+    """ Blacklists the given refresh token, checking and recording it through the revocation index. """
+
+    token_class = RevocableRefreshToken
@@ -1,7 +1,8 @@
 from rest_framework import generics
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenObtainPairView
 
-from authentication.api.serializers import SignupSerializer
+from authentication.api.serializers import LoginSerializer, LogoutSerializer, SignupSerializer
 
 
 class SignupAPIView(generics.CreateAPIView):
@@ -9,3 +10,17 @@ class SignupAPIView(generics.CreateAPIView):
 
     permission_classes = (AllowAny,)
     serializer_class = SignupSerializer
+    query_budget = 5
+
+
+class LoginAPIView(TokenObtainPairView):
+    """ Logs in the user with provided credentials and returns a pair of access and refresh tokens. """
+
+    serializer_class = LoginSerializer
+    query_budget = 2
+
+
+class LogoutAPIView(TokenBlacklistView):
+    """ Logs out the user by blacklisting the provided refresh token. """
+
+    serializer_class = LogoutSerializer
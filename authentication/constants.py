@@ -0,0 +1,20 @@
+""" This file contains the constants that are being used in the Authentication app. """
+
+USER_CACHE_ALIAS = 'default'
+USER_CACHE_KEY_PREFIX = 'authentication:users'
+USER_CACHE_TIMEOUT = 60
+
+TRUST_TOKEN_CLAIMS = False
+USER_CLAIMS = ('username', 'is_active', 'is_staff', 'is_superuser')
+
+REVOCATION_CACHE_ALIAS = 'default'
+REVOCATION_CACHE_KEY_PREFIX = 'authentication:revocations'
+REVOCATION_CACHE_TIMEOUT = 24 * 60 * 60
+REVOCATION_BLOOM_CAPACITY = 100000
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+REVOCATION_RECENT_SIZE = 10000
+REVOCATION_MAX_SYNC = 1000
+
+PRUNE_TOKENS_BATCH_SIZE = 1000
+
+IMPORT_USERS_BATCH_SIZE = 500
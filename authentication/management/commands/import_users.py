@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.constants import IMPORT_USERS_BATCH_SIZE
+from authentication.importing import IMPORT_FORMATS, get_import_format, import_users
+
+
+class Command(BaseCommand):
+    """ Creates users from a CSV or NDJSON file, validated with the rules of sign-up, with passwords hashed in bulk. """
+
+    help = 'Imports users from a CSV or NDJSON file with username, email, password, first_name and last_name fields.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the file to import.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Format of the file, guessed from its extension when omitted.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_USERS_BATCH_SIZE,
+                            help='Number of users hashed and inserted per batch.')
+        parser.add_argument('--workers', type=int,
+                            help='Number of processes hashing passwords, 0 hashes them in this process. Defaults to '
+                                 'the number of CPUs.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or get_import_format(path)
+        if import_format is None:
+            raise CommandError(f'Can not tell the format of {path}, pass --format.')
+
+        def report_progress(report):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{report.imported} user(s) imported, {report.throughput:.1f} users/s.')
+
+        try:
+            with open(path, newline='', encoding='utf-8') as file:
+                report = import_users(file, import_format, options['batch_size'], options['workers'],
+                                      on_batch=report_progress)
+        except OSError as error:
+            raise CommandError(error)
+
+        for line_number, errors in report.errors.items():
+            messages = '; '.join(f'{name}: {" ".join(map(str, field_errors))}' for name, field_errors in errors.items())
+            self.stderr.write(f'Line {line_number}: {messages}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.imported} user(s) in {report.seconds:.1f}s ({report.throughput:.1f} users/s), '
+            f'{len(report.errors)} row(s) failed.'
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from authentication.constants import PRUNE_TOKENS_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    """ Deletes expired outstanding refresh tokens along with their blacklist entries. """
+
+    help = 'Deletes expired outstanding tokens and their blacklist entries in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PRUNE_TOKENS_BATCH_SIZE,
+                            help='Number of tokens deleted per query.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now()).order_by('id')
+
+        deleted = 0
+        last_id = 0
+        while True:
+            ids = list(expired.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired outstanding token(s).'))
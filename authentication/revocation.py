@@ -0,0 +1,200 @@
+"""
+In-memory index of revoked refresh tokens.
+
+Every process keeps a Bloom filter of the JTIs of blacklisted tokens that have not expired yet, built from the
+database on first use, along with a set of the JTIs revoked recently. A token whose JTI the filter does not contain
+is not revoked, which is the common case and needs no query, JTIs in the recent set are revoked without a query
+either, and only the rare false positives of the filter are checked against the blacklist table.
+
+Tokens revoked on logout are published to the configured Django cache as a numbered sequence of JTIs once the
+blacklist entry is committed. Before every check the index reads the latest number and adds the JTIs it has not
+seen, so revocations reach every process sharing the cache. An index that fell too far behind, or whose JTIs the
+cache evicted, is rebuilt from the database.
+
+The cache has to be shared between the worker processes. When it is local to each process, such as the local memory
+cache, a revocation would never reach the other workers, so tokens are checked against the blacklist table instead.
+"""
+
+import hashlib
+import math
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.constants import (REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_ERROR_RATE, REVOCATION_CACHE_ALIAS,
+                                      REVOCATION_CACHE_KEY_PREFIX, REVOCATION_CACHE_TIMEOUT, REVOCATION_MAX_SYNC,
+                                      REVOCATION_RECENT_SIZE)
+from drf_project.caches import CacheGeneration, is_shared_cache
+
+
+class BloomFilter:
+    """ Set of strings answering membership with no false negatives and false positives at about the error rate. """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + number * second) % self.size for number in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position // 8] |= 1 << position % 8
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position // 8] & 1 << position % 8 for position in self.positions(item))
+
+
+class RevocationIndex:
+    """ Answers whether the JTI of a refresh token is revoked, querying the database only on filter false positives. """
+
+    def __init__(self, cache_alias=REVOCATION_CACHE_ALIAS, key_prefix=REVOCATION_CACHE_KEY_PREFIX,
+                 capacity=REVOCATION_BLOOM_CAPACITY, error_rate=REVOCATION_BLOOM_ERROR_RATE):
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+        self.sequence = CacheGeneration(self.cache, self._key('sequence'))
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lock = threading.RLock()
+        self.bloom = None
+        self.recent = set()
+        self.revision = None
+
+    def _key(self, *parts):
+        return ':'.join([self.key_prefix, *map(str, parts)])
+
+    def load(self):
+        """ Rebuilds the filter from the blacklisted tokens that have not expired yet. """
+
+        with self.lock:
+            revision = self.sequence.get()
+            jtis = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list(
+                'token__jti', flat=True
+            )
+            jtis = list(jtis.order_by().iterator())
+            bloom = BloomFilter(max(self.capacity, len(jtis) * 2), self.error_rate)
+            for jti in jtis:
+                bloom.add(jti)
+            self.bloom, self.recent, self.revision = bloom, set(), revision
+
+    def sync(self):
+        """ Adds the revocations published since the index last looked, rebuilding it when they are out of reach. """
+
+        with self.lock:
+            if self.bloom is None or self.bloom.count > self.bloom.capacity:
+                self.load()
+                return
+
+            sequence = self.sequence.get()
+            if sequence <= self.revision:
+                return
+            slot_keys = [self._key('slot', number) for number in range(self.revision + 1, sequence + 1)]
+            jtis = self.cache.get_many(slot_keys) if len(slot_keys) <= REVOCATION_MAX_SYNC else {}
+            if len(jtis) < len(slot_keys):
+                self.load()
+                return
+            for jti in jtis.values():
+                self.add(jti)
+            self.revision = sequence
+
+    def add(self, jti):
+        with self.lock:
+            if len(self.recent) >= REVOCATION_RECENT_SIZE:
+                self.recent.clear()
+            self.recent.add(jti)
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+    def is_revoked(self, jti):
+        """ Returns whether the JTI is blacklisted. """
+
+        self.sync()
+        if jti in self.recent:
+            return True
+        if jti not in self.bloom:
+            return False
+        revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        if revoked:
+            self.add(jti)
+        return revoked
+
+    def publish(self, jti):
+        """ Announces a committed revocation to the indexes of every process sharing the cache. """
+
+        sequence = self.sequence.bump()
+        timeout = getattr(settings, 'AUTHENTICATION_REVOCATION_CACHE_TIMEOUT', REVOCATION_CACHE_TIMEOUT)
+        self.cache.set(self._key('slot', sequence), jti, timeout)
+        self.add(jti)
+
+
+_revocation_index = None
+_revocation_index_lock = threading.Lock()
+
+
+def get_revocation_index():
+    """
+    Returns the process wide revocation index, which is loaded from the database on its first check, or None when
+    the configured cache is local to the process and could not announce revocations to the other processes.
+    """
+
+    global _revocation_index
+    cache_alias = getattr(settings, 'AUTHENTICATION_REVOCATION_CACHE_ALIAS', REVOCATION_CACHE_ALIAS)
+    if not is_shared_cache(cache_alias):
+        return None
+    if _revocation_index is None:
+        with _revocation_index_lock:
+            if _revocation_index is None:
+                _revocation_index = RevocationIndex(cache_alias=cache_alias)
+    return _revocation_index
+
+
+def revoke_token(jti):
+    """ Adds the JTI to the revocation indexes once the current transaction commits, if there are indexes. """
+
+    def publish():
+        revocation_index = get_revocation_index()
+        if revocation_index is not None:
+            revocation_index.publish(jti)
+
+    transaction.on_commit(publish)
+
+
+class RevocableRefreshToken(RefreshToken):
+    """ Refresh token whose blacklist checks go through the revocation index, or the blacklist table without one. """
+
+    def check_blacklist(self):
+        revocation_index = get_revocation_index()
+        if revocation_index is None:
+            return super().check_blacklist()
+        if revocation_index.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        result = super().blacklist()
+        revoke_token(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+@receiver(setting_changed)
+def reset_revocation_index(setting, **kwargs):
+    """ Drops the index of this process when the cache it reads changes, mostly useful in tests. """
+
+    global _revocation_index
+    if setting in ('AUTHENTICATION_REVOCATION_CACHE_ALIAS', 'CACHES'):
+        _revocation_index = None
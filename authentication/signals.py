@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.api.authentication import invalidate_cached_user
+from authentication.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_on_change(sender, instance, **kwargs):
+    """ Drops the cached user of authentication when the user is saved, deactivated or deleted. """
+
+    invalidate_cached_user(instance.pk)
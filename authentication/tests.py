@@ -1,7 +1,23 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
 from django.urls import reverse
+from authentication.api.authentication import CachedJWTAuthentication, get_user_cache
 from authentication.models import User
+from authentication.revocation import BloomFilter, RevocableRefreshToken, RevocationIndex, get_revocation_index
 from authentication.utils import get_user_tokens
 
 
@@ -122,3 +138,242 @@ class LoginLogoutAPITestCase(APITestCase):
 
         response = self.client.post(self.logout_url, {'refresh': 'unauthorized token'})
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'authentication-tests'}})
+class CachedJWTAuthenticationTestCase(APITestCase):
+    """ Test cases for resolving the users of JWT access tokens from the cache or the token claims """
+
+    def setUp(self):
+        """ Starts from an empty cache and creates a sample user """
+
+        get_user_cache().clear()
+        self.user = User.objects.create_user(username='Shahryar', password='shahryar12345', is_staff=True)
+        self.token = get_user_tokens(self.user)['access']
+
+    def authenticate(self, token=None):
+        """ Authenticates a request carrying the token and returns the user along with the number of queries run """
+
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        with CaptureQueriesContext(connection) as context:
+            user, _ = CachedJWTAuthentication().authenticate(request)
+        return user, len(context.captured_queries)
+
+    def test_cached_user(self):
+        """ Test that the user is looked up once and then read from the cache """
+
+        user, queries = self.authenticate()
+        self.assertEqual((user.pk, queries), (self.user.pk, 1))
+
+        user, queries = self.authenticate()
+        self.assertEqual((user.pk, user.username, user.is_staff, queries), (self.user.pk, 'Shahryar', True, 0))
+        self.assertEqual(user.password, self.user.password)
+
+    def test_saved_user_is_invalidated(self):
+        """ Test that saving or deactivating the user drops the cached user """
+
+        self.authenticate()
+        self.user.username = 'Shahryar Ali'
+        self.user.save()
+        user, queries = self.authenticate()
+        self.assertEqual((user.username, queries), ('Shahryar Ali', 1))
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(AUTHENTICATION_TRUST_TOKEN_CLAIMS=True)
+    def test_trusted_claims(self):
+        """ Test that trusted claims resolve the user without queries, tokens lacking them use the cache """
+
+        user, queries = self.authenticate()
+        self.assertEqual((user.pk, user.username, user.is_staff, queries), (self.user.pk, 'Shahryar', True, 0))
+
+        _, queries = self.authenticate(str(AccessToken.for_user(self.user)))
+        self.assertEqual(queries, 1)
+
+    def test_login_tokens_carry_claims(self):
+        """ Test that tokens issued by login carry the claims of the user """
+
+        response = self.client.post(reverse('login'), {'username': 'Shahryar', 'password': 'shahryar12345'})
+        token = AccessToken(response.data['access'])
+        self.assertEqual((token['username'], token['is_staff'], token['is_active']), ('Shahryar', True, True))
+
+
+class BloomFilterTestCase(TestCase):
+
+    def test_membership(self):
+        """ Test that added items are always found and other items rarely are """
+
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for number in range(1000):
+            bloom.add(f'added-{number}')
+
+        self.assertTrue(all(f'added-{number}' in bloom for number in range(1000)))
+        false_positives = sum(f'other-{number}' in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class RevocationIndexTestCase(APITestCase):
+    """ Test cases for checking refresh tokens against the in-memory revocation index """
+
+    def setUp(self):
+        """ Starts from an empty shared cache and index and creates a sample user with a pair of tokens """
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        cache_settings = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_dir,
+        }})
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+        get_revocation_index().cache.clear()
+        get_revocation_index().load()
+        self.user = User.objects.create_user(username='Shahryar', password='shahryar12345')
+        self.refresh = get_user_tokens(self.user)['refresh']
+
+    def logout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('logout'), {'refresh': self.refresh})
+
+    def test_not_revoked_without_query(self):
+        """ Test that a token that is not revoked is checked without queries """
+
+        with CaptureQueriesContext(connection) as context:
+            RevocableRefreshToken(self.refresh)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_logout_revokes(self):
+        """ Test that a logged out token is revoked without a query and can not log out again """
+
+        self.assertEqual(self.logout().status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as context:
+            with self.assertRaises(TokenError):
+                RevocableRefreshToken(self.refresh)
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(self.logout().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocations_reach_other_indexes(self):
+        """ Test that revocations published by one process are seen by the index of another """
+
+        other = RevocationIndex()
+        other.load()
+        self.logout()
+
+        jti = RevocableRefreshToken(self.refresh, verify=False)['jti']
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(other.is_revoked(jti))
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_rebuild_from_database(self):
+        """ Test that an index rebuilt from the database, or missing announcements, knows every revoked token """
+
+        token = RevocableRefreshToken(self.refresh)
+        token.blacklist()
+        other = RevocationIndex()
+        other.load()
+        self.assertTrue(other.is_revoked(token['jti']))
+
+        other = RevocationIndex()
+        other.load()
+        second = RevocableRefreshToken(get_user_tokens(self.user)['refresh'])
+        second.blacklist()
+        get_revocation_index().publish(second['jti'])
+        other.cache.delete(other._key('slot', other.sequence.get()))
+        self.assertTrue(other.is_revoked(second['jti']))
+        self.assertFalse(other.is_revoked(AccessToken.for_user(self.user)['jti']))
+
+    def test_local_cache_checks_blacklist(self):
+        """ Test that a cache local to the process is not used and tokens are checked against the blacklist table """
+
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertIsNone(get_revocation_index())
+            self.assertEqual(self.logout().status_code, status.HTTP_200_OK)
+
+            with CaptureQueriesContext(connection) as context:
+                with self.assertRaises(TokenError):
+                    RevocableRefreshToken(self.refresh)
+            self.assertEqual(len(context.captured_queries), 1)
+
+
+class PruneOutstandingTokensTestCase(TestCase):
+
+    def test_prune(self):
+        """ Test that expired outstanding tokens and their blacklist entries are deleted in batches """
+
+        now = timezone.now()
+        tokens = [
+            OutstandingToken.objects.create(jti=f'jti-{number}', token='token', expires_at=now + timedelta(hours=hours))
+            for number, hours in enumerate((-2, -1, -1, 1))
+        ]
+        BlacklistedToken.objects.create(token=tokens[0])
+        out = StringIO()
+
+        call_command('prune_outstanding_tokens', '--batch-size', '2', stdout=out)
+
+        self.assertIn('Deleted 3 expired outstanding token(s).', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['jti-3'])
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+class ImportUsersTestCase(TestCase):
+    """ Test cases for the bulk import of users """
+
+    def setUp(self):
+        User.objects.create_user(username='Shahryar', password='shahryar12345')
+
+    def import_users(self, content, extension, *args):
+        """ Runs the import command on a file with given content and returns its output and errors """
+
+        file = tempfile.NamedTemporaryFile('w', suffix=f'.{extension}', delete=False)
+        self.addCleanup(os.remove, file.name)
+        with file:
+            file.write(content)
+        out, err = StringIO(), StringIO()
+        call_command('import_users', file.name, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv(self):
+        """ Test that valid rows are imported in batches and every invalid row is reported """
+
+        content = (
+            'username,email,password,first_name,last_name\n'
+            'alice,alice@EXAMPLE.com,wonderland12345,Alice,Liddell\n'
+            'bob,bob@example.com,12345,Bob,\n'
+            'Shahryar,shahryar@example.com,shahryar12345,,\n'
+            'carol,carol@example.com,lewiscarroll123,Carol,\n'
+            'alice,other@example.com,wonderland12345,,\n'
+        )
+        with CaptureQueriesContext(connection) as context:
+            out, err = self.import_users(content, 'csv', '--workers', '0', '--batch-size', '2')
+
+        self.assertIn('Imported 2 user(s)', out)
+        self.assertIn('3 row(s) failed', out)
+        self.assertIn('Line 3: password:', err)
+        self.assertIn('Line 4: username: A user with that username already exists.', err)
+        self.assertIn('Line 6: username: The username appears earlier in the file.', err)
+        self.assertEqual(len([query for query in context.captured_queries if 'INSERT' in query['sql']]), 2)
+
+        alice = User.objects.get(username='alice')
+        self.assertEqual((alice.email, alice.first_name, alice.last_name), ('alice@example.com', 'Alice', 'Liddell'))
+        self.assertTrue(alice.check_password('wonderland12345'))
+
+    def test_ndjson_with_processes(self):
+        """ Test that NDJSON rows are imported with passwords hashed in a pool of processes """
+
+        content = (
+            '{"username": "alice", "email": "alice@example.com", "password": "wonderland12345"}\n'
+            '\n'
+            'not json\n'
+            '{"username": "bob", "password": "lewiscarroll123"}\n'
+        )
+        out, err = self.import_users(content, 'ndjson', '--workers', '2')
+
+        self.assertIn('Imported 2 user(s)', out)
+        self.assertIn('Line 3: non_field_errors: Invalid JSON', err)
+        self.assertTrue(User.objects.get(username='bob').check_password('lewiscarroll123'))
@@ -1,10 +1,22 @@
-from rest_framework_simplejwt.tokens import RefreshToken
+from authentication.constants import USER_CLAIMS
+from authentication.revocation import RevocableRefreshToken
+
+
+def add_user_claims(token, user):
+    """
+    Adds the username and the flags of the user as claims of the token, access tokens created from a refresh token
+    copy them.
+    """
+
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
 
 
 def get_user_tokens(user):
     """ Returns the access and refresh token of passed-in user in form of a dictionary """
 
-    refresh = RefreshToken.for_user(user)
+    refresh = add_user_claims(RevocableRefreshToken.for_user(user), user)
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -0,0 +1,61 @@
+"""
+Helpers for the Django caches that hold state shared between worker processes.
+
+Versions, generations and flags are only seen by every worker when the cache holding them is shared, such as Redis,
+Memcached or the file based cache. Local memory and dummy caches live in the process using them, so features relying
+on such state need another backend in production.
+"""
+
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+PROCESS_LOCAL_CACHES = (DummyCache, LocMemCache)
+
+
+def is_shared_cache(alias):
+    """ Returns whether the cache with given alias is shared between worker processes. """
+
+    return not isinstance(caches[alias], PROCESS_LOCAL_CACHES)
+
+
+class CacheGeneration:
+    """
+    Number kept in a cache under the given key, which is bumped to outdate everything derived from earlier numbers.
+    A missing number, because it was never set or the cache evicted it, starts from the current time in milliseconds
+    so that it can not fall back to one already handed out.
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+
+    def get(self):
+        """ Returns the current number. """
+
+        number = self.cache.get(self.key)
+        if number is None:
+            self.cache.add(self.key, int(time.time() * 1000), None)
+            number = self.cache.get(self.key)
+        return number
+
+    def bump(self):
+        """ Moves to the next number and returns it. """
+
+        try:
+            return self.cache.incr(self.key)
+        except ValueError:
+            self.get()
+            return self.cache.incr(self.key)
+
+    def invalidate(self):
+        """
+        Bumps the number now and again when the current transaction commits, so that whatever was derived from the
+        database between the write and its commit is outdated as well.
+        """
+
+        self.bump()
+        transaction.on_commit(self.bump)
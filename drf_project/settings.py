@@ -61,7 +61,7 @@ AUTH_USER_MODEL = 'authentication.User'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -69,6 +69,10 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    'DEFAULT_RENDERER_CLASSES': [
+        'photogenie.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.JSONParser',
@@ -84,6 +88,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'photogenie.metrics.RequestMetricsMiddleware',
+    'photogenie.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +98,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'photogenie.budgets.QueryBudgetMiddleware',
+    'photogenie.routers.StickyPrimaryMiddleware',
 ]
 
 ROOT_URLCONF = 'drf_project.urls'
@@ -128,6 +136,15 @@ DATABASES = {
     }
 }
 
+# Post lists and details and categories are read from one of these database aliases picked at random, an empty tuple
+# reads them from default. Users read from default for POST_DATABASE_STICKY_SECONDS after a write of theirs, so that
+# they see their own changes while the replicas catch up. The cache remembering them has to be shared between worker
+# processes, otherwise every authenticated user reads from default.
+DATABASE_ROUTERS = ['photogenie.routers.ReplicaRouter']
+POST_DATABASE_REPLICAS = ()
+POST_DATABASE_STICKY_SECONDS = 5
+POST_DATABASE_REPLICA_CACHE_ALIAS = 'default'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -176,6 +193,74 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(minutes=TOKEN_REFRESH_HOURS)
 }
 
+# Users authenticated by JWT are cached for AUTHENTICATION_USER_CACHE_TIMEOUT seconds, saving a user drops its entry.
+# Trusting the claims signed into tokens skips the cache as well, but deactivated users keep their access until their
+# access token expires.
+AUTHENTICATION_USER_CACHE_ALIAS = 'default'
+AUTHENTICATION_USER_CACHE_TIMEOUT = 60
+AUTHENTICATION_TRUST_TOKEN_CLAIMS = False
+
+# Revoked refresh tokens are announced to the revocation index of every process through this cache. Refresh tokens are
+# checked against the blacklist table instead when it is a local memory or dummy cache. Processes that miss
+# announcements older than the timeout rebuild their index.
+AUTHENTICATION_REVOCATION_CACHE_ALIAS = 'default'
+AUTHENTICATION_REVOCATION_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Views and downloads of posts are buffered and written in batches, once POST_COUNTER_FLUSH_THRESHOLD increments are
+# buffered or POST_COUNTER_FLUSH_INTERVAL seconds have passed. The local buffer is flushed by each worker and when it
+# exits, use CacheCounterBuffer to share the buffer between worker processes through the default cache and to flush it
+# with the flush_post_counters command.
+POST_COUNTER_BUFFER = 'photogenie.counters.LocalCounterBuffer'
+
+# Downscaled renditions generated for every uploaded image, sizes are the longest edge in pixels. Use
+# 'photogenie.renditions.run_inline' as runner to generate them within the upload request.
+POST_RENDITION_SIZES = (256, 1024)
+POST_RENDITION_RUNNER = 'photogenie.renditions.run_in_background'
+
+# Backend sending the bytes of image downloads. XAccelRedirectBackend (nginx) and XSendfileBackend (Apache, lighttpd)
+# let the web server transfer the file, nginx needs an internal location at POST_DOWNLOAD_ACCEL_PREFIX aliased to
+# MEDIA_ROOT.
+POST_DOWNLOAD_BACKEND = 'photogenie.downloads.FileDownloadBackend'
+POST_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+# ZIP archives of many images are streamed while they are written and hold at most this many posts. Images with these
+# extensions are compressed already and stored as they are, the others are deflated.
+POST_ARCHIVE_MAX_POSTS = 1000
+POST_ARCHIVE_STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# Public post list and detail responses can be cached in this cache until posts, categories or tags change, set
+# POST_RESPONSE_CACHE_TIMEOUT to a number of seconds to turn the cache on. Workers only see the invalidations of the
+# others through a shared cache.
+POST_RESPONSE_CACHE_ALIAS = 'default'
+
+# Every process keeps the category catalogue in memory for at most POST_CATALOGUE_TIMEOUT seconds. Point the alias to a
+# shared cache to have every process reload it as soon as a category changes, not only the process that changed it.
+POST_CATALOGUE_CACHE_ALIAS = None
+
+# Post lists and details are built from plain rows by PostRowSerializer, which gives the same data as PostSerializer
+# faster.
+POST_ROW_SERIALIZER_ENABLED = True
+
+# Number of most used tags that the tags facet of post lists returns unless facet_limit is given.
+POST_FACET_TAG_LIMIT = 10
+
+# Textual responses of at least POST_COMPRESSION_MIN_SIZE bytes are compressed with the encoding clients prefer among
+# these ones, brotli needs the brotli package and is skipped without it.
+POST_COMPRESSION_ENCODINGS = ('br', 'gzip')
+POST_COMPRESSION_MIN_SIZE = 1024
+
+# Requests running more SQL queries than the budget their view declares are logged with 'log', fail with 'raise' and
+# are not counted at all with 'off'.
+POST_QUERY_BUDGET_MODE = 'log'
+
+# Wall time, database time, queries, serializer time and response size of requests are returned in a Server-Timing
+# header and exposed at /metrics in Prometheus text format. Nobody may scrape until client addresses are allowed or a
+# token is set, which Prometheus sends as bearer token, and '*' lets every client scrape. Behind a reverse proxy every
+# client has the address of the proxy, so use the token there instead of allowing that address.
+POST_METRICS_ENABLED = True
+POST_METRICS_ALLOWED_IPS = ()
+POST_METRICS_TOKEN = None
+
 INTERNAL_IPS = ('127.0.0.1', '0.0.0.0', 'localhost',)
 
 DEBUG_TOOLBAR_PANELS = [
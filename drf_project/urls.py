@@ -23,7 +23,9 @@ from django.utils.translation import gettext_lazy as _
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
-from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from authentication.api.authentication import CachedJWTAuthentication
+from photogenie.metrics import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -35,7 +37,7 @@ schema_view = get_schema_view(
     ),
     public=True,
     permission_classes=[permissions.AllowAny,],
-    authentication_classes=[JWTAuthentication,],
+    authentication_classes=[CachedJWTAuthentication,],
 )
 
 urlpatterns = [
@@ -45,6 +47,7 @@ urlpatterns = [
     path('', include('photogenie.urls')),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
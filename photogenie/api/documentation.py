@@ -4,12 +4,94 @@ from drf_yasg import openapi
 def get_user_posts_query_parameters():
     """ Returns query parameters for API documentation of list method of User Posts. """
 
+    query_parameters = [
+        *get_post_filter_query_parameters(),
+        openapi.Parameter(
+            name='pagination',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            enum=['page', 'cursor'],
+            description='Paginates by page number (default) or by cursor, which stays fast on deep pages.',
+            required=False,
+        ),
+        openapi.Parameter(
+            name='cursor',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description='Opaque position returned in the next link of cursor pagination.',
+            required=False,
+        ),
+        openapi.Parameter(
+            name='facets',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description='Comma separated facets among categories and tags, returns the number of matching posts per '
+                        'category and of the most used tags along with the page.',
+            required=False,
+        ),
+        openapi.Parameter(
+            name='facet_limit',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            description='Number of most used tags returned in the tags facet.',
+            required=False,
+        ),
+        *get_post_fields_query_parameters(),
+    ]
+
+    return query_parameters
+
+
+def get_post_fields_query_parameters():
+    """ Returns query parameters for API documentation of the fields shown by list and retrieve of User Posts. """
+
+    query_parameters = [
+        openapi.Parameter(
+            name='fields',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description='Comma separated fields to show, every field is shown by default.',
+            required=False,
+        ),
+        openapi.Parameter(
+            name='expand',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description='Comma separated relations among categories and published_by to show in full, the others '
+                        'are shown by their IDs. Every relation is expanded by default.',
+            required=False,
+        ),
+    ]
+
+    return query_parameters
+
+
+def get_download_query_parameters():
+    """ Returns query parameters for API documentation of image download. """
+
+    query_parameters = [
+        openapi.Parameter(
+            name='size',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            description='Downloads the rendition whose longest edge is the given size instead of the original image.',
+            required=False,
+        ),
+    ]
+
+    return query_parameters
+
+
+def get_post_filter_query_parameters():
+    """ Returns query parameters for API documentation of the filters that select User Posts. """
+
     query_parameters = [
         openapi.Parameter(
             name='search',
             in_=openapi.IN_QUERY,
             type=openapi.TYPE_STRING,
-            description='Searches the post based on username or category provided.',
+            description='Searches posts by words of their description, tags, categories or username, best matches '
+                        'first.',
             required=False,
         ),
         openapi.Parameter(
@@ -36,3 +118,21 @@ def get_user_posts_query_parameters():
     ]
 
     return query_parameters
+
+
+def get_archive_query_parameters():
+    """ Returns query parameters for API documentation of the archive download of images. """
+
+    query_parameters = [
+        openapi.Parameter(
+            name='ids',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description='Comma separated IDs of the posts whose images are archived, filters narrow them further.',
+            required=False,
+        ),
+        *get_post_filter_query_parameters(),
+        *get_download_query_parameters(),
+    ]
+
+    return query_parameters
@@ -0,0 +1,124 @@
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from photogenie.search import is_ranked, seek_ranked
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates the queryset by seeking past the last row of the previous page on its ordering field and primary key,
+    so every page costs the same index range scan regardless of its depth and no COUNT query is needed. Ranked search
+    results seek on their rank and primary key instead.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """ Returns one page of the queryset positioned after the cursor given in query parameters. """
+
+        self.request = request
+        if is_ranked(queryset):
+            self.field = None
+            position = self.decode_cursor(request)
+            if position is not None:
+                queryset = seek_ranked(queryset, *position)
+        else:
+            queryset = self.seek_ordering(queryset, request)
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def seek_ordering(self, queryset, request):
+        """ Orders the queryset by its ordering field and primary key and filters it to rows after the cursor. """
+
+        self.ordering = self.get_ordering(queryset)
+        field_name = self.ordering.lstrip('-')
+        self.field = queryset.model._meta.get_field(field_name)
+        descending = self.ordering.startswith('-')
+
+        queryset = queryset.order_by(self.ordering, '-pk' if descending else 'pk')
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(**{f'{field_name}__{lookup}e': value}).filter(
+                Q(**{f'{field_name}__{lookup}': value}) | Q(**{f'pk__{lookup}': pk})
+            )
+        return queryset
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        """ Returns the link to the page after the last post of this page, which may be a values() row. """
+
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        if self.field is None:
+            value, pk = (last['rank'], last['id']) if isinstance(last, dict) else (last.rank, last.pk)
+        else:
+            if isinstance(last, dict):
+                last = self.field.model(pk=last['id'], **{self.field.attname: last[self.field.attname]})
+            value, pk = self.field.value_to_string(last), last.pk
+        cursor = urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """ Returns the ordering value or rank and primary key encoded in the cursor, or None for the first page. """
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(urlsafe_b64decode(encoded.encode()))
+            if self.field is None:
+                value = float(value)
+                if not math.isfinite(value):
+                    raise ValueError(value)
+                return value, int(pk)
+            return self.field.to_python(value), int(pk)
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_ordering(queryset):
+        """
+        Returns the leading ordering of the queryset, falling back to the default ordering of its model when the
+        queryset is ordered by an annotation.
+        """
+
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        try:
+            queryset.model._meta.get_field(ordering[0].lstrip('-'))
+        except FieldDoesNotExist:
+            return queryset.model._meta.ordering[0]
+        return ordering[0]
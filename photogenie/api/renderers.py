@@ -0,0 +1,34 @@
+"""
+JSON rendering with orjson.
+
+FastJSONRenderer renders the same bytes as the JSONRenderer of REST framework, several times faster, when orjson is
+installed. It falls back to JSONRenderer when orjson is missing, for indented or ASCII only output and for data that
+orjson can not encode, such as integers beyond 64 bits.
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ Renders compact UTF-8 JSON with orjson, leaving types it does not encode like JSONRenderer to the encoder. """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            content = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_NON_STR_KEYS |
+                                   orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Line and paragraph separators are valid JSON but not valid JavaScript, JSONRenderer escapes them too.
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
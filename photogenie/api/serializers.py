@@ -1,12 +1,23 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from taggit.models import TaggedItem
 from taggit_serializer.serializers import (TaggitSerializer,
                                            TagListSerializerField)
 
 from authentication.api.serializers import UserSerializer
+from photogenie.api.utils import (bulk_add_categories, bulk_add_tags, get_category_ids, set_post_categories,
+                                  set_post_tags)
+from photogenie.constants import BULK_UPLOAD_BATCH_SIZE, BULK_UPLOAD_MAX_POSTS
+from photogenie.metrics import TimedSerializerMixin, time_serialization
 from photogenie.models import Category, UserPost
+from photogenie.renditions import delete_renditions_on_commit, schedule_renditions
+from photogenie.search import build_search_document, is_ranked, set_search_document
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializes Category model with provided fields only. """
 
     class Meta:
@@ -14,18 +25,196 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 
-class PostSerializer(TaggitSerializer, serializers.ModelSerializer):
-    """ Handles serializing data for Post model for read only operations. """
+class PostSerializer(TimedSerializerMixin, TaggitSerializer, serializers.ModelSerializer):
+    """
+    Handles serializing data for Post model for read only operations. The fields and expand lists in the context
+    trim the fields to the given ones and show relations that are not expanded by their IDs.
+    """
 
     categories = CategorySerializer(many=True)
     published_by = UserSerializer()
     tags = TagListSerializerField()
+    renditions = serializers.SerializerMethodField()
+
+    expandable_fields = {
+        'categories': lambda: serializers.PrimaryKeyRelatedField(many=True, read_only=True),
+        'published_by': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+    }
+    # Columns that the fields read when they are not a column of their own, plus the ones pagination orders by.
+    field_columns = {'categories': [], 'tags': [], 'renditions': ['renditions', 'image']}
+    ordering_columns = ['id', 'published_at', 'views', 'downloads']
 
     class Meta:
         model = UserPost
-        fields = '__all__'
+        exclude = ['search_document']
         read_only_fields = ['views', 'downloads']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        expand = self.context.get('expand')
+
+        if fields is not None:
+            for name in set(self.fields).difference(fields):
+                self.fields.pop(name)
+        if expand is not None:
+            for name, build_field in self.expandable_fields.items():
+                if name in self.fields and name not in expand:
+                    self.fields[name] = build_field()
+
+    @classmethod
+    def get_selectable_fields(cls):
+        """ Returns the names of every field in their order, the names are only built once. """
+
+        if '_selectable_fields' not in cls.__dict__:
+            cls._selectable_fields = list(cls().fields)
+        return cls._selectable_fields
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, expand=None):
+        """
+        Returns the queryset fetching only what the selected fields show. The publisher is joined and categories
+        and tags are prefetched only when they are shown, relations that are not expanded are fetched by ID only.
+        """
+
+        shown = set(cls.get_selectable_fields() if fields is None else fields)
+        expanded = set(cls.expandable_fields if expand is None else expand)
+
+        if 'published_by' in shown and 'published_by' in expanded:
+            queryset = queryset.select_related('published_by')
+        if 'categories' in shown:
+            categories = Category.objects.all() if 'categories' in expanded else Category.objects.only('id')
+            queryset = queryset.prefetch_related(Prefetch('categories', queryset=categories))
+        if 'tags' in shown:
+            queryset = queryset.prefetch_related('tags')
+        if fields is not None:
+            columns = set(cls.ordering_columns)
+            for name in shown:
+                columns.update(cls.field_columns.get(name, [name]))
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def get_renditions(self, post):
+        """ Returns the URLs of the downscaled renditions of the image of post keyed by their size. """
+
+        request = self.context.get('request')
+        urls = {}
+        for size, rendition in post.renditions.items():
+            url = post.image.storage.url(rendition['name'])
+            urls[size] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+
+class PostRowSerializer:
+    """
+    Builds the same data as PostSerializer for lists of posts from values() rows, without instantiating a model and
+    nested serializers per post. Categories and tags of the listed posts are read in one query each, in the order of
+    the indexes that the prefetches read too. The fields and expand lists in the context are honoured the same way.
+    """
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.request = self.context.get('request')
+        self.fields = PostSerializer(context=self.context).fields
+        self.storage = UserPost._meta.get_field('image').storage
+
+    @property
+    def columns(self):
+        """ Returns the columns that values() reads for the selected fields. """
+
+        columns = set()
+        for name in self.fields:
+            columns.update(PostSerializer.field_columns.get(name, [name]))
+        if isinstance(self.fields.get('published_by'), UserSerializer):
+            columns.add('published_by__username')
+        return ['id', *columns.difference(['id'])]
+
+    def get_rows(self, queryset, extra_columns=()):
+        """
+        Returns the queryset as values() rows of the selected columns and the extra ones, dropping prefetches it may
+        hold. Rows of ranked search results keep their rank, which cursor pages seek past.
+        """
+
+        extra_columns = {*extra_columns, 'rank'} if is_ranked(queryset) else set(extra_columns)
+        return queryset.prefetch_related(None).values(*self.columns, *extra_columns.difference(self.columns))
+
+    def serialize(self, rows):
+        """ Returns the list of post data for the rows. """
+
+        with time_serialization():
+            rows = list(rows)
+            getters = self.get_getters([row['id'] for row in rows])
+            return [{name: getter(row) for name, getter in getters} for row in rows]
+
+    def get_getters(self, post_ids):
+        """ Returns the name and the function building the value from a row of every selected field in order. """
+
+        getters = []
+        for name, field in self.fields.items():
+            if name == 'categories':
+                categories = self.get_categories(post_ids, isinstance(field, serializers.ListSerializer))
+                getters.append((name, lambda row, categories=categories: categories.get(row['id'], [])))
+            elif name == 'tags':
+                tags = self.get_tags(post_ids)
+                getters.append((name, lambda row, tags=tags: tags.get(row['id'], [])))
+            elif name == 'published_by' and isinstance(field, UserSerializer):
+                getters.append((name, self.get_publisher))
+            elif name == 'renditions':
+                getters.append((name, self.get_renditions))
+            elif name == 'image':
+                use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+                getters.append((name, self.get_image) if use_url else (name, lambda row: row['image'] or None))
+            elif type(field) in (serializers.IntegerField, serializers.CharField, serializers.PrimaryKeyRelatedField):
+                getters.append((name, lambda row, name=name: row[name]))
+            else:
+                getters.append((name, lambda row, name=name, field=field: (
+                    None if row[name] is None else field.to_representation(row[name])
+                )))
+        return getters
+
+    def get_categories(self, post_ids, expanded):
+        """ Returns the categories of the posts keyed by post ID, as ID and name when expanded or as IDs. """
+
+        if not post_ids:
+            return {}
+        through = UserPost.categories.through
+        rows = through.objects.filter(userpost_id__in=post_ids).order_by('userpost_id', 'category_id')
+        categories = {}
+        if expanded:
+            for post_id, category_id, name in rows.values_list('userpost_id', 'category_id', 'category__name'):
+                categories.setdefault(post_id, []).append({'id': category_id, 'name': name})
+        else:
+            for post_id, category_id in rows.values_list('userpost_id', 'category_id'):
+                categories.setdefault(post_id, []).append(category_id)
+        return categories
+
+    def get_tags(self, post_ids):
+        """ Returns the tag names of the posts keyed by post ID. """
+
+        if not post_ids:
+            return {}
+        rows = TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(UserPost), object_id__in=post_ids
+        ).order_by('object_id', 'tag_id')
+        tags = {}
+        for post_id, name in rows.values_list('object_id', 'tag__name'):
+            tags.setdefault(post_id, []).append(name)
+        return tags
+
+    @staticmethod
+    def get_publisher(row):
+        return {'id': row['published_by'], 'username': row['published_by__username']}
+
+    def build_url(self, name):
+        url = self.storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def get_image(self, row):
+        return self.build_url(row['image']) if row['image'] else None
+
+    def get_renditions(self, row):
+        return {size: self.build_url(rendition['name']) for size, rendition in row['renditions'].items()}
+
 
 class GeneratePostSerializer(TaggitSerializer, serializers.Serializer):
     """ Handles serializing data for Post model for write only operations. """
@@ -36,42 +225,129 @@ class GeneratePostSerializer(TaggitSerializer, serializers.Serializer):
     description = serializers.CharField()
     image = serializers.ImageField()
 
+    def validate_categories(self, category_ids):
+        """
+        Validates that every category exists and returns them in given order. Categories are resolved in one query
+        unless they have already been resolved and passed in the context.
+        """
+
+        categories = self.context.get('categories')
+        if categories is None:
+            categories = Category.objects.in_bulk(set(category_ids))
+        missing_ids = [category_id for category_id in category_ids if category_id not in categories]
+        if missing_ids:
+            raise serializers.ValidationError(
+                [f'Category with ID {category_id} does not exist.' for category_id in missing_ids]
+            )
+        return list({category_id: categories[category_id] for category_id in category_ids}.values())
+
     def create(self, validated_data):
         """ Creates an instance of Post based on validated data and returns it after saving. """
 
-        category_ids = validated_data.pop('categories', [])
+        categories = validated_data.pop('categories', [])
         published_by_id = validated_data.pop('published_by')
         tags = validated_data.pop('tags', [])
 
-        post = UserPost.objects.create(
+        post = UserPost(
             published_by_id=published_by_id,
             description=validated_data['description'],
             image=validated_data['image']
         )
-        for category_id in category_ids:
-            category = Category.objects.get(pk=category_id)
-            post.categories.add(category)
-        for tag in tags:
-            post.tags.add(tag)
+        post.set_image_metadata()
+        set_search_document(post, [category.name for category in categories], set(tags))
+        with transaction.atomic():
+            post.save()
+            set_post_categories(post, [category.pk for category in categories])
+            set_post_tags(post, tags)
+        schedule_renditions(post.pk)
 
         return post
 
     def update(self, instance, validated_data):
-        """ Updates an instance of Post based on validated data and returns it after saving. """
+        """
+        Updates an instance of Post based on validated data and returns it after saving, only categories and tags
+        that were added or removed are written. The search document is built from the validated data as well.
+        """
 
         instance.description = validated_data.get('description', instance.description)
-        print(instance.description)
-        instance.image = validated_data.get('image', instance.image)
+        previous_renditions = {}
+        if 'image' in validated_data:
+            # Renditions of the previous image are dropped right away rather than served until the new ones exist.
+            previous_renditions, instance.renditions = instance.renditions, {}
+            instance.image = validated_data['image']
+            instance.set_image_metadata()
         tags = validated_data.pop('tags', [])
-        category_ids = validated_data.pop('categories', [])
-        instance.categories.clear()
-        instance.tags.clear()
+        categories = validated_data.pop('categories', [])
+        set_search_document(instance, [category.name for category in categories], set(tags))
 
-        for category_id in category_ids:
-            category = Category.objects.get(pk=category_id)
-            instance.categories.add(category)
-        for tag in tags:
-            instance.tags.add(tag)
-
-        instance.save()
+        with transaction.atomic():
+            set_post_categories(instance, [category.pk for category in categories])
+            set_post_tags(instance, tags)
+            instance.save()
+            delete_renditions_on_commit(previous_renditions, instance.image.storage)
+        if 'image' in validated_data:
+            schedule_renditions(instance.pk)
         return instance
+
+
+class BulkGeneratePostSerializer(serializers.Serializer):
+    """
+    Handles creating many Posts with their categories and tags in a few bulk queries. Items are validated one by one
+    so that invalid items are reported without preventing the valid ones from being created.
+    """
+
+    items = serializers.JSONField()
+    images = serializers.ListField(child=serializers.FileField())
+
+    def validate(self, attrs):
+        """ Validates that items are objects, each with its image at the same position in images. """
+
+        items = attrs['items']
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise serializers.ValidationError({'items': 'Items should be a list of objects.'})
+        if len(items) != len(attrs['images']):
+            raise serializers.ValidationError({'images': 'Exactly one image is required for every item.'})
+        if len(items) > BULK_UPLOAD_MAX_POSTS:
+            raise serializers.ValidationError({
+                'items': f'At most {BULK_UPLOAD_MAX_POSTS} posts can be created at once.'
+            })
+        return attrs
+
+    def create(self, validated_data):
+        """ Creates the valid items and returns the ID or the validation errors of every item in their order. """
+
+        published_by = validated_data['published_by']
+        items = validated_data['items']
+        categories = Category.objects.in_bulk(get_category_ids(items))
+
+        results = []
+        valid_items = []
+        for index, (item, image) in enumerate(zip(items, validated_data['images'])):
+            serializer = GeneratePostSerializer(data={**item, 'image': image}, context={'categories': categories})
+            if serializer.is_valid():
+                valid_items.append((index, serializer.validated_data))
+                results.append({'index': index})
+            else:
+                results.append({'index': index, 'errors': serializer.errors})
+
+        posts = []
+        for index, data in valid_items:
+            post = UserPost(published_by=published_by, description=data['description'], image=data['image'])
+            post.set_image_metadata()
+            post.search_document = build_search_document(
+                data['description'],
+                published_by.username,
+                [category.name for category in data['categories']],
+                data.get('tags', []),
+            )
+            posts.append((index, post, data))
+
+        with transaction.atomic():
+            UserPost.objects.bulk_create([post for _, post, _ in posts], batch_size=BULK_UPLOAD_BATCH_SIZE)
+            bulk_add_categories([(post, [category.pk for category in data['categories']]) for _, post, data in posts])
+            bulk_add_tags([(post, data.get('tags', [])) for _, post, data in posts])
+            for index, post, _ in posts:
+                results[index]['id'] = post.pk
+                schedule_renditions(post.pk)
+
+        return results
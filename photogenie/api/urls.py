@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CategoryViewSet, UserPostViewSet, DownloadImageView
+from .views import CategoryViewSet, UserPostViewSet, DownloadArchiveView, DownloadImageView
 
 router = DefaultRouter()
 router.register('user-posts', UserPostViewSet)
@@ -10,4 +10,5 @@ router.register('categories', CategoryViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('user-posts/<int:pk>/download', DownloadImageView.as_view(), name='download-image'),
+    path('user-posts/download', DownloadArchiveView.as_view(), name='download-archive'),
 ]
@@ -1,8 +1,25 @@
-from django.db.models import Q
+import hashlib
+import json
+from collections import Counter
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from taggit.models import Tag, TaggedItem
+
+from photogenie.catalogue import get_category_catalogue
+from photogenie.facets import adjust_facet_counts, create_facet_counts
+from photogenie.models import UserPost
+from photogenie.responses import invalidate_responses
+from photogenie.search import search_posts
 
 
 def filter_user_posts(queryset, query_parameters):
-    """ Filters the queryset with respect to the specified query parameters, gives priority to search parameter. """
+    """
+    Filters the queryset with respect to the specified query parameters, gives priority to search parameter whose
+    results are ranked by relevance. Category names are resolved to IDs through the cached category catalogue, names
+    it does not know yet are matched in the database.
+    """
 
     search = query_parameters.get('search', None)
     published_by = query_parameters.get('published_by', None)
@@ -10,15 +27,141 @@ def filter_user_posts(queryset, query_parameters):
     ordering = query_parameters.get('ordering', None)
 
     if search:
-        q_published_by = Q(published_by__username=search)
-        q_category_name = Q(categories__name=search)
-        queryset = queryset.filter(q_published_by | q_category_name)
-        return queryset
+        return search_posts(queryset, search)
 
     if published_by:
         queryset = queryset.filter(published_by__username=published_by)
     if category:
-        queryset = queryset.filter(categories__name=category)
+        category_id = get_category_catalogue().ids_by_name.get(category)
+        if category_id is None:
+            queryset = queryset.filter(categories__name=category)
+        else:
+            queryset = queryset.filter(categories=category_id)
     if ordering:
         queryset = queryset.order_by(ordering)
     return queryset
+
+
+def get_or_create_tags(names):
+    """
+    Returns a dictionary of tag name and Tag for the given names, creating the missing tags in one bulk insert. Tags
+    whose slug clashes with an existing tag fall back to Tag.save which picks a unique slug.
+    """
+
+    names = set(names)
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = names.difference(tags)
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name, slug=Tag().slugify(name)) for name in missing], ignore_conflicts=True)
+        created_tags = list(Tag.objects.filter(name__in=missing))
+        create_facet_counts('tags', [tag.pk for tag in created_tags])
+        tags.update((tag.name, tag) for tag in created_tags)
+        for name in missing.difference(tags):
+            tags[name], _ = Tag.objects.get_or_create(name=name)
+    return tags
+
+
+def bulk_add_tags(post_tags):
+    """
+    Links tags to posts in one bulk insert, post_tags is a list of post and tag names pairs whose links do not exist
+    yet. Bulk inserts send no signals, so cached post responses are invalidated and tag counts adjusted here.
+    """
+
+    tags = get_or_create_tags(name for _, names in post_tags for name in names)
+    content_type = ContentType.objects.get_for_model(UserPost)
+    tagged_items = [
+        TaggedItem(content_type=content_type, object_id=post.pk, tag=tags[name])
+        for post, names in post_tags
+        for name in set(names)
+    ]
+    TaggedItem.objects.bulk_create(tagged_items, ignore_conflicts=True)
+    adjust_facet_counts('tags', Counter(tagged_item.tag_id for tagged_item in tagged_items))
+    invalidate_responses()
+
+
+def bulk_add_categories(post_categories):
+    """
+    Links categories to posts in one bulk insert, post_categories is a list of post and category IDs pairs whose
+    links do not exist yet. Bulk inserts send no signals, so cached post responses are invalidated and category
+    counts adjusted here.
+    """
+
+    through = UserPost.categories.through
+    links = [
+        through(userpost_id=post.pk, category_id=category_id)
+        for post, category_ids in post_categories
+        for category_id in set(category_ids)
+    ]
+    through.objects.bulk_create(links, ignore_conflicts=True)
+    adjust_facet_counts('categories', Counter(link.category_id for link in links))
+    invalidate_responses()
+
+
+def set_post_categories(post, category_ids):
+    """
+    Makes the given categories the categories of post, inserting and deleting only the links that changed. Returns
+    whether anything changed.
+    """
+
+    through = UserPost.categories.through
+    category_ids = set(category_ids)
+    current_ids = set(through.objects.filter(userpost_id=post.pk).values_list('category_id', flat=True))
+
+    removed_ids = current_ids - category_ids
+    if removed_ids:
+        through.objects.filter(userpost_id=post.pk, category_id__in=removed_ids).delete()
+        adjust_facet_counts('categories', dict.fromkeys(removed_ids, -1))
+        invalidate_responses()
+    added_ids = category_ids - current_ids
+    if added_ids:
+        bulk_add_categories([(post, added_ids)])
+    return bool(removed_ids or added_ids)
+
+
+def set_post_tags(post, names):
+    """
+    Makes the given tag names the tags of post, inserting and deleting only the links that changed. Returns whether
+    anything changed.
+    """
+
+    content_type = ContentType.objects.get_for_model(UserPost)
+    tagged_items = TaggedItem.objects.filter(content_type=content_type, object_id=post.pk)
+    names = set(names)
+    current_tags = dict(tagged_items.values_list('tag__name', 'tag_id'))
+    current_names = set(current_tags)
+
+    removed_names = current_names - names
+    if removed_names:
+        tagged_items.filter(tag__name__in=removed_names).delete()
+        adjust_facet_counts('tags', {current_tags[name]: -1 for name in removed_names})
+        invalidate_responses()
+    added_names = names - current_names
+    if added_names:
+        bulk_add_tags([(post, added_names)])
+    return bool(removed_names or added_names)
+
+
+def get_category_ids(items):
+    """ Returns the integer category IDs referenced by raw post items, ignoring values that are not IDs. """
+
+    category_ids = set()
+    for item in items:
+        categories = item.get('categories')
+        for category_id in categories if isinstance(categories, list) else []:
+            try:
+                category_ids.add(int(category_id))
+            except (TypeError, ValueError):
+                continue
+    return category_ids
+
+
+def set_content_etag(request, response):
+    """
+    Sets a strong ETag made of the hash of the response data and returns 304 Not Modified instead of the response
+    when the request already holds that content. The ETag also keys the compressed body of the response.
+    """
+
+    content = json.dumps(response.data, sort_keys=True, default=str).encode()
+    response['ETag'] = quote_etag(hashlib.sha256(content).hexdigest())
+    response.precompressed_key = response['ETag']
+    return get_conditional_response(request, etag=response['ETag'], response=response) or response
@@ -2,8 +2,37 @@ from authentication.api.validations import ValidationSerializer
 from rest_framework import serializers
 from re import match
 
+from photogenie.api.serializers import PostSerializer
+from photogenie.constants import FACET_MAX_TAG_LIMIT, FACETS
+from photogenie.renditions import get_rendition_sizes
 
-class QueryValidationSerializer(ValidationSerializer):
+
+class FieldSelectionValidationSerializer(ValidationSerializer):
+    fields = serializers.CharField(required=False)
+    expand = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_fields(self, fields):
+        """ Validates that the comma separated fields are fields of a post and returns them as a list. """
+
+        return self.split_names(fields, PostSerializer.get_selectable_fields())
+
+    def validate_expand(self, expand):
+        """ Validates that the comma separated relations can be expanded and returns them as a list. """
+
+        return self.split_names(expand, PostSerializer.expandable_fields)
+
+    @staticmethod
+    def split_names(value, allowed_names):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown_names = [name for name in names if name not in allowed_names]
+        if unknown_names:
+            raise serializers.ValidationError(
+                f'Unknown field(s) {", ".join(unknown_names)}, should be among {", ".join(allowed_names)}.'
+            )
+        return names
+
+
+class PostFilterValidationSerializer(ValidationSerializer):
     published_by = serializers.CharField(required=False)
     category = serializers.CharField(required=False)
     search = serializers.CharField(required=False)
@@ -26,3 +55,47 @@ class QueryValidationSerializer(ValidationSerializer):
             attrs['category'] = category.lower()
 
         return attrs
+
+
+class QueryValidationSerializer(FieldSelectionValidationSerializer, PostFilterValidationSerializer):
+    pagination = serializers.ChoiceField(choices=['page', 'cursor'], required=False)
+    facets = serializers.CharField(required=False)
+    facet_limit = serializers.IntegerField(required=False, min_value=1, max_value=FACET_MAX_TAG_LIMIT)
+
+    def validate_facets(self, facets):
+        """ Validates that the comma separated facets are among categories and tags and returns them as a list. """
+
+        return self.split_names(facets, FACETS)
+
+
+class DownloadValidationSerializer(ValidationSerializer):
+    size = serializers.IntegerField(required=False)
+
+    def validate_size(self, size):
+        """ Validates that the requested rendition size is one of the configured sizes. """
+
+        sizes = get_rendition_sizes()
+        if size not in sizes:
+            raise serializers.ValidationError(f'Size should be one of {", ".join(map(str, sorted(sizes)))}.')
+        return size
+
+
+class ArchiveValidationSerializer(PostFilterValidationSerializer, DownloadValidationSerializer):
+    ids = serializers.CharField(required=False)
+
+    def validate_ids(self, ids):
+        """ Validates that the comma separated post IDs are integers and returns them as a list. """
+
+        try:
+            return [int(post_id) for post_id in ids.split(',') if post_id.strip()]
+        except ValueError:
+            raise serializers.ValidationError('IDs should be comma separated integers.')
+
+    def validate(self, attrs):
+        """ Validates the filters like post lists do and that either IDs or a filter select the posts. """
+
+        attrs = super().validate(attrs)
+        if not any(attrs.get(name) for name in ('ids', 'search', 'published_by', 'category')):
+            raise serializers.ValidationError({'error': 'Either ids or one of search, published_by and category is '
+                                                        'required.'})
+        return attrs
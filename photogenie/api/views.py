@@ -1,59 +1,241 @@
-from django.http import FileResponse
+from django.conf import settings
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, DestroyModelMixin
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
-from rest_framework.generics import RetrieveAPIView
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.generics import GenericAPIView, RetrieveAPIView, get_object_or_404
 
+from authentication.api.authentication import CachedJWTAuthentication
+from photogenie.archives import get_archive_entries, stream_archive
+from photogenie.catalogue import get_category_catalogue
+from photogenie.constants import ARCHIVE_MAX_POSTS, FACET_TAG_LIMIT, ROW_SERIALIZER_ENABLED
+from photogenie.counters import increment_counter
+from photogenie.downloads import build_download_response, get_download_file, is_counted_download
+from photogenie.facets import get_post_facets
 from photogenie.models import Category, UserPost
+from photogenie.responses import get_response_cache
+from photogenie.routers import ReplicaReadMixin, get_read_database
 
-from photogenie.api.serializers import (CategorySerializer, GeneratePostSerializer,
-                                        PostSerializer)
-from photogenie.api.documentation import get_user_posts_query_parameters
-from photogenie.api.utils import filter_user_posts
-from photogenie.api.validations import QueryValidationSerializer
+from photogenie.api.serializers import (BulkGeneratePostSerializer, CategorySerializer, GeneratePostSerializer,
+                                        PostRowSerializer, PostSerializer)
+from photogenie.api.documentation import (get_archive_query_parameters, get_download_query_parameters,
+                                          get_post_fields_query_parameters, get_user_posts_query_parameters)
+from photogenie.api.pagination import KeysetPagination
+from photogenie.api.utils import filter_user_posts, set_content_etag
+from photogenie.api.validations import (ArchiveValidationSerializer, DownloadValidationSerializer,
+                                        FieldSelectionValidationSerializer, QueryValidationSerializer)
 
 
-class CategoryViewSet(GenericViewSet, ListModelMixin, RetrieveModelMixin):
+class CategoryViewSet(ReplicaReadMixin, GenericViewSet, ListModelMixin, RetrieveModelMixin):
     """ This viewset allows users to view the list of available categories and retrieve individual category details. """
 
     permission_classes = (AllowAny,)
+    replica_actions = ('list', 'retrieve')
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    # Loading the catalogue takes one query, a category it does not hold yet is read with one more.
+    query_budget = 2
 
+    def list(self, request, *args, **kwargs):
+        """
+        Lists the categories from the cached catalogue with an ETag of the content, answering 304 when the client
+        already holds the same page.
+        """
+
+        categories = get_category_catalogue().categories
+        page = self.paginate_queryset(categories)
+        response = self.get_paginated_response(page) if page is not None else Response(categories)
+        return set_content_etag(request, response)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieves a category with given ID from the cached catalogue, or from the database when the catalogue does
+        not hold it yet, answering 304 when it did not change.
+        """
+
+        try:
+            category = get_category_catalogue().by_id[int(kwargs[self.lookup_field])]
+        except ValueError:
+            raise NotFound
+        except KeyError:
+            category = self.get_serializer(self.get_object()).data
+        return set_content_etag(request, Response(category))
 
-class UserPostViewSet(GenericViewSet, ListModelMixin, DestroyModelMixin):
+
+class UserPostViewSet(ReplicaReadMixin, GenericViewSet, ListModelMixin, DestroyModelMixin):
     """ This viewset handles CRUD and download operations for UserPost model. """
 
-    queryset = UserPost.objects.select_related('published_by').prefetch_related('categories', 'tags')
-    authentication_classes = (JWTAuthentication,)
+    queryset = UserPost.objects.defer('search_document')
+    authentication_classes = (CachedJWTAuthentication,)
+    replica_actions = ('list', 'retrieve')
+    # Budgets are the query counts that QueryBudgetTestCase measures for the most expensive request of each action,
+    # plus the user lookup of JWT authentication when the user is not cached and one more query, which is the buffered
+    # counters flush of retrieve and the category catalogue load of list.
+    query_budgets = {
+        'list': 8,
+        'retrieve': 5,
+        'create': 17,
+        'bulk_create': 14,
+        'update': 21,
+        'destroy': 8,
+    }
 
     @swagger_auto_schema(
         manual_parameters=get_user_posts_query_parameters(),
         responses={200: PostSerializer(many=True)}
     )
     def list(self, request, *args, **kwargs):
-        """ Generates a paginated list of all Posts in JSON format. """
+        """
+        Generates a paginated list of all Posts in JSON format, pages are numbered unless cursor pagination is
+        requested. Post counts per category and of the most used tags among the filtered posts are added when facets
+        are requested. Lists are cached per validated query parameters until a post, category or tag changes.
+        """
 
         serializer = QueryValidationSerializer(data=self.request.query_params)
         serializer.is_valid(raise_exception=True)
-        self.queryset = filter_user_posts(self.queryset, serializer.validated_data)
-        return super().list(request, *args, **kwargs)
+        query_parameters = serializer.validated_data
+        if query_parameters.get('pagination') == 'cursor':
+            self.pagination_class = KeysetPagination
+        self.queryset = filter_user_posts(self.queryset, query_parameters)
+
+        def build_response():
+            response = self.build_list_response()
+            facets = self.get_facets(query_parameters)
+            if facets is not None and response.status_code == status.HTTP_200_OK:
+                if isinstance(response.data, list):
+                    response.data = {'results': response.data}
+                response.data['facets'] = facets
+            return response
+
+        params = {**query_parameters, **self.get_pagination_params()}
+        return self.get_cached_response('list', params, build_response, precompressed=True)
+
+    def build_list_response(self):
+        """ Returns the response of a page of posts built by PostRowSerializer, or PostSerializer when it is off. """
+
+        if not getattr(settings, 'POST_ROW_SERIALIZER_ENABLED', ROW_SERIALIZER_ENABLED):
+            return super().list(self.request)
+
+        row_serializer = PostRowSerializer(context=self.get_serializer_context())
+        rows = row_serializer.get_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.serialize(page))
+        return Response(row_serializer.serialize(rows))
 
+    def get_facets(self, query_parameters):
+        """
+        Returns the facets requested by the validated query parameters, or None when there are none. Facets of the
+        unfiltered list are read from the maintained post counts, the others are counted over the filtered posts.
+        """
+
+        facets = query_parameters.get('facets')
+        if not facets:
+            return None
+        filtered = any(query_parameters.get(name) for name in ('search', 'published_by', 'category'))
+        tag_limit = query_parameters.get('facet_limit', getattr(settings, 'POST_FACET_TAG_LIMIT', FACET_TAG_LIMIT))
+        return get_post_facets(facets, self.queryset if filtered else None, tag_limit)
+
+    @swagger_auto_schema(manual_parameters=get_post_fields_query_parameters(), responses={200: PostSerializer()})
     def retrieve(self, request, *args, **kwargs):
         """
         Retrieves a Post in JSON format with given ID and increases the view count of the post if that post is not
-        published by the logged-in user.
+        published by the logged-in user. Posts are cached until they, their categories or tags change.
         """
 
-        instance = self.get_object()
-        if instance.published_by != request.user:
-            instance.views += 1
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def build_response():
+            if getattr(settings, 'POST_ROW_SERIALIZER_ENABLED', ROW_SERIALIZER_ENABLED):
+                row_serializer = PostRowSerializer(context=self.get_serializer_context())
+                rows = row_serializer.get_rows(self.filter_queryset(self.get_queryset()), ['published_by'])
+                row = get_object_or_404(rows, **{self.lookup_field: self.kwargs[self.lookup_field]})
+                data = {'id': row['id'], 'published_by_id': row['published_by'],
+                        'post': row_serializer.serialize([row])[0]}
+            else:
+                instance = self.get_object()
+                data = {'id': instance.pk, 'published_by_id': instance.published_by_id,
+                        'post': self.get_serializer(instance).data}
+            return Response(data, status=status.HTTP_200_OK)
+
+        params = {'pk': kwargs[self.lookup_field], **self.get_field_selection()}
+        response = self.get_cached_response('retrieve', params, build_response)
+        post = response.data['post']
+        if response.data['published_by_id'] != request.user.pk:
+            increment_counter(response.data['id'], 'views')
+            if 'views' in post:
+                post = {**post, 'views': post['views'] + 1}
+        response.data = post
+        return response
+
+    def get_cached_response(self, name, params, build_response, precompressed=False):
+        """
+        Returns a response with the cached data for the given parameters, or builds the response and caches its
+        data when it succeeds. The host is part of the key since responses hold absolute URLs. Precompressed
+        responses keep their compressed bodies in the cache as well, which suits responses sent as they are cached.
+        Responses read from a replica are not cached, since the replica may not have caught up with the generation of
+        the key yet and users reading from the primary after a write of theirs would be sent them.
+        """
+
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return build_response()
+
+        key = response_cache.build_key(name, {**params, 'host': self.request.build_absolute_uri('/')})
+        data = response_cache.get(key)
+        if data is not None:
+            response = Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+        else:
+            response = build_response()
+            response['X-Cache'] = 'MISS'
+            if get_read_database() is not None:
+                return response
+            if response.status_code == status.HTTP_200_OK:
+                response_cache.set(key, response.data)
+        if precompressed and response.status_code == status.HTTP_200_OK:
+            response.precompressed_key = key
+        return response
+
+    def get_field_selection(self):
+        """
+        Returns the validated fields and expand query parameters of list and retrieve, None standing for every
+        field and every relation expanded.
+        """
+
+        if self.action not in ('list', 'retrieve'):
+            return {'fields': None, 'expand': None}
+        if not hasattr(self, '_field_selection'):
+            serializer = FieldSelectionValidationSerializer(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+            self._field_selection = {name: serializer.validated_data.get(name) for name in ('fields', 'expand')}
+        return self._field_selection
+
+    def get_queryset(self):
+        """
+        Returns the posts fetching only the columns and relations that the selected fields show, updates and deletes
+        fetch the publisher only.
+        """
+
+        if self.action in ('update', 'destroy'):
+            return super().get_queryset().select_related('published_by')
+        return PostSerializer.optimize_queryset(super().get_queryset(), **self.get_field_selection())
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), **self.get_field_selection()}
+
+    def get_pagination_params(self):
+        """ Returns the query parameters that the paginator reads, which select the page of a list. """
+
+        params = {}
+        for attribute in ('page_query_param', 'page_size_query_param', 'cursor_query_param'):
+            name = getattr(self.paginator, attribute, None)
+            if name:
+                params[name] = self.request.query_params.get(name)
+        return params
 
     def create(self, request, *args, **kwargs):
         """
@@ -67,6 +249,29 @@ class UserPostViewSet(GenericViewSet, ListModelMixin, DestroyModelMixin):
         serializer.save()
         return Response(status=status.HTTP_201_CREATED)
 
+    @swagger_auto_schema(request_body=BulkGeneratePostSerializer)
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        Creates many Posts from a multipart request with an items JSON list holding description, categories and tags
+        of each post and an images file for each item in the same order. Returns the ID or the validation errors of
+        every item, with 207 status when only some of them were created.
+        [AUTHENTICATION REQUIRED]
+        """
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save(published_by=request.user)
+
+        created = sum('id' in result for result in results)
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=response_status)
+
     def update(self, request, *args, **kwargs):
         """
         Updates a Post with the given JSON formatted data.
@@ -98,6 +303,8 @@ class UserPostViewSet(GenericViewSet, ListModelMixin, DestroyModelMixin):
 
         if self.action == 'create' or self.action == 'update':
             serializer_class = GeneratePostSerializer
+        elif self.action == 'bulk_create':
+            serializer_class = BulkGeneratePostSerializer
         else:
             serializer_class = PostSerializer
 
@@ -106,7 +313,7 @@ class UserPostViewSet(GenericViewSet, ListModelMixin, DestroyModelMixin):
     def get_permissions(self):
         """  Instantiates and returns appropriate permission class(es) of based on HTTP method requested. """
 
-        if self.action == 'create' or self.action == 'destroy' or self.action == 'update':
+        if self.action in ('create', 'bulk_create', 'destroy', 'update'):
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [AllowAny]
@@ -115,18 +322,76 @@ class UserPostViewSet(GenericViewSet, ListModelMixin, DestroyModelMixin):
 
 
 class DownloadImageView(RetrieveAPIView):
-    """ Retrieves the image to be downloaded of the requested post with ID and increases download count. """
+    """
+    Retrieves the image to be downloaded of the requested post with ID and increases download count, a downscaled
+    rendition is served instead when its size is requested and it has been generated.
+    """
 
     queryset = UserPost.objects.select_related('published_by').prefetch_related('categories', 'tags')
     permission_classes = (IsAuthenticated,)
     serializer_class = PostSerializer
+    # Images uploaded before content hashes were stored save their hash once, downloads may flush the counters.
+    query_budget = 5
+
+    @swagger_auto_schema(manual_parameters=get_download_query_parameters())
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     def retrieve(self, request, *args, **kwargs):
+        """
+        Serves the image with its content hash as ETag, answering conditional requests with 304 and Range requests
+        with 206. Only full downloads and ranges starting at the first byte increase the download count.
+        """
+
+        serializer = DownloadValidationSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
         instance = self.get_object()
-        img = instance.image
-        instance.downloads += 1
-        instance.save()
-        response = FileResponse(open(img.path, 'rb'), content_type='image/*')
-        response['dimensions'] = instance.dimensions
-        response['Content-Disposition'] = f'attachment; filename="{img.name}"'
+        download_file = get_download_file(instance, serializer.validated_data.get('size'))
+        response = build_download_response(request, download_file, content_type='image/*')
+        if is_counted_download(request, response, download_file):
+            increment_counter(instance.pk, 'downloads')
+        response['dimensions'] = download_file.dimensions
+        response['Content-Disposition'] = f'attachment; filename="{instance.image.name}"'
+        return response
+
+
+class DownloadArchiveView(GenericAPIView):
+    """
+    Streams a ZIP archive of the images of the posts with the requested IDs or matching the same filters as post
+    lists, downscaled renditions are archived instead when their size is requested and they have been generated.
+    """
+
+    queryset = UserPost.objects.all()
+    permission_classes = (IsAuthenticated,)
+    # The posts are read and their download counts increased with one query each.
+    query_budget = 3
+
+    @swagger_auto_schema(manual_parameters=get_archive_query_parameters(), responses={200: 'ZIP archive of images'})
+    def get(self, request, *args, **kwargs):
+        """
+        Streams the archive while it is written, with the images named after their post ID. Returns 400 when more
+        than POST_ARCHIVE_MAX_POSTS posts match and increases the download count of every archived post at once.
+        """
+
+        serializer = ArchiveValidationSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query_parameters = serializer.validated_data
+
+        queryset = self.get_queryset()
+        if query_parameters.get('ids'):
+            queryset = queryset.filter(pk__in=query_parameters['ids'])
+        queryset = filter_user_posts(queryset, query_parameters)
+        max_posts = getattr(settings, 'POST_ARCHIVE_MAX_POSTS', ARCHIVE_MAX_POSTS)
+        posts = list(queryset.values('id', 'image', 'renditions')[:max_posts + 1])
+        if len(posts) > max_posts:
+            raise ValidationError({'error': f'More than {max_posts} posts match, narrow the selection down.'})
+        if not posts:
+            raise NotFound
+
+        UserPost.objects.filter(pk__in=[post['id'] for post in posts]).update(downloads=F('downloads') + 1)
+        storage = UserPost._meta.get_field('image').storage
+        entries = get_archive_entries(posts, query_parameters.get('size'))
+        response = StreamingHttpResponse(stream_archive(storage, entries), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="images.zip"'
         return response
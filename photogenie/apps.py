@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PhotoManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'photogenie'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from photogenie import checks, signals
+
+        post_migrate.connect(signals.restore_sqlite_search_index, sender=self)
@@ -0,0 +1,89 @@
+"""
+ZIP archives of many post images streamed while they are written.
+
+The archive is written by zipfile into a write-only buffer that the response drains after every chunk, so neither
+temporary files nor the whole archive are ever held, memory stays the size of one chunk of one image. zipfile falls
+back to data descriptors on such unseekable streams, which every common unzip tool reads. Images that are compressed
+already, like JPEG and PNG, are stored as they are since deflating them again costs CPU for hardly any bytes, other
+formats are deflated.
+"""
+
+import logging
+import posixpath
+import zipfile
+
+from django.conf import settings
+from django.utils import timezone
+
+from photogenie.constants import ARCHIVE_CHUNK_SIZE, ARCHIVE_STORED_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+
+class ZipStream:
+    """ Write-only file object collecting the bytes zipfile writes until they are drained. """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def get_archive_entries(posts, size=None):
+    """
+    Returns the name in the archive and stored file name of the image of every post, posts being dictionaries with
+    id, image and renditions. The rendition of given size is used for the posts that have it.
+    """
+
+    entries = []
+    for post in posts:
+        rendition = post['renditions'].get(str(size)) if size else None
+        name = rendition['name'] if rendition else post['image']
+        entries.append((f'{post["id"]}-{posixpath.basename(name)}', name))
+    return entries
+
+
+def get_compress_type(name):
+    """ Returns ZIP_STORED for images that are compressed already and ZIP_DEFLATED for the others. """
+
+    stored_extensions = getattr(settings, 'POST_ARCHIVE_STORED_EXTENSIONS', ARCHIVE_STORED_EXTENSIONS)
+    if posixpath.splitext(name)[1].lower() in stored_extensions:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def stream_archive(storage, entries, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Yields the bytes of a ZIP archive of the stored files of the entries, pairs of name in the archive and stored
+    file name. Files that can not be read are left out of the archive and logged.
+    """
+
+    stream = ZipStream()
+    date_time = timezone.localtime().timetuple()[:6]
+    with zipfile.ZipFile(stream, 'w') as archive:
+        for archive_name, name in entries:
+            try:
+                file = storage.open(name, 'rb')
+            except OSError:
+                logger.warning('Image %s is missing from the archive, it could not be opened.', name)
+                continue
+
+            entry = zipfile.ZipInfo(archive_name, date_time)
+            entry.compress_type = get_compress_type(name)
+            entry.file_size = file.size
+            with file, archive.open(entry, 'w') as entry_file:
+                while chunk := file.read(chunk_size):
+                    entry_file.write(chunk)
+                    yield stream.drain()
+            yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,451 @@
+"""
+Benchmark harness for the hot paths of the photogenie API.
+
+A dataset of users, categories, tags and posts is seeded with bulk inserts, then every scenario is driven through
+the Django test client or against a running server over HTTP. Each scenario reports latency percentiles, throughput
+and, with the test client, the number of SQL queries per request. Results are plain dictionaries that are saved as
+JSON and can be compared against the results of a previous run.
+
+Building the data of list pages of several sizes with PostSerializer and with PostRowSerializer, rendering it to
+JSON and compressing it are also timed in process, apart from the rest of the request, along with the CPU time and
+the bytes each step produces.
+"""
+
+import json
+import math
+import platform
+import uuid
+import random
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from io import BytesIO
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, RequestFactory, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request as DRFRequest
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from taggit.models import Tag, TaggedItem
+
+from authentication.models import User
+from photogenie.catalogue import invalidate_category_catalogue
+from photogenie.compression import COMPRESSORS, get_available_encodings
+from photogenie.facets import adjust_facet_counts
+from photogenie.api.renderers import FastJSONRenderer
+from photogenie.api.serializers import PostRowSerializer, PostSerializer
+from photogenie.constants import (BENCHMARK_BATCH_SIZE, BENCHMARK_IMAGE_NAME, BENCHMARK_LIST_PAGES,
+                                  BENCHMARK_PAGE_SIZES)
+from photogenie.models import Category, UserPost
+from photogenie.responses import invalidate_responses
+from photogenie.search import build_search_document
+
+WORDS = (
+    'sunset', 'mountain', 'river', 'portrait', 'city', 'night', 'forest', 'ocean', 'street', 'winter', 'summer',
+    'bridge', 'desert', 'garden', 'festival', 'harbour', 'storm', 'meadow', 'skyline', 'market',
+)
+METRICS = ('p50', 'p95', 'p99', 'throughput', 'queries', 'cpu', 'bytes')
+
+
+class Dataset:
+    """ Describes the seeded rows that scenarios pick their parameters from. """
+
+    def __init__(self, author, usernames, category_ids, tag_names, post_ids, author_post_ids):
+        self.author = author
+        self.usernames = usernames
+        self.category_ids = category_ids
+        self.tag_names = tag_names
+        self.post_ids = post_ids
+        self.author_post_ids = author_post_ids
+
+
+def create_image_content(size=(32, 32), image_format='PNG'):
+    content = BytesIO()
+    Image.new('RGB', size, (90, 140, 200)).save(content, image_format)
+    return content.getvalue()
+
+
+def seed_dataset(posts, categories, tags, users, batch_size=BENCHMARK_BATCH_SIZE, seed=0, log=None):
+    """
+    Inserts the given number of benchmark users, categories, tags and posts in batches and returns the Dataset. Every
+    post shares one stored image and gets one to three categories and up to five tags. Names carry a token of the run
+    so that datasets of several runs can live in the same database.
+    """
+
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8]
+    log = log or (lambda message: None)
+
+    password = make_password('benchmark')
+    user_objects = User.objects.bulk_create(
+        [User(username=f'bench_{run}_user_{number}', password=password) for number in range(max(users, 1))],
+        batch_size=batch_size,
+    )
+    category_objects = Category.objects.bulk_create(
+        [Category(name=f'bench {run} category {number}') for number in range(max(categories, 1))],
+        batch_size=batch_size,
+    )
+    tag_objects = Tag.objects.bulk_create(
+        [Tag(name=f'bench{run}tag{number}', slug=f'bench{run}tag{number}') for number in range(tags)],
+        batch_size=batch_size,
+    )
+    if not connection.features.can_return_rows_from_bulk_insert:
+        user_objects = list(User.objects.filter(username__startswith=f'bench_{run}_user_').order_by('id'))
+        category_objects = list(Category.objects.filter(name__startswith=f'bench {run} category ').order_by('id'))
+        tag_objects = list(Tag.objects.filter(name__startswith=f'bench{run}tag').order_by('id'))
+    log(f'Seeded {len(user_objects)} users, {len(category_objects)} categories and {len(tag_objects)} tags.')
+
+    image = UserPost(image=default_storage.save(BENCHMARK_IMAGE_NAME, ContentFile(create_image_content())))
+    image.set_image_metadata()
+    content_type = ContentType.objects.get_for_model(UserPost)
+    through = UserPost.categories.through
+
+    post_ids = []
+    for start in range(0, posts, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, posts)):
+            author = user_objects[index % len(user_objects)]
+            post_categories = rng.sample(category_objects, min(rng.randint(1, 3), len(category_objects)))
+            post_tags = rng.sample(tag_objects, min(rng.randint(0, 5), len(tag_objects)))
+            description = ' '.join(rng.choices(WORDS, k=6))
+            post = UserPost(
+                published_by=author,
+                description=description,
+                image=image.image.name,
+                views=rng.randint(0, 10000),
+                downloads=rng.randint(0, 1000),
+                image_width=image.image_width,
+                image_height=image.image_height,
+                image_size=image.image_size,
+                image_format=image.image_format,
+                image_hash=image.image_hash,
+                search_document=build_search_document(
+                    description, author.username, [category.name for category in post_categories],
+                    [tag.name for tag in post_tags],
+                ),
+            )
+            batch.append((post, post_categories, post_tags))
+
+        UserPost.objects.bulk_create([post for post, _, _ in batch])
+        through.objects.bulk_create([
+            through(userpost_id=post.pk, category_id=category.pk)
+            for post, post_categories, _ in batch for category in post_categories
+        ])
+        TaggedItem.objects.bulk_create([
+            TaggedItem(content_type=content_type, object_id=post.pk, tag=tag)
+            for post, _, post_tags in batch for tag in post_tags
+        ])
+        adjust_facet_counts('categories', Counter(
+            category.pk for _, post_categories, _ in batch for category in post_categories
+        ))
+        adjust_facet_counts('tags', Counter(tag.pk for _, _, post_tags in batch for tag in post_tags))
+        post_ids.extend(post.pk for post, _, _ in batch)
+        log(f'Seeded {len(post_ids)} of {posts} posts.')
+
+    invalidate_category_catalogue()
+    invalidate_responses()
+
+    author = user_objects[0]
+    return Dataset(
+        author=author,
+        usernames=[user.username for user in user_objects],
+        category_ids={category.name: category.pk for category in category_objects},
+        tag_names=[tag.name for tag in tag_objects],
+        post_ids=post_ids,
+        author_post_ids=list(UserPost.objects.filter(published_by=author).values_list('id', flat=True)[:100]),
+    )
+
+
+class Scenario:
+    """ Names an endpoint call and builds the method, path, query parameters and body of each request. """
+
+    def __init__(self, name, method, build, authenticated=False):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.authenticated = authenticated
+
+
+def get_scenarios(dataset, rng):
+    """ Returns the benchmark scenarios covering list filters and orderings, retrieve, writes and downloads. """
+
+    list_url = reverse('userpost-list')
+    pages = min(math.ceil(len(dataset.post_ids) / api_settings.PAGE_SIZE), BENCHMARK_LIST_PAGES)
+
+    def post_list(**params):
+        return lambda: (list_url, {key: value() for key, value in params.items()}, None)
+
+    def post_data():
+        return {
+            'description': ' '.join(rng.choices(WORDS, k=6)),
+            'categories[0]': rng.choice(list(dataset.category_ids.values())),
+            'tags': json.dumps(rng.sample(dataset.tag_names, min(2, len(dataset.tag_names)))),
+            'image': ContentFile(create_image_content(), name='benchmark.png'),
+        }
+
+    def detail(name, post_ids, data=None):
+        return lambda: (reverse(name, kwargs={'pk': rng.choice(post_ids)}), None, data and data())
+
+    return [
+        Scenario('posts-list', 'get', post_list(page=lambda: rng.randint(1, pages))),
+        Scenario('posts-list-published_by', 'get', post_list(published_by=lambda: rng.choice(dataset.usernames))),
+        Scenario('posts-list-category', 'get', post_list(category=lambda: rng.choice(list(dataset.category_ids)))),
+        Scenario('posts-list-search', 'get', post_list(search=lambda: rng.choice(WORDS))),
+        Scenario('posts-list-ordering-views', 'get', post_list(ordering=lambda: 'views')),
+        Scenario('posts-list-ordering-downloads', 'get', post_list(ordering=lambda: 'downloads')),
+        Scenario('posts-list-cursor', 'get', post_list(pagination=lambda: 'cursor')),
+        Scenario('posts-retrieve', 'get', detail('userpost-detail', dataset.post_ids)),
+        Scenario('posts-create', 'post', lambda: (list_url, None, post_data()), authenticated=True),
+        Scenario('posts-update', 'put', detail('userpost-detail', dataset.author_post_ids, post_data),
+                 authenticated=True),
+        Scenario('posts-download', 'get', detail('download-image', dataset.post_ids), authenticated=True),
+        Scenario('categories-list', 'get', lambda: (reverse('category-list'), None, None)),
+    ]
+
+
+class TestClientDriver:
+    """
+    Sends requests through the Django test client in this process, counting the SQL queries and the CPU time of each
+    one.
+    """
+
+    counts_queries = True
+    measures_cpu = True
+
+    def __init__(self, token, accept_encoding=None):
+        self.client = APIClient()
+        self.token = token
+        self.accept_encoding = accept_encoding
+
+    def request(self, method, path, params, data, authenticated):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'} if authenticated else {}
+        if self.accept_encoding:
+            headers['HTTP_ACCEPT_ENCODING'] = self.accept_encoding
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            if data:
+                response = getattr(self.client, method)(path, data, format='multipart', **headers)
+            else:
+                response = getattr(self.client, method)(path, **headers)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(context.captured_queries), len(content)
+
+
+class HttpDriver:
+    """
+    Sends requests to a running server, which keeps its query counts to itself. Sizes are the bytes received, which
+    are compressed when an Accept-Encoding is sent.
+    """
+
+    counts_queries = False
+    measures_cpu = False
+
+    def __init__(self, base_url, token, accept_encoding=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.accept_encoding = accept_encoding
+
+    def request(self, method, path, params, data, authenticated):
+        headers = {'Authorization': f'Bearer {self.token}'} if authenticated else {}
+        if self.accept_encoding:
+            headers['Accept-Encoding'] = self.accept_encoding
+        body = None
+        if data:
+            body = encode_multipart(BOUNDARY, data)
+            headers['Content-Type'] = MULTIPART_CONTENT
+        url = f'{self.base_url}{path}' + (f'?{urlencode(params)}' if params else '')
+
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, data=body, headers=headers, method=method.upper())) as response:
+                content = response.read()
+                status_code = response.status
+        except HTTPError as error:
+            content = error.read()
+            status_code = error.code
+        return status_code, time.perf_counter() - started, None, len(content)
+
+
+def summarize(latencies, elapsed, queries, status_codes, sizes=None, cpu=None):
+    """
+    Returns latency percentiles in milliseconds, throughput in requests per second, query counts and, when given,
+    the mean size of responses in bytes and the CPU time per request in milliseconds.
+    """
+
+    latencies = [latency * 1000 for latency in latencies]
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+
+    return {
+        'requests': len(latencies),
+        'p50': round(p50, 3),
+        'p95': round(p95, 3),
+        'p99': round(p99, 3),
+        'mean': round(statistics.fmean(latencies), 3),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'queries': round(statistics.fmean(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+        'status_codes': {str(code): status_codes.count(code) for code in sorted(set(status_codes))},
+        'bytes': round(statistics.fmean(sizes)) if sizes else None,
+        'cpu': round(cpu * 1000 / len(latencies), 3) if cpu is not None else None,
+    }
+
+
+def run_scenario(driver, scenario, iterations, warmup):
+    """ Sends warmup requests that are not measured, then the measured iterations, and returns their summary. """
+
+    for _ in range(warmup):
+        driver.request(scenario.method, *scenario.build(), scenario.authenticated)
+
+    latencies, queries, status_codes, sizes = [], [], [], []
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(iterations):
+        status_code, elapsed, query_count, size = driver.request(
+            scenario.method, *scenario.build(), scenario.authenticated
+        )
+        latencies.append(elapsed)
+        status_codes.append(status_code)
+        sizes.append(size)
+        if query_count is not None:
+            queries.append(query_count)
+    cpu = time.process_time() - cpu_started if driver.measures_cpu else None
+    return summarize(latencies, time.perf_counter() - started, queries, status_codes, sizes, cpu)
+
+
+def run_benchmarks(driver, dataset, iterations, warmup, scenario_names=None, seed=0, log=None):
+    """ Runs the selected scenarios, all of them by default, and returns their results by scenario name. """
+
+    log = log or (lambda message: None)
+    results = {}
+    for scenario in get_scenarios(dataset, random.Random(seed)):
+        if scenario_names and scenario.name not in scenario_names:
+            continue
+        results[scenario.name] = run_scenario(driver, scenario, iterations, warmup)
+        log(f'{scenario.name}: p50 {results[scenario.name]["p50"]} ms, p95 {results[scenario.name]["p95"]} ms')
+    return results
+
+
+def measure(call, iterations, warmup):
+    """
+    Calls call warmup times without measuring, then times the measured iterations in this process and returns their
+    summary with the size of what the last call returned.
+    """
+
+    for _ in range(warmup):
+        call()
+
+    latencies, queries = [], []
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            call_started = time.perf_counter()
+            result = call()
+            latencies.append(time.perf_counter() - call_started)
+        queries.append(len(captured.captured_queries))
+    cpu = time.process_time() - cpu_started
+    size = len(result) if isinstance(result, bytes) else None
+    return summarize(latencies, time.perf_counter() - started, queries, [200] * iterations, size and [size], cpu)
+
+
+def run_serialization_benchmarks(iterations, warmup, page_sizes=BENCHMARK_PAGE_SIZES, names=None, log=None):
+    """
+    Times building the data of post list pages of every size with PostSerializer and with PostRowSerializer, their
+    queries included, then rendering that data to JSON with JSONRenderer and FastJSONRenderer and compressing it
+    with every available encoding. Returns the results keyed by step and page size like scenarios, rendering and
+    compression results hold the size of their output in bytes.
+    """
+
+    log = log or (lambda message: None)
+    context = {'request': DRFRequest(RequestFactory().get(reverse('userpost-list')))}
+    queryset = PostSerializer.optimize_queryset(UserPost.objects.defer('search_document').order_by('id'))
+
+    def serialize(size):
+        return PostSerializer(queryset[:size], many=True, context=context).data
+
+    def serialize_rows(size):
+        row_serializer = PostRowSerializer(context=context)
+        return row_serializer.serialize(row_serializer.get_rows(queryset)[:size])
+
+    results = {}
+    for size in page_sizes:
+        data = serialize_rows(size)
+        content = JSONRenderer().render(data)
+        steps = [
+            (f'serialize-posts-{size}', lambda: serialize(size)),
+            (f'serialize-rows-{size}', lambda: serialize_rows(size)),
+            (f'render-json-{size}', lambda: JSONRenderer().render(data)),
+            (f'render-orjson-{size}', lambda: FastJSONRenderer().render(data)),
+        ]
+        steps += [(f'compress-{encoding}-{size}', lambda compress=COMPRESSORS[encoding]: compress(content))
+                  for encoding in get_available_encodings()]
+        for name, call in steps:
+            if names and name not in names:
+                continue
+            results[name] = measure(call, iterations, warmup)
+            log(f'{name}: p50 {results[name]["p50"]} ms, p95 {results[name]["p95"]} ms')
+    return results
+
+
+def get_token(user):
+    return str(RefreshToken.for_user(user).access_token)
+
+
+def build_report(results, dataset_options, iterations, warmup, mode):
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'mode': mode,
+            'database': connection.vendor,
+            'dataset': dataset_options,
+            'iterations': iterations,
+            'warmup': warmup,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'results': results,
+    }
+
+
+def compare_reports(report, baseline, threshold):
+    """
+    Returns the relative change of every metric between the baseline and the report per scenario, along with the
+    list of regressions beyond the threshold percentage. Higher latencies and query counts and a lower throughput are
+    regressions.
+    """
+
+    comparison = {}
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        comparison[name] = {}
+        for metric in METRICS:
+            if result.get(metric) is None or not previous.get(metric):
+                continue
+            change = (result[metric] - previous[metric]) / previous[metric] * 100
+            comparison[name][metric] = round(change, 2)
+            worse = -change if metric == 'throughput' else change
+            if worse > threshold:
+                regressions.append(f'{name} {metric} {previous[metric]} -> {result[metric]} ({change:+.1f}%)')
+    return comparison, regressions
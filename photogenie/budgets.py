@@ -0,0 +1,121 @@
+"""
+SQL query budgets of API views.
+
+Views declare the most queries a request may run, either per action through a ``query_budgets`` dictionary or for
+every request through ``query_budget``. Budgets are fixed numbers on purpose: a request whose queries grow with the
+number of posts, categories or tags shown goes over budget as soon as the data grows, which catches N+1 queries
+introduced by new serializer fields or a lost prefetch.
+
+QueryBudgetMiddleware counts the queries of every request and, depending on POST_QUERY_BUDGET_MODE, logs a warning
+or raises QueryBudgetExceeded when a view goes over its budget.
+"""
+
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from photogenie.constants import QUERY_BUDGET_MODE, QUERY_BUDGET_MODES
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """ Raised in strict mode when a request runs more queries than the budget of its view. """
+
+
+class QueryCounter:
+    """ Counts the queries executed on the connections it wraps and the seconds spent running them. """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+
+
+@contextmanager
+def count_queries():
+    """ Yields a QueryCounter of the queries run on every database connection within the block. """
+
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+def resolve_view(view_func, method):
+    """
+    Returns the view class of a resolved view function and the action that handles the method for viewsets, or None
+    for the class of functions that are not REST framework views.
+    """
+
+    view_class = getattr(view_func, 'cls', None)
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower()) if view_class else None
+    return view_class, action
+
+
+def get_view_name(view_class, action=None):
+    return f'{view_class.__name__}.{action}' if action else view_class.__name__
+
+
+def get_query_budget(view_class, action=None):
+    """ Returns the budget that view_class declares for the action or for every request, None if there is none. """
+
+    budgets = getattr(view_class, 'query_budgets', None) or {}
+    if action in budgets:
+        return budgets[action]
+    return getattr(view_class, 'query_budget', None)
+
+
+def get_query_budget_mode():
+    mode = getattr(settings, 'POST_QUERY_BUDGET_MODE', QUERY_BUDGET_MODE)
+    if mode not in QUERY_BUDGET_MODES:
+        raise ValueError(f'POST_QUERY_BUDGET_MODE should be one of {", ".join(QUERY_BUDGET_MODES)}.')
+    return mode
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the SQL queries of each request and checks them against the budget of the view that handled it, logging
+    a warning in 'log' mode or raising QueryBudgetExceeded in 'raise' mode. Nothing is counted in 'off' mode.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = get_query_budget_mode()
+        if mode == 'off':
+            return self.get_response(request)
+
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        name, budget = getattr(request, 'query_budget', (None, None))
+        if budget is not None and counter.count > budget:
+            message = f'{name} ran {counter.count} queries for {request.method} {request.path}, its budget is {budget}.'
+            if mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """ Remembers the budget of the resolved view, viewsets map the request method to their action. """
+
+        view_class, action = resolve_view(view_func, request.method)
+        if view_class is None:
+            return None
+        budget = get_query_budget(view_class, action)
+        if budget is not None:
+            request.query_budget = (get_view_name(view_class, action), budget)
+        return None
@@ -0,0 +1,93 @@
+"""
+In-process cache of the serialized category catalogue.
+
+Categories are read far more often than they change, so every process keeps the serialized catalogue in memory
+along with lookups by ID and name and a content hash used as ETag. Saving or deleting a category bumps a version,
+each process compares its copy against that version and reloads it when it is outdated. The version is kept in the
+process unless POST_CATALOGUE_CACHE_ALIAS names a shared cache, which keeps every worker in step.
+
+A copy is reloaded once it is older than POST_CATALOGUE_TIMEOUT seconds as well, which bounds how long a process may
+keep an outdated catalogue when another process changed categories without a shared version cache or it lost a bump.
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import setting_changed
+from django.db import router
+from django.dispatch import receiver
+
+from drf_project.caches import CacheGeneration
+from photogenie.constants import CATALOGUE_CACHE_ALIAS, CATALOGUE_TIMEOUT, CATALOGUE_VERSION_KEY
+
+
+class CategoryCatalogue:
+    """ Holds the serialized categories ordered by ID with lookups by ID and name and their content hash. """
+
+    def __init__(self, version, categories):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.categories = categories
+        self.by_id = {category['id']: category for category in categories}
+        self.ids_by_name = {category['name']: category['id'] for category in categories}
+        self.content_hash = hashlib.sha256(json.dumps(categories, sort_keys=True).encode()).hexdigest()
+
+    def is_outdated(self, version):
+        """ Returns whether a newer version exists or the catalogue was loaded longer than the timeout ago. """
+
+        timeout = getattr(settings, 'POST_CATALOGUE_TIMEOUT', CATALOGUE_TIMEOUT)
+        return self.version != version or time.monotonic() - self.loaded_at >= timeout
+
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+
+_local_version_cache = LocMemCache('photogenie-catalogue', {})
+
+
+def get_catalogue_version():
+    """ Returns the catalogue version kept in the configured cache, or in this process when there is none. """
+
+    alias = getattr(settings, 'POST_CATALOGUE_CACHE_ALIAS', CATALOGUE_CACHE_ALIAS)
+    return CacheGeneration(_local_version_cache if alias is None else caches[alias], CATALOGUE_VERSION_KEY)
+
+
+def get_category_catalogue():
+    """
+    Returns the catalogue of this process, loading it first when there is none or it is outdated. It is loaded from
+    the database categories are written to, since a lagging replica would be kept under the new version.
+    """
+
+    global _catalogue
+    version = get_catalogue_version().get()
+    catalogue = _catalogue
+    if catalogue is None or catalogue.is_outdated(version):
+        from photogenie.api.serializers import CategorySerializer
+        from photogenie.models import Category
+
+        with _catalogue_lock:
+            queryset = Category.objects.using(router.db_for_write(Category)).order_by('id')
+            categories = CategorySerializer(queryset, many=True).data
+            catalogue = _catalogue = CategoryCatalogue(version, [dict(category) for category in categories])
+    return catalogue
+
+
+def invalidate_category_catalogue():
+    """ Outdates the catalogue of every process now and again when the current transaction commits. """
+
+    get_catalogue_version().invalidate()
+
+
+@receiver(setting_changed)
+def reset_category_catalogue(setting, **kwargs):
+    """ Drops the catalogue of this process when the cache holding its version changes, mostly useful in tests. """
+
+    global _catalogue
+    if setting in ('POST_CATALOGUE_CACHE_ALIAS', 'POST_CATALOGUE_TIMEOUT', 'CACHES'):
+        _catalogue = None
@@ -0,0 +1,61 @@
+"""
+System checks for features that keep state in a Django cache and go wrong when that cache is local to each process.
+"""
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from drf_project.caches import is_shared_cache
+from photogenie.constants import CATALOGUE_CACHE_ALIAS, RESPONSE_CACHE_ALIAS, RESPONSE_CACHE_TIMEOUT
+from photogenie.routers import get_replica_aliases, get_sticky_cache_alias
+
+
+def local_cache_warning(state, alias, consequence, setting, check_id, alternative=''):
+    """ Returns the warning about state kept in the cache with given alias, which is local to each process. """
+
+    return Warning(
+        f'{state} in the {alias!r} cache, which is local to each process.',
+        hint=f'{consequence}, point {setting} to a shared cache{alternative}.',
+        id=check_id,
+    )
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    """ Warns when cached post responses are kept in a cache that other worker processes do not invalidate. """
+
+    alias = getattr(settings, 'POST_RESPONSE_CACHE_ALIAS', RESPONSE_CACHE_ALIAS)
+    if not getattr(settings, 'POST_RESPONSE_CACHE_TIMEOUT', RESPONSE_CACHE_TIMEOUT) or is_shared_cache(alias):
+        return []
+    return [local_cache_warning(
+        'Post responses are cached', alias, 'Workers keep serving responses that other workers have invalidated',
+        'POST_RESPONSE_CACHE_ALIAS', 'photogenie.W001', alternative=' or set POST_RESPONSE_CACHE_TIMEOUT to 0',
+    )]
+
+
+@register()
+def check_catalogue_cache(app_configs, **kwargs):
+    """ Warns when the catalogue version is kept in a configured cache that other worker processes do not see. """
+
+    alias = getattr(settings, 'POST_CATALOGUE_CACHE_ALIAS', CATALOGUE_CACHE_ALIAS)
+    if alias is None or is_shared_cache(alias):
+        return []
+    return [local_cache_warning(
+        'The category catalogue version is kept', alias,
+        'Workers keep their outdated catalogue until POST_CATALOGUE_TIMEOUT is over when another worker changes '
+        'categories', 'POST_CATALOGUE_CACHE_ALIAS', 'photogenie.W002',
+    )]
+
+
+@register()
+def check_replica_cache(app_configs, **kwargs):
+    """ Warns when users who wrote are remembered in a cache that other worker processes do not see. """
+
+    alias = get_sticky_cache_alias()
+    if not get_replica_aliases() or is_shared_cache(alias):
+        return []
+    return [local_cache_warning(
+        'Users reading from the primary after a write are remembered', alias,
+        'Every authenticated user reads from the primary meanwhile', 'POST_DATABASE_REPLICA_CACHE_ALIAS',
+        'photogenie.W003',
+    )]
@@ -0,0 +1,134 @@
+"""
+Compression of response bodies negotiated through the Accept-Encoding header.
+
+CompressionMiddleware compresses textual responses of at least POST_COMPRESSION_MIN_SIZE bytes with the encoding
+that the client prefers among POST_COMPRESSION_ENCODINGS. Brotli is only offered when the brotli package is
+installed. Views mark responses whose body only changes along with a key by setting that key as precompressed_key,
+their compressed bodies are kept in the response cache so that repeated requests skip compression.
+"""
+
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from photogenie.constants import (COMPRESSIBLE_CONTENT_TYPES, COMPRESSION_BROTLI_QUALITY, COMPRESSION_ENCODINGS,
+                                  COMPRESSION_GZIP_LEVEL, COMPRESSION_MIN_SIZE)
+from photogenie.responses import get_response_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def compress_gzip(content):
+    return gzip.compress(content, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compress_brotli(content):
+    return brotli.compress(content, quality=COMPRESSION_BROTLI_QUALITY)
+
+
+COMPRESSORS = {'br': compress_brotli, 'gzip': compress_gzip}
+
+
+def get_available_encodings():
+    """ Returns the configured encodings in order of preference, leaving out brotli when it is not installed. """
+
+    encodings = getattr(settings, 'POST_COMPRESSION_ENCODINGS', COMPRESSION_ENCODINGS)
+    return [encoding for encoding in encodings if encoding in COMPRESSORS and (encoding != 'br' or brotli)]
+
+
+def parse_accept_encoding(header):
+    """ Returns the quality value of every coding listed in an Accept-Encoding header, keyed by lower-cased coding. """
+
+    qualities = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities
+
+
+def negotiate_encoding(header, encodings):
+    """
+    Returns the encoding among the given ones with the highest quality in the Accept-Encoding header, preferring the
+    earlier encodings on ties, or None when the client accepts none of them.
+    """
+
+    qualities = parse_accept_encoding(header or '')
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(response):
+    """ Returns whether the body of the response is textual, large enough and neither encoded nor streamed. """
+
+    if response.streaming or response.has_header('Content-Encoding'):
+        return False
+    if 'no-transform' in response.get('Cache-Control', '').lower():
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    if not content_type.startswith(COMPRESSIBLE_CONTENT_TYPES):
+        return False
+    return len(response.content) >= getattr(settings, 'POST_COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE)
+
+
+def compress_response_content(response, encoding):
+    """
+    Returns the body of the response compressed with the encoding, taken from the response cache for responses
+    carrying a precompressed_key.
+    """
+
+    compress = COMPRESSORS[encoding]
+    key = getattr(response, 'precompressed_key', None)
+    response_cache = get_response_cache()
+    if key is None or response_cache is None:
+        return compress(response.content)
+    key = f'{key}:{response["Content-Type"]}'
+    return response_cache.get_compressed(key, encoding, response.content, compress)
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies with the encoding negotiated from Accept-Encoding. Strong ETags are made weak, since
+    the compressed body is not byte for byte the representation they were computed for.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not is_compressible(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'), get_available_encodings())
+        if encoding is None:
+            return response
+
+        content = compress_response_content(response, encoding)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
@@ -1,3 +1,78 @@
 """ This file contains the constants that are being used in the Photogenie app. """
 
 IMAGE_PATH = 'images/'
+IMAGE_METADATA_BATCH_SIZE = 500
+IMAGE_METADATA_FIELDS = ['image_width', 'image_height', 'image_size', 'image_format', 'image_hash']
+
+BULK_UPLOAD_MAX_POSTS = 500
+BULK_UPLOAD_BATCH_SIZE = 100
+
+DOWNLOAD_BACKEND = 'photogenie.downloads.FileDownloadBackend'
+DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+ARCHIVE_MAX_POSTS = 1000
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+ARCHIVE_STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+RENDITION_PATH = 'images/renditions/'
+RENDITION_SIZES = (256, 1024)
+RENDITION_FORMATS = ('JPEG', 'PNG', 'WEBP')
+RENDITION_QUALITY = 85
+RENDITION_RUNNER = 'photogenie.renditions.run_in_background'
+RENDITION_WORKERS = 2
+
+COUNTER_FIELDS = ('views', 'downloads')
+COUNTER_BUFFER_BACKEND = 'photogenie.counters.LocalCounterBuffer'
+COUNTER_FLUSH_THRESHOLD = 100
+COUNTER_FLUSH_INTERVAL = 10
+COUNTER_CACHE_ALIAS = 'default'
+COUNTER_CACHE_KEY_PREFIX = 'photogenie:counters'
+
+SEARCH_CONFIG = 'simple'
+SEARCH_FTS_TABLE = 'photogenie_userpost_fts'
+SEARCH_INDEX_NAME = 'userpost_search_document_idx'
+SEARCH_REFRESH_BATCH_SIZE = 500
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_KEY_PREFIX = 'photogenie:responses'
+RESPONSE_CACHE_TIMEOUT = 0
+
+ROW_SERIALIZER_ENABLED = True
+
+FACETS = ('categories', 'tags')
+FACET_TAG_LIMIT = 10
+FACET_MAX_TAG_LIMIT = 100
+
+COMPRESSION_ENCODINGS = ('br', 'gzip')
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSIBLE_CONTENT_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                              'application/openapi+json', 'image/svg+xml')
+
+REPLICA_DATABASES = ()
+REPLICA_STICKY_SECONDS = 5
+REPLICA_CACHE_ALIAS = 'default'
+REPLICA_STICKY_KEY_PREFIX = 'photogenie:primary'
+
+CATALOGUE_CACHE_ALIAS = None
+CATALOGUE_VERSION_KEY = 'photogenie:catalogue:version'
+CATALOGUE_TIMEOUT = 60
+
+TRANSFER_BATCH_SIZE = 1000
+
+BENCHMARK_BATCH_SIZE = 1000
+BENCHMARK_IMAGE_NAME = 'images/benchmark.png'
+BENCHMARK_LIST_PAGES = 5
+BENCHMARK_PAGE_SIZES = (10, 100, 1000)
+
+QUERY_BUDGET_MODE = 'log'
+QUERY_BUDGET_MODES = ('off', 'log', 'raise')
+
+METRICS_ENABLED = True
+METRICS_ALLOWED_IPS = ()
+METRICS_ALLOW_ALL = '*'
+METRICS_TOKEN = None
+METRICS_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+METRICS_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
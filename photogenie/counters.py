@@ -0,0 +1,267 @@
+"""
+Write-buffered counters for the views and downloads of UserPost.
+
+Increments are collected in a buffer and written to the database in batches with a single atomic ``F()`` update,
+so hot posts neither lose counts to read-modify-write races nor serialize requests on row locks.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import DatabaseError
+from django.db.models import Case, F, Value, When
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from photogenie.constants import (COUNTER_BUFFER_BACKEND, COUNTER_CACHE_ALIAS, COUNTER_CACHE_KEY_PREFIX,
+                                  COUNTER_FIELDS, COUNTER_FLUSH_INTERVAL, COUNTER_FLUSH_THRESHOLD)
+
+logger = logging.getLogger(__name__)
+
+
+def write_counters(batch):
+    """
+    Adds the buffered amounts to the counters of posts in one UPDATE query and returns the number of rows updated.
+    Batch is a dictionary mapping field name to a dictionary of post ID and amount.
+    """
+
+    from photogenie.models import UserPost
+
+    post_ids = set()
+    updates = {}
+    for field, amounts in batch.items():
+        amounts = {post_id: amount for post_id, amount in amounts.items() if amount}
+        if not amounts:
+            continue
+        post_ids.update(amounts)
+        whens = [When(pk=post_id, then=Value(amount)) for post_id, amount in amounts.items()]
+        updates[field] = F(field) + Case(*whens, default=Value(0))
+
+    if not updates:
+        return 0
+    return UserPost.objects.filter(pk__in=post_ids).update(**updates)
+
+
+class CounterBuffer:
+    """ Provides abstract class for buffering increments of post counters before writing them to database. """
+
+    def __init__(self, flush_threshold=COUNTER_FLUSH_THRESHOLD, flush_interval=COUNTER_FLUSH_INTERVAL):
+        self.flush_threshold = flush_threshold
+        self.flush_interval = flush_interval
+
+    def increment(self, post_id, field, amount=1):
+        """ Buffers an increment of the given counter field of the post. """
+
+        raise NotImplementedError
+
+    def drain(self):
+        """ Removes and returns every buffered increment in form of field to post ID to amount dictionary. """
+
+        raise NotImplementedError
+
+    def flush(self):
+        """ Writes every buffered increment to the database and returns the number of rows updated. """
+
+        batch = self.drain()
+        try:
+            return write_counters(batch)
+        except Exception:
+            self.restore(batch)
+            raise
+
+    def restore(self, batch):
+        """ Puts a drained batch back into the buffer so a failed write does not lose increments. """
+
+        for field, amounts in batch.items():
+            for post_id, amount in amounts.items():
+                self.increment(post_id, field, amount)
+
+    @staticmethod
+    def validate_field(field):
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f'{field} is not a counter field of UserPost.')
+
+
+class LocalCounterBuffer(CounterBuffer):
+    """
+    Buffers increments in the memory of current process and flushes them once the number of buffered increments
+    reaches the threshold or the flush interval is over.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def increment(self, post_id, field, amount=1):
+        self.validate_field(field)
+        with self._lock:
+            self._counts[field][post_id] += amount
+            self._pending += 1
+            should_flush = (
+                self._pending >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if should_flush:
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception('Flushing post counters failed, increments are kept in the buffer.')
+
+    @property
+    def pending(self):
+        """ Returns the number of increments buffered since the last flush. """
+
+        return self._pending
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(lambda: defaultdict(int))
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        return {field: dict(amounts) for field, amounts in counts.items()}
+
+
+class CacheCounterBuffer(CounterBuffer):
+    """
+    Buffers increments in a shared cache so that every worker process writes to the same buffer.
+
+    Increments go into time buckets of flush interval length. Only buckets that no worker writes to anymore are
+    flushed, so reading and deleting a bucket can never race with an increment.
+    """
+
+    def __init__(self, *args, cache_alias=COUNTER_CACHE_ALIAS, key_prefix=COUNTER_CACHE_KEY_PREFIX, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+        self.timeout = max(int(self.flush_interval) * 60, 60)
+
+    def _bucket(self):
+        return int(time.time() // self.flush_interval)
+
+    def _key(self, *parts):
+        return ':'.join([self.key_prefix, *map(str, parts)])
+
+    def increment(self, post_id, field, amount=1):
+        self.validate_field(field)
+        bucket = self._bucket()
+        key = self._key(bucket, field, post_id)
+        try:
+            self.cache.incr(key, amount)
+        except ValueError:
+            if not self.cache.add(key, amount, self.timeout):
+                self.cache.incr(key, amount)
+            elif self._register(bucket, key) == 1:
+                self._flush_closed_buckets()
+
+    def _flush_closed_buckets(self):
+        """ Flushes previous buckets when the first increment of a new bucket arrives. """
+
+        try:
+            self.flush()
+        except DatabaseError:
+            logger.exception('Flushing post counters failed, increments are kept in the buffer.')
+
+    def _register(self, bucket, key):
+        """ Records the counter key in the registry of its bucket so the flush can find it. """
+
+        sequence_key = self._key(bucket, 'sequence')
+        self.cache.add(sequence_key, 0, self.timeout)
+        slot = self.cache.incr(sequence_key)
+        self.cache.set(self._key(bucket, 'slot', slot), key, self.timeout)
+        return slot
+
+    def drain(self):
+        """ Removes and returns the increments of closed buckets, the bucket being written right now is left as is. """
+
+        last = self._bucket() - 1
+        flushed_key = self._key('flushed')
+        first = self.cache.get(flushed_key, last - self.timeout // self.flush_interval) + 1
+
+        batch = defaultdict(dict)
+        for bucket in range(first, last + 1):
+            sequence_key = self._key(bucket, 'sequence')
+            slot_keys = [self._key(bucket, 'slot', slot) for slot in range(1, self.cache.get(sequence_key, 0) + 1)]
+            counter_keys = list(self.cache.get_many(slot_keys).values())
+            for key, amount in self.cache.get_many(counter_keys).items():
+                field, post_id = key.rsplit(':', 2)[-2:]
+                batch[field][int(post_id)] = batch[field].get(int(post_id), 0) + amount
+            self.cache.delete_many([*counter_keys, *slot_keys, sequence_key])
+
+        self.cache.set(flushed_key, last, None)
+        return dict(batch)
+
+    def flush(self):
+        """ Writes closed buckets to the database, only one worker at a time does so. """
+
+        lock_key = self._key('lock')
+        if not self.cache.add(lock_key, 1, self.timeout):
+            return 0
+        try:
+            return super().flush()
+        finally:
+            self.cache.delete(lock_key)
+
+
+_counter_buffer = None
+_counter_buffer_lock = threading.Lock()
+
+
+def get_counter_buffer():
+    """ Returns the process wide counter buffer configured through POST_COUNTER_BUFFER setting. """
+
+    global _counter_buffer
+    if _counter_buffer is None:
+        with _counter_buffer_lock:
+            if _counter_buffer is None:
+                buffer_class = import_string(getattr(settings, 'POST_COUNTER_BUFFER', COUNTER_BUFFER_BACKEND))
+                _counter_buffer = buffer_class(
+                    flush_threshold=getattr(settings, 'POST_COUNTER_FLUSH_THRESHOLD', COUNTER_FLUSH_THRESHOLD),
+                    flush_interval=getattr(settings, 'POST_COUNTER_FLUSH_INTERVAL', COUNTER_FLUSH_INTERVAL),
+                )
+    return _counter_buffer
+
+
+def increment_counter(post_id, field, amount=1):
+    """ Buffers an increment of views or downloads of the post with given ID. """
+
+    get_counter_buffer().increment(post_id, field, amount)
+
+
+def flush_counters():
+    """ Writes all buffered increments of current process to the database. """
+
+    return get_counter_buffer().flush()
+
+
+@atexit.register
+def flush_counters_at_exit():
+    """
+    Writes the increments left in the local buffer when the process exits, so restarting a worker does not lose the
+    views and downloads it has not flushed yet. Shared buffers are left to the other workers and flush_post_counters.
+    """
+
+    buffer = _counter_buffer
+    if not isinstance(buffer, LocalCounterBuffer) or not buffer.pending:
+        return
+    try:
+        buffer.flush()
+    except DatabaseError:
+        logger.exception('Flushing post counters at exit failed, buffered increments are lost.')
+
+
+@receiver(setting_changed)
+def reset_counter_buffer(setting, **kwargs):
+    """ Drops the configured buffer when one of its settings changes, mostly useful in tests. """
+
+    global _counter_buffer
+    if setting.startswith('POST_COUNTER_'):
+        _counter_buffer = None
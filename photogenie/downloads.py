@@ -0,0 +1,219 @@
+"""
+Building download responses for post images with byte ranges and conditional requests.
+
+Images carry a strong ETag made of their SHA-256 content hash, so clients revalidating a cached copy receive
+304 Not Modified and interrupted transfers can resume with a Range request answered by 206 Partial Content.
+
+The bytes are sent by a configurable backend. The default one streams the file from Django, the others hand the
+transfer over to the front-end web server through X-Accel-Redirect or X-Sendfile once Django has checked
+permissions and counted the download, which keeps workers free for API requests.
+"""
+
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.utils.module_loading import import_string
+
+from photogenie.constants import DOWNLOAD_ACCEL_PREFIX, DOWNLOAD_BACKEND, IMAGE_METADATA_FIELDS
+from photogenie.models import UserPost
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """ Raised when the requested byte range lies outside of the file. """
+
+
+class DownloadFile:
+    """ Describes the stored file that a download serves along with its validators. """
+
+    def __init__(self, storage, name, content_hash, dimensions):
+        self.storage = storage
+        self.name = name
+        self.etag = quote_etag(content_hash)
+        self.dimensions = dimensions
+        self.size = storage.size(name)
+        self.last_modified = int(storage.get_modified_time(name).timestamp())
+
+    def open(self):
+        return self.storage.open(self.name, 'rb')
+
+
+def get_download_file(post, size=None):
+    """
+    Returns the rendition of post with the given size when it has been generated, or its original image otherwise.
+    The content hash of images uploaded before hashes were stored is computed and stored on first download with an
+    UPDATE query, which sends no signals that would invalidate cached responses.
+    """
+
+    rendition = post.get_rendition(size) if size else None
+    if rendition is not None:
+        dimensions = f'{rendition["height"]}x{rendition["width"]}'
+        return DownloadFile(post.image.storage, rendition['name'], rendition['hash'], dimensions)
+
+    if not post.image_hash:
+        post.set_image_metadata()
+        UserPost.objects.filter(pk=post.pk).update(**{field: getattr(post, field) for field in IMAGE_METADATA_FIELDS})
+    return DownloadFile(post.image.storage, post.image.name, post.image_hash, post.dimensions)
+
+
+def parse_range(header, size):
+    """
+    Returns the inclusive first and last byte positions requested by a single range Range header, or None when
+    the whole file should be served because there is no header or it asks for several ranges.
+    """
+
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def if_range_matches(request, download_file):
+    """ Returns whether the representation named in If-Range, if any, is still the current one. """
+
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return parse_etags(if_range) == [download_file.etag]
+    return parse_http_date_safe(if_range) == download_file.last_modified
+
+
+def iterate_range(file, start, length, chunk_size=FileResponse.block_size):
+    """ Yields the given number of bytes of the file from the start position and closes the file. """
+
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class DownloadBackend:
+    """ Provides abstract class for backends that send the bytes of a download. """
+
+    def build_response(self, request, download_file, content_type):
+        """
+        Returns 304 or 412 when the conditional headers of the request say so, or the response of the backend
+        otherwise, along with validators of the file.
+        """
+
+        response = get_conditional_response(request, etag=download_file.etag,
+                                            last_modified=download_file.last_modified)
+        if response is not None:
+            if response.status_code == 304:
+                set_validators(response, download_file)
+            return response
+
+        response = self.serve(request, download_file, content_type)
+        set_validators(response, download_file)
+        return response
+
+    def serve(self, request, download_file, content_type):
+        raise NotImplementedError
+
+
+class FileDownloadBackend(DownloadBackend):
+    """ Streams the file from Django, answering Range requests itself. """
+
+    def serve(self, request, download_file, content_type):
+        """
+        Returns a 206 response with the requested byte range of the file, 416 for a range outside of the file or
+        a 200 response with the whole file otherwise.
+        """
+
+        try:
+            byte_range = parse_range(request.headers.get('Range'), download_file.size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{download_file.size}'
+            return response
+
+        if byte_range is not None and if_range_matches(request, download_file):
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                iterate_range(download_file.open(), start, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{download_file.size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(download_file.open(), content_type=content_type)
+
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+class XAccelRedirectBackend(DownloadBackend):
+    """
+    Lets nginx send the file from an internal location that maps POST_DOWNLOAD_ACCEL_PREFIX to the media root,
+    nginx answers Range requests itself.
+    """
+
+    def serve(self, request, download_file, content_type):
+        prefix = getattr(settings, 'POST_DOWNLOAD_ACCEL_PREFIX', DOWNLOAD_ACCEL_PREFIX)
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(f'{prefix.rstrip("/")}/{download_file.name}')
+        return response
+
+
+class XSendfileBackend(DownloadBackend):
+    """ Lets Apache mod_xsendfile or lighttpd send the file from its absolute path on the local file system. """
+
+    def serve(self, request, download_file, content_type):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = download_file.storage.path(download_file.name)
+        return response
+
+
+def get_download_backend():
+    """ Returns an instance of the backend configured through POST_DOWNLOAD_BACKEND setting. """
+
+    return import_string(getattr(settings, 'POST_DOWNLOAD_BACKEND', DOWNLOAD_BACKEND))()
+
+
+def build_download_response(request, download_file, content_type):
+    """ Returns the response of the configured download backend for the file. """
+
+    return get_download_backend().build_response(request, download_file, content_type)
+
+
+def set_validators(response, download_file):
+    response['ETag'] = download_file.etag
+    response['Last-Modified'] = http_date(download_file.last_modified)
+
+
+def is_counted_download(request, response, download_file):
+    """
+    Returns whether the response counts as a download of the image. Revalidations answered with 304 transfer no
+    image and resumed transfers are part of a download that was already counted, so only full downloads and
+    ranges starting at the first byte are counted. The requested range is checked rather than the response, since
+    front-end servers answer ranges of offloaded downloads themselves.
+    """
+
+    if request.method != 'GET' or response.status_code not in (200, 206):
+        return False
+    try:
+        byte_range = parse_range(request.headers.get('Range'), download_file.size)
+    except RangeNotSatisfiable:
+        return False
+    return byte_range is None or not if_range_matches(request, download_file) or byte_range[0] == 0
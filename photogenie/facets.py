@@ -0,0 +1,140 @@
+"""
+Facet counts of posts per category and per tag.
+
+Facets of a filtered list are counted with one grouped aggregate query per facet over the links of the matching
+posts. Facets of the unfiltered list are read from CategoryPostCount and TagPostCount instead, counters that are
+adjusted with atomic ``F()`` updates whenever links between posts and categories or tags are added or removed, so
+they cost one indexed query however many posts there are. Links inserted or deleted in bulk send no signals, code
+doing so adjusts the counters itself or rebuilds them with rebuild_facet_counts.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Case, Count, F, Value, When
+from taggit.models import TaggedItem
+
+from photogenie.catalogue import get_category_catalogue
+from photogenie.models import CategoryPostCount, TagPostCount, UserPost
+
+COUNTER_MODELS = {'categories': CategoryPostCount, 'tags': TagPostCount}
+
+
+def get_facet_links(facet):
+    """ Returns the links between posts and the values of the facet, along with their post and value columns. """
+
+    if facet == 'categories':
+        return UserPost.categories.through.objects.all(), 'userpost_id', 'category_id'
+    content_type = ContentType.objects.get_for_model(UserPost)
+    return TaggedItem.objects.filter(content_type=content_type), 'object_id', 'tag_id'
+
+
+def adjust_facet_counts(facet, deltas):
+    """
+    Adds the amounts to the post counts of the facet values in one UPDATE query, deltas is a dictionary of category
+    or tag ID and amount. Missing counters, of values created before counters existed, are created.
+    """
+
+    deltas = {value_id: amount for value_id, amount in deltas.items() if amount}
+    if not deltas:
+        return
+
+    counter_model = COUNTER_MODELS[facet]
+    whens = [When(pk=value_id, then=Value(amount)) for value_id, amount in deltas.items()]
+    updated = counter_model.objects.filter(pk__in=deltas).update(posts=F('posts') + Case(*whens, default=Value(0)))
+    if updated < len(deltas):
+        existing_ids = set(counter_model.objects.filter(pk__in=deltas).values_list('pk', flat=True))
+        counter_model.objects.bulk_create([
+            counter_model(pk=value_id, posts=amount) for value_id, amount in deltas.items()
+            if value_id not in existing_ids
+        ], ignore_conflicts=True)
+
+
+def create_facet_counts(facet, value_ids):
+    """ Creates the counters of new categories or tags up front, so that adjusting them is always one query. """
+
+    counter_model = COUNTER_MODELS[facet]
+    counter_model.objects.bulk_create([counter_model(pk=value_id) for value_id in value_ids], ignore_conflicts=True)
+
+
+def uncount_post_links(facet, post_id, value_ids=None):
+    """
+    Takes one off the post counts of the values linked to the post, or of the given ones among them, in one UPDATE
+    query. It has to run before the links are deleted.
+    """
+
+    links, post_column, value_column = get_facet_links(facet)
+    links = links.filter(**{post_column: post_id})
+    if value_ids is not None:
+        links = links.filter(**{f'{value_column}__in': value_ids})
+    COUNTER_MODELS[facet].objects.filter(pk__in=links.values(value_column)).update(posts=F('posts') - 1)
+
+
+def rebuild_facet_counts():
+    """ Recounts the posts of every category and tag from their links and returns the number of counters stored. """
+
+    stored = 0
+    for facet, counter_model in COUNTER_MODELS.items():
+        links, _, value_column = get_facet_links(facet)
+        counts = links.values(value_column).annotate(posts=Count('*')).order_by()
+        counter_model.objects.all().delete()
+        stored += len(counter_model.objects.bulk_create([
+            counter_model(pk=row[value_column], posts=row['posts']) for row in counts
+        ]))
+    return stored
+
+
+def get_post_ids(queryset):
+    """
+    Returns the IDs of posts in the queryset as a subquery. Querysets joining tables through extra, like SQLite
+    full-text search, refer to the posts table by name which a subquery renames, so their IDs are read first.
+    """
+
+    post_ids = queryset.order_by().values('pk')
+    if queryset.query.extra_tables:
+        return list(post_ids.values_list('pk', flat=True))
+    return post_ids
+
+
+def count_categories(queryset=None):
+    """ Returns ID, name and post count of the categories of posts in the queryset, or of all posts when None. """
+
+    if queryset is None:
+        counts = CategoryPostCount.objects.filter(posts__gt=0).order_by('-posts', 'category').values_list(
+            'category_id', 'posts'
+        )
+    else:
+        links, post_column, value_column = get_facet_links('categories')
+        counts = links.filter(**{f'{post_column}__in': get_post_ids(queryset)}).values(
+            value_column
+        ).annotate(count=Count('*')).order_by('-count', value_column).values_list(value_column, 'count')
+
+    categories = get_category_catalogue().by_id
+    return [
+        {'id': category_id, 'name': categories[category_id]['name'], 'count': count}
+        for category_id, count in counts if category_id in categories
+    ]
+
+
+def count_tags(queryset=None, limit=None):
+    """ Returns name and post count of the most used tags of posts in the queryset, or of all posts when None. """
+
+    if queryset is None:
+        counts = TagPostCount.objects.filter(posts__gt=0).order_by('-posts', 'tag').values_list('tag__name', 'posts')
+    else:
+        links, post_column, value_column = get_facet_links('tags')
+        counts = links.filter(**{f'{post_column}__in': get_post_ids(queryset)}).values(
+            value_column, 'tag__name'
+        ).annotate(count=Count('*')).order_by('-count', value_column).values_list('tag__name', 'count')
+
+    if limit is not None:
+        counts = counts[:limit]
+    return [{'name': name, 'count': count} for name, count in counts]
+
+
+def get_post_facets(facets, queryset=None, tag_limit=None):
+    """
+    Returns the requested facets of posts in the queryset keyed by facet name, the queryset is None for the
+    unfiltered list whose facets are read from the counters.
+    """
+
+    counters = {'categories': lambda: count_categories(queryset), 'tags': lambda: count_tags(queryset, tag_limit)}
+    return {facet: counters[facet]() for facet in facets}
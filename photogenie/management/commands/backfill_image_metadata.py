@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from PIL import UnidentifiedImageError
+
+from photogenie.constants import IMAGE_METADATA_BATCH_SIZE, IMAGE_METADATA_FIELDS
+from photogenie.models import UserPost
+from photogenie.responses import invalidate_responses
+
+
+class Command(BaseCommand):
+    """ Stores width, height, byte size, format and hash of images of posts uploaded before these fields existed. """
+
+    help = 'Backfills the stored image metadata of user posts in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=IMAGE_METADATA_BATCH_SIZE,
+                            help='Number of posts read and updated per query.')
+        parser.add_argument('--all', action='store_true',
+                            help='Recomputes the metadata of every post instead of only the missing ones.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = UserPost.objects.only('id', 'image').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(Q(image_width__isnull=True) | Q(image_hash=''))
+
+        updated = failed = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            posts = []
+            for post in batch:
+                try:
+                    post.set_image_metadata()
+                except (OSError, UnidentifiedImageError) as error:
+                    failed += 1
+                    self.stderr.write(f'Post {post.id}: {error}')
+                    continue
+                posts.append(post)
+
+            UserPost.objects.bulk_update(posts, IMAGE_METADATA_FIELDS)
+            updated += len(posts)
+
+        if updated:
+            invalidate_responses()
+        self.stdout.write(self.style.SUCCESS(f'Stored image metadata of {updated} post(s), {failed} failed.'))
@@ -0,0 +1,142 @@
+import json
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_databases, setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+
+from photogenie.benchmarks import (HttpDriver, TestClientDriver, build_report, compare_reports, get_token,
+                                   run_benchmarks, run_serialization_benchmarks, seed_dataset)
+from photogenie.constants import BENCHMARK_BATCH_SIZE, BENCHMARK_PAGE_SIZES
+
+
+class Command(BaseCommand):
+    """
+    Seeds a benchmark dataset and measures latency percentiles, throughput and SQL queries of the API hot paths. By
+    default everything happens in a throwaway test database that is dropped afterwards.
+    """
+
+    help = 'Benchmarks the photogenie API endpoints and saves the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100000, help='Number of posts seeded.')
+        parser.add_argument('--categories', type=int, default=1000, help='Number of categories seeded.')
+        parser.add_argument('--tags', type=int, default=10000, help='Number of tags seeded.')
+        parser.add_argument('--users', type=int, default=1000, help='Number of users seeded.')
+        parser.add_argument('--batch-size', type=int, default=BENCHMARK_BATCH_SIZE,
+                            help='Number of rows inserted per query while seeding.')
+        parser.add_argument('--iterations', type=int, default=200, help='Number of measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Number of requests per endpoint sent before measuring.')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Runs only the named scenario, can be given more than once.')
+        parser.add_argument('--page-size', type=int, action='append', dest='page_sizes',
+                            help='Page size at which serializing post lists is timed, can be given more than once. '
+                                 f'Defaults to {", ".join(map(str, BENCHMARK_PAGE_SIZES))}.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random dataset and request parameters.')
+        parser.add_argument('--base-url',
+                            help='Drives a running server at this URL instead of the test client, the dataset is '
+                                 'then seeded into the configured database, which the server must be using.')
+        parser.add_argument('--no-test-database', action='store_true',
+                            help='Seeds the configured database instead of a throwaway test database.')
+        parser.add_argument('--keepdb', action='store_true', help='Keeps the test database after the run.')
+        parser.add_argument('--accept-encoding',
+                            help='Accept-Encoding header sent with every request, such as "gzip" or "br".')
+        parser.add_argument('--no-response-cache', action='store_true',
+                            help='Turns the post response cache off to measure the uncached paths.')
+        parser.add_argument('--output', help='Path of the JSON file the results are saved to.')
+        parser.add_argument('--baseline', help='Path of the JSON results of a previous run to compare against.')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Percentage by which a metric may get worse than the baseline.')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exits with an error when a metric regressed beyond the threshold.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['posts'] < 1:
+            raise CommandError('At least one post is needed to benchmark retrieve and download.')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        in_test_database = not (options['no_test_database'] or options['base_url'])
+        environment_ready = False
+        try:
+            setup_test_environment(debug=False)
+            environment_ready = True
+        except RuntimeError:
+            pass
+
+        overrides = {'POST_RESPONSE_CACHE_TIMEOUT': 0} if options['no_response_cache'] else {}
+        old_config = None
+        try:
+            if in_test_database:
+                old_config = setup_databases(options['verbosity'], interactive=False, keepdb=options['keepdb'],
+                                             aliases={connection.alias})
+                overrides['MEDIA_ROOT'] = tempfile.mkdtemp()
+            with override_settings(**overrides):
+                report = self.run(options)
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, options['verbosity'], keepdb=options['keepdb'])
+            if 'MEDIA_ROOT' in overrides:
+                shutil.rmtree(overrides['MEDIA_ROOT'], ignore_errors=True)
+            if environment_ready:
+                teardown_test_environment()
+
+        self.write_report(report, options['output'])
+        if baseline is not None:
+            self.compare(report, baseline, options['threshold'], options['fail_on_regression'])
+
+    def run(self, options):
+        dataset_options = {key: options[key] for key in ('posts', 'categories', 'tags', 'users')}
+        self.stdout.write(f'Seeding {dataset_options}.')
+        dataset = seed_dataset(**dataset_options, batch_size=options['batch_size'], seed=options['seed'],
+                               log=self.log)
+
+        token = get_token(dataset.author)
+        if options['base_url']:
+            driver, mode = HttpDriver(options['base_url'], token, options['accept_encoding']), 'http'
+        else:
+            driver, mode = TestClientDriver(token, options['accept_encoding']), 'test-client'
+        results = run_benchmarks(driver, dataset, options['iterations'], options['warmup'],
+                                 scenario_names=options['scenarios'], seed=options['seed'], log=self.log)
+        if not options['base_url']:
+            results.update(run_serialization_benchmarks(
+                options['iterations'], options['warmup'], page_sizes=options['page_sizes'] or BENCHMARK_PAGE_SIZES,
+                names=options['scenarios'], log=self.log,
+            ))
+        return build_report(results, dataset_options, options['iterations'], options['warmup'], mode)
+
+    def write_report(self, report, output):
+        self.stdout.write(f'{"endpoint":<32}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"req/s":>10}{"queries":>10}'
+                          f'{"cpu ms":>10}{"bytes":>10}')
+        for name, result in report['results'].items():
+            queries, cpu, size = ('-' if result.get(metric) is None else result[metric]
+                                  for metric in ('queries', 'cpu', 'bytes'))
+            self.stdout.write(f'{name:<32}{result["p50"]:>10}{result["p95"]:>10}{result["p99"]:>10}'
+                              f'{result["throughput"]:>10}{queries:>10}{cpu:>10}{size:>10}')
+        if output:
+            with open(output, 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Saved results to {output}.'))
+
+    def compare(self, report, baseline, threshold, fail_on_regression):
+        comparison, regressions = compare_reports(report, baseline, threshold)
+        for name, changes in comparison.items():
+            changes = ', '.join(f'{metric} {change:+.1f}%' for metric, change in changes.items())
+            self.stdout.write(f'{name:<32}{changes}')
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f'No metric regressed by more than {threshold}%.'))
+            return
+        for regression in regressions:
+            self.stdout.write(self.style.WARNING(f'Regression: {regression}'))
+        if fail_on_regression:
+            raise CommandError(f'{len(regressions)} metric(s) regressed by more than {threshold}%.')
+
+    def log(self, message):
+        if self.verbosity > 1:
+            self.stdout.write(message)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from photogenie.constants import TRANSFER_BATCH_SIZE
+from photogenie.models import UserPost
+from photogenie.transfer import export_posts
+
+
+class Command(BaseCommand):
+    """ Streams posts with their categories, tags and counters as NDJSON, one post per line. """
+
+    help = 'Exports user posts as NDJSON to a file or the standard output.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Path of the file written, the standard output when omitted.')
+        parser.add_argument('--batch-size', type=int, default=TRANSFER_BATCH_SIZE,
+                            help='Number of posts read per chunk.')
+        parser.add_argument('--images', action='store_true',
+                            help='Embeds the base64 encoded image bytes instead of only the image names.')
+        parser.add_argument('--published-by', help='Exports only the posts of the user with this username.')
+
+    def handle(self, *args, **options):
+        queryset = UserPost.objects.all()
+        if options['published_by']:
+            queryset = queryset.filter(published_by__username=options['published_by'])
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else None
+        write = output.write if output else lambda line: self.stdout.write(line, ending='')
+        exported = 0
+        try:
+            for line in export_posts(queryset, options['batch_size'], options['images']):
+                write(line)
+                exported += 1
+        finally:
+            if output:
+                output.close()
+
+        # The summary goes to the standard error when the posts are written to the standard output.
+        (self.stdout if output else self.stderr).write(self.style.SUCCESS(f'Exported {exported} post(s).'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from photogenie.counters import CacheCounterBuffer, get_counter_buffer
+
+
+class Command(BaseCommand):
+    """
+    Writes the buffered views and downloads of posts to the database.
+
+    Only the cache backed buffer is shared with the worker processes, the local buffer lives in the memory of each
+    worker and is flushed by the worker itself.
+    """
+
+    help = 'Flushes buffered view and download counters of user posts to the database.'
+
+    def handle(self, *args, **options):
+        buffer = get_counter_buffer()
+        if not isinstance(buffer, CacheCounterBuffer):
+            raise CommandError(
+                'Buffered counters live in the memory of each worker process and cannot be flushed from here, set '
+                'POST_COUNTER_BUFFER to photogenie.counters.CacheCounterBuffer to share them through a cache.'
+            )
+
+        updated = buffer.flush()
+        self.stdout.write(self.style.SUCCESS(f'Flushed counters of {updated} post(s).'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from PIL import UnidentifiedImageError
+
+from photogenie.models import UserPost
+from photogenie.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    """ Generates downscaled renditions of images of posts uploaded before renditions or a new size existed. """
+
+    help = 'Generates the configured renditions of user post images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerates renditions of every post instead of only the posts without any.')
+
+    def handle(self, *args, **options):
+        queryset = UserPost.objects.order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(renditions={})
+
+        generated = failed = 0
+        for post_id in queryset.values_list('id', flat=True).iterator():
+            try:
+                generate_renditions(post_id)
+            except (OSError, UnidentifiedImageError) as error:
+                failed += 1
+                self.stderr.write(f'Post {post_id}: {error}')
+                continue
+            generated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions of {generated} post(s), {failed} failed.'))
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from photogenie.constants import TRANSFER_BATCH_SIZE
+from photogenie.transfer import import_posts
+
+
+class Command(BaseCommand):
+    """ Creates posts from an NDJSON export in batches, publishers are matched by username. """
+
+    help = 'Imports user posts from an NDJSON file written by export_posts, or from the standard input.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Path of the file to import, the standard input when omitted.')
+        parser.add_argument('--batch-size', type=int, default=TRANSFER_BATCH_SIZE,
+                            help='Number of posts inserted per batch.')
+
+    def handle(self, *args, **options):
+        def report_progress(imported):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{imported} post(s) imported.')
+
+        try:
+            file = open(options['path'], encoding='utf-8') if options['path'] else sys.stdin
+        except OSError as error:
+            raise CommandError(error)
+        with file:
+            imported, errors = import_posts(file, options['batch_size'], on_batch=report_progress)
+
+        for line_number, error in errors.items():
+            self.stderr.write(f'Line {line_number}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} post(s), {len(errors)} line(s) failed.'))
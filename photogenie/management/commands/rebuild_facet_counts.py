@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from photogenie.facets import rebuild_facet_counts
+from photogenie.responses import invalidate_responses
+
+
+class Command(BaseCommand):
+    """ Recounts the posts of every category and tag, for links that were written without adjusting the counters. """
+
+    help = 'Rebuilds the post counts of categories and tags shown as facets of the unfiltered post list.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stored = rebuild_facet_counts()
+        invalidate_responses()
+        self.stdout.write(self.style.SUCCESS(f'Stored post counts of {stored} categories and tags.'))
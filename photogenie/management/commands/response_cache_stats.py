@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from photogenie.responses import get_response_cache
+
+
+class Command(BaseCommand):
+    """ Reports how often cached post responses were served instead of being built. """
+
+    help = 'Shows hit and miss statistics of the post response cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Resets the statistics after showing them.')
+
+    def handle(self, *args, **options):
+        response_cache = get_response_cache()
+        if response_cache is None:
+            self.stdout.write('Response cache is turned off.')
+            return
+
+        stats = response_cache.get_stats()
+        self.stdout.write(f'Hits: {stats["hits"]}, misses: {stats["misses"]}, hit ratio: {stats["hit_ratio"]:.2%}')
+        if options['reset']:
+            response_cache.reset_stats()
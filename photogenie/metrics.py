@@ -0,0 +1,241 @@
+"""
+Lightweight request instrumentation exposed in Prometheus text format.
+
+RequestMetricsMiddleware records the wall time, database time, query count, serializer time and response size of
+every request, returns them to the client in a Server-Timing header and adds them to per view histograms kept in
+this process. The metrics view renders those histograms for Prometheus to scrape, so there is no collector to run,
+but every worker process exposes its own histograms. Scraping needs an allowed client address or a token.
+"""
+
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from photogenie.budgets import count_queries, get_view_name, resolve_view
+from photogenie.constants import (METRICS_ALLOW_ALL, METRICS_ALLOWED_IPS, METRICS_DURATION_BUCKETS, METRICS_ENABLED,
+                                  METRICS_QUERY_BUCKETS, METRICS_SIZE_BUCKETS, METRICS_TOKEN)
+
+METRICS = {
+    'wall': ('photogenie_request_duration_seconds', 'Wall time of requests.', METRICS_DURATION_BUCKETS),
+    'db': ('photogenie_request_db_duration_seconds', 'Time requests spent running SQL queries.',
+           METRICS_DURATION_BUCKETS),
+    'queries': ('photogenie_request_queries', 'Number of SQL queries run by requests.', METRICS_QUERY_BUCKETS),
+    'serializer': ('photogenie_request_serializer_duration_seconds', 'Time requests spent serializing data.',
+                   METRICS_DURATION_BUCKETS),
+    'size': ('photogenie_response_size_bytes', 'Size of response bodies.', METRICS_SIZE_BUCKETS),
+}
+
+_serializer_timer = ContextVar('serializer_timer', default=None)
+
+
+class Histogram:
+    """ Counts observations into cumulative buckets with given upper bounds along with their sum. """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """ Holds a histogram per metric, view and method and renders them in Prometheus text format. """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, method, values):
+        with self.lock:
+            for metric, value in values.items():
+                key = (metric, view, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(METRICS[metric][2])
+                self.histograms[key].observe(value)
+
+    def render(self):
+        """ Returns every histogram in Prometheus text exposition format. """
+
+        lines = []
+        with self.lock:
+            for metric, (name, description, _) in METRICS.items():
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for (key_metric, view, method), histogram in sorted(self.histograms.items()):
+                    if key_metric != metric:
+                        continue
+                    labels = f'view="{view}",method="{method}"'
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class SerializerTimer:
+    """ Adds up the time spent in the outermost serializer calls of the current request. """
+
+    def __init__(self):
+        self.duration = 0.0
+        self.depth = 0
+
+
+@contextmanager
+def time_serialization():
+    """ Adds the time spent in the block to the serializer time of the current request unless it is nested. """
+
+    timer = _serializer_timer.get()
+    if timer is None:
+        yield
+        return
+
+    timer.depth += 1
+    started = time.perf_counter() if timer.depth == 1 else None
+    try:
+        yield
+    finally:
+        timer.depth -= 1
+        if started is not None:
+            timer.duration += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """
+    Records the time a serializer spends turning instances into primitive data for request metrics. Only the
+    outermost call is timed, so nested and many serializers are counted once.
+    """
+
+    def to_representation(self, instance):
+        if _serializer_timer.get() is None:
+            return super().to_representation(instance)
+        with time_serialization():
+            return super().to_representation(instance)
+
+
+def get_response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    return None
+
+
+def build_server_timing(values):
+    """ Returns the Server-Timing header value for the recorded values, durations are given in milliseconds. """
+
+    metrics = [
+        f'app;dur={values["wall"] * 1000:.2f}',
+        f'db;dur={values["db"] * 1000:.2f};desc="{values["queries"]} queries"',
+        f'serializer;dur={values["serializer"] * 1000:.2f}',
+    ]
+    if 'size' in values:
+        metrics.append(f'size;desc="{values["size"]} bytes"')
+    return ', '.join(metrics)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures every request routed to a view, sets the Server-Timing header and adds the values to the histograms of
+    the view. Requests to the metrics view itself are not measured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'POST_METRICS_ENABLED', METRICS_ENABLED):
+            return self.get_response(request)
+
+        timer = SerializerTimer()
+        token = _serializer_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            with count_queries() as counter:
+                response = self.get_response(request)
+        finally:
+            _serializer_timer.reset(token)
+
+        view = getattr(request, 'metrics_view', None)
+        if view is None:
+            return response
+
+        values = {
+            'wall': time.perf_counter() - started,
+            'db': counter.duration,
+            'queries': counter.count,
+            'serializer': timer.duration,
+        }
+        size = get_response_size(response)
+        if size is not None:
+            values['size'] = size
+        response['Server-Timing'] = build_server_timing(values)
+        registry.observe(view, request.method, values)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func is metrics_view:
+            return None
+        view_class, action = resolve_view(view_func, request.method)
+        if view_class is not None:
+            request.metrics_view = get_view_name(view_class, action)
+        else:
+            request.metrics_view = f'{view_func.__module__}.{view_func.__name__}'
+        return None
+
+
+def get_metrics_allowed_ips():
+    """
+    Returns the client addresses allowed to scrape metrics from POST_METRICS_ALLOWED_IPS, none by default, or None
+    when it is '*' to allow every client.
+    """
+
+    allowed_ips = getattr(settings, 'POST_METRICS_ALLOWED_IPS', METRICS_ALLOWED_IPS)
+    if allowed_ips == METRICS_ALLOW_ALL:
+        return None
+    return tuple(allowed_ips)
+
+
+def is_metrics_client(request):
+    """
+    Returns whether the request may read the metrics, either from an allowed address or with the bearer token set
+    as POST_METRICS_TOKEN. Behind a reverse proxy every request comes from the address of the proxy, so allowing it
+    allows every client of the proxy, the token or a rule of the proxy has to restrict access then.
+    """
+
+    allowed_ips = get_metrics_allowed_ips()
+    if allowed_ips is None or request.META.get('REMOTE_ADDR') in allowed_ips:
+        return True
+    token = getattr(settings, 'POST_METRICS_TOKEN', METRICS_TOKEN)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+
+
+def metrics_view(request):
+    """ Renders the request histograms of this process in Prometheus text format. """
+
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photogenie', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpost',
+            name='image_format',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='userpost',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userpost',
+            name='image_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userpost',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='userpost',
+            name='image',
+            field=models.ImageField(upload_to='images/'),
+        ),
+    ]
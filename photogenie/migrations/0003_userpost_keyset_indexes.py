@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photogenie', '0002_userpost_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userpost',
+            index=models.Index(fields=['published_at', 'id'], name='userpost_published_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpost',
+            index=models.Index(fields=['views', 'id'], name='userpost_views_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpost',
+            index=models.Index(fields=['downloads', 'id'], name='userpost_downloads_id_idx'),
+        ),
+    ]
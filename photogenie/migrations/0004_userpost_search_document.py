@@ -0,0 +1,83 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+from photogenie.constants import SEARCH_INDEX_NAME, SEARCH_REFRESH_BATCH_SIZE
+from photogenie.search import (build_search_document, get_search_vector, install_sqlite_search_index,
+                               uninstall_sqlite_search_index)
+
+
+def get_search_index():
+    from django.contrib.postgres.indexes import GinIndex
+
+    return GinIndex(get_search_vector(), name=SEARCH_INDEX_NAME)
+
+
+def populate_search_documents(apps, schema_editor):
+    """ Builds search documents of existing posts in batches. """
+
+    UserPost = apps.get_model('photogenie', 'UserPost')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    content_type = ContentType.objects.filter(app_label='photogenie', model='userpost').first()
+
+    last_id = 0
+    while True:
+        posts = list(
+            UserPost.objects.filter(id__gt=last_id).order_by('id')
+            .select_related('published_by').prefetch_related('categories')[:SEARCH_REFRESH_BATCH_SIZE]
+        )
+        if not posts:
+            break
+        last_id = posts[-1].id
+
+        tag_names = {}
+        if content_type is not None:
+            tagged_items = TaggedItem.objects.filter(
+                content_type=content_type, object_id__in=[post.id for post in posts]
+            ).values_list('object_id', 'tag__name')
+            for object_id, name in tagged_items:
+                tag_names.setdefault(object_id, []).append(name)
+
+        for post in posts:
+            post.search_document = build_search_document(
+                post.description,
+                post.published_by.username,
+                [category.name for category in post.categories.all()],
+                tag_names.get(post.id, []),
+            )
+        UserPost.objects.bulk_update(posts, ['search_document'])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('photogenie', 'UserPost'), get_search_index())
+    elif vendor == 'sqlite':
+        install_sqlite_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('photogenie', 'UserPost'), get_search_index())
+    elif vendor == 'sqlite':
+        uninstall_sqlite_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('photogenie', '0003_userpost_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpost',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
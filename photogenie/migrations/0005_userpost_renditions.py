@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photogenie', '0004_userpost_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpost',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
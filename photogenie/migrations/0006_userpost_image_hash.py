@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photogenie', '0005_userpost_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpost',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
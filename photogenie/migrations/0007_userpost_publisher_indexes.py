@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('photogenie', '0006_userpost_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userpost',
+            index=models.Index(fields=['published_by', 'published_at', 'id'], name='userpost_author_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpost',
+            index=models.Index(fields=['published_by', 'views', 'id'], name='userpost_author_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpost',
+            index=models.Index(fields=['published_by', 'downloads', 'id'], name='userpost_author_downloads_idx'),
+        ),
+        migrations.AlterField(
+            model_name='userpost',
+            name='published_by',
+            field=models.ForeignKey(
+                db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+            ),
+        ),
+    ]
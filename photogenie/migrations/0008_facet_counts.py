@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:40
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def populate_facet_counts(apps, schema_editor):
+    """ Counts the posts of every category and tag linked to posts so far. """
+
+    UserPost = apps.get_model('photogenie', 'UserPost')
+    CategoryPostCount = apps.get_model('photogenie', 'CategoryPostCount')
+    TagPostCount = apps.get_model('photogenie', 'TagPostCount')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+
+    category_counts = UserPost.categories.through.objects.values('category_id').annotate(posts=Count('*'))
+    CategoryPostCount.objects.bulk_create([
+        CategoryPostCount(category_id=row['category_id'], posts=row['posts']) for row in category_counts.order_by()
+    ])
+    tag_counts = TaggedItem.objects.filter(
+        content_type__app_label='photogenie', content_type__model='userpost'
+    ).values('tag_id').annotate(posts=Count('*'))
+    TagPostCount.objects.bulk_create([
+        TagPostCount(tag_id=row['tag_id'], posts=row['posts']) for row in tag_counts.order_by()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        ('photogenie', '0007_userpost_publisher_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagPostCount',
+            fields=[
+                ('tag', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='post_count',
+                    serialize=False, to='taggit.tag'
+                )),
+                ('posts', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-posts', 'tag'], name='tagpostcount_posts_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryPostCount',
+            fields=[
+                ('category', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='post_count',
+                    serialize=False, to='photogenie.category'
+                )),
+                ('posts', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-posts', 'category'], name='categorypostcount_posts_idx')],
+            },
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
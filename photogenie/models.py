@@ -1,5 +1,9 @@
+import hashlib
+
 from django.db import models
+from PIL import Image
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 
 from authentication.models import User
 from photogenie.constants import IMAGE_PATH
@@ -18,22 +22,98 @@ class UserPost(models.Model):
     """ Model for posts uploaded by users. """
 
     published_at = models.DateTimeField(auto_now_add=True)
-    published_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    published_by = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     description = models.TextField()
     image = models.ImageField(upload_to=IMAGE_PATH)
     categories = models.ManyToManyField(Category)
     tags = TaggableManager()
     views = models.PositiveIntegerField(default=0)
     downloads = models.PositiveIntegerField(default=0)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    image_format = models.CharField(max_length=16, blank=True, editable=False)
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    search_document = models.TextField(blank=True, editable=False)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['published_at']
+        indexes = [
+            models.Index(fields=['published_at', 'id'], name='userpost_published_at_id_idx'),
+            models.Index(fields=['views', 'id'], name='userpost_views_id_idx'),
+            models.Index(fields=['downloads', 'id'], name='userpost_downloads_id_idx'),
+            # Posts of one publisher in every list ordering, these also serve lookups of the publisher foreign key.
+            models.Index(fields=['published_by', 'published_at', 'id'], name='userpost_author_published_idx'),
+            models.Index(fields=['published_by', 'views', 'id'], name='userpost_author_views_idx'),
+            models.Index(fields=['published_by', 'downloads', 'id'], name='userpost_author_downloads_idx'),
+        ]
 
     def __str__(self):
         return f'Photo by {self.published_by.username}'
 
     @property
     def dimensions(self):
-        """ Returns the 'x' seperated height and width of image of the Post instance as dimensions. """
+        """
+        Returns the 'x' seperated height and width of image of the Post instance as dimensions, the image file is
+        only opened for posts whose image metadata has not been stored yet.
+        """
+
+        if self.image_height is None or self.image_width is None:
+            return f'{self.image.height}x{self.image.width}'
+        return f'{self.image_height}x{self.image_width}'
+
+    def get_rendition(self, size):
+        """ Returns name, width and height of the stored rendition of given size, or None if there is none. """
+
+        return self.renditions.get(str(size))
+
+    def set_image_metadata(self):
+        """
+        Stores width, height, byte size, format and content hash of the image on the instance without saving it.
+        Uploaded images already opened by the serializer validation are reused instead of being read again.
+        """
+
+        was_closed = self.image.closed
+        self.image.open('rb')
+        try:
+            uploaded_image = getattr(self.image.file, 'image', None)
+            if uploaded_image is not None:
+                size, image_format = uploaded_image.size, uploaded_image.format
+            else:
+                with Image.open(self.image) as image:
+                    size, image_format = image.size, image.format
+
+            content_hash = hashlib.sha256()
+            for chunk in self.image.chunks():
+                content_hash.update(chunk)
+        finally:
+            if was_closed:
+                self.image.close()
+            else:
+                self.image.seek(0)
+
+        self.image_width, self.image_height = size
+        self.image_format = image_format or ''
+        self.image_size = self.image.size
+        self.image_hash = content_hash.hexdigest()
+
 
-        return f'{self.image.height}x{self.image.width}'
+class CategoryPostCount(models.Model):
+    """ Model for the number of posts in a category, kept in step as posts are linked to and unlinked from it. """
+
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='post_count')
+    posts = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['-posts', 'category'], name='categorypostcount_posts_idx')]
+
+
+class TagPostCount(models.Model):
+    """ Model for the number of posts with a tag, kept in step as posts are tagged and untagged. """
+
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='post_count')
+    posts = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['-posts', 'tag'], name='tagpostcount_posts_idx')]
@@ -0,0 +1,100 @@
+"""
+Query plan checks for the queries API requests run.
+
+The queries executed within check_query_plans are explained once the block ends, and the block fails with
+QueryPlanProblem when a plan reads one of the given tables from start to end or sorts rows, both of which grow with
+the table instead of with the page asked for. Walking a whole index in order is fine for queries with a LIMIT, which
+stop after a page. Plans are read from EXPLAIN QUERY PLAN on SQLite, EXPLAIN on PostgreSQL and MySQL. Planners only
+pick indexes once tables are large enough and their statistics are known, so checks are meant to run on a seeded
+dataset after analyze_tables.
+"""
+
+import re
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?( USING (?:COVERING )?INDEX \w+)?$')
+LIMIT = re.compile(r'\bLIMIT \d+')
+POSTGRESQL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class QueryPlanProblem(AssertionError):
+    """ Raised when a plan scans a whole table or sorts rows. """
+
+
+def explain(sql, using='default'):
+    """ Returns the lines of the plan that the database picks for an executed query. """
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        columns = [column[0] for column in cursor.description]
+        return [str(dict(zip(columns, row))) if len(columns) > 1 else row[0] for row in cursor.fetchall()]
+
+
+def find_plan_problems(plan, vendor, tables, limited=False):
+    """
+    Returns a description of every step of the plan that reads one of the tables whole or sorts rows, scans of a
+    whole index are only reported for queries that are not limited.
+    """
+
+    problems = []
+    for line in plan:
+        if vendor == 'sqlite':
+            match = SQLITE_SCAN.match(line.strip())
+            if match and match.group(1) in tables and not (match.group(2) and limited):
+                problems.append(f'full scan of {match.group(1)}')
+            if 'USE TEMP B-TREE' in line:
+                problems.append(line.strip().lower())
+        elif vendor == 'postgresql':
+            match = POSTGRESQL_SCAN.search(line)
+            if match and match.group(1) in tables:
+                problems.append(f'full scan of {match.group(1)}')
+            if re.search(r'(^|->)\s*(Incremental )?Sort\b', line):
+                problems.append('sort')
+        elif vendor == 'mysql':
+            if "'type': 'ALL'" in line and any(f"'table': '{table}'" in line for table in tables):
+                problems.append('full scan')
+            if 'Using filesort' in line:
+                problems.append('filesort')
+    return problems
+
+
+def analyze_tables(using='default'):
+    """ Refreshes the statistics that the planner picks indexes from, which bulk inserts leave outdated. """
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+@contextmanager
+def check_query_plans(tables, using='default', ignore=(), allow_sorts=False):
+    """
+    Explains the queries executed within the block on the given database, except the ones matching a pattern of
+    ignore, and raises QueryPlanProblem listing every query whose plan scans one of the tables whole or, unless
+    allowed, sorts rows.
+    """
+
+    connection = connections[using]
+    with CaptureQueriesContext(connection) as context:
+        yield context
+
+    failures = []
+    for query in context.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT') or any(re.search(pattern, sql) for pattern in ignore):
+            continue
+        plan = explain(sql, using)
+        problems = find_plan_problems(plan, connection.vendor, tables, limited=bool(LIMIT.search(sql)))
+        if allow_sorts:
+            problems = [problem for problem in problems if problem.startswith('full scan')]
+        if problems:
+            failures.append(f'{", ".join(problems)} in: {sql}\n  ' + '\n  '.join(plan))
+    if failures:
+        raise QueryPlanProblem('\n'.join(failures))
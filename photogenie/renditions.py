@@ -0,0 +1,142 @@
+"""
+Downscaled renditions of post images.
+
+Renditions are generated once per uploaded image, largest size first with every smaller size scaled down from the
+previous one, and stored next to the original. Generation runs through a configurable runner so that it can happen
+in a background thread after the upload transaction commits instead of in the request. Renditions of a replaced image
+are dropped with it and their files, like those of deleted posts, are deleted once the change commits.
+"""
+
+import hashlib
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from photogenie.constants import (RENDITION_FORMATS, RENDITION_PATH, RENDITION_QUALITY, RENDITION_RUNNER,
+                                  RENDITION_SIZES, RENDITION_WORKERS)
+from photogenie.responses import invalidate_responses
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_rendition_sizes():
+    """ Returns the configured rendition sizes, being the longest edge in pixels, from largest to smallest. """
+
+    return sorted(getattr(settings, 'POST_RENDITION_SIZES', RENDITION_SIZES), reverse=True)
+
+
+def render_image(image, size):
+    """ Returns a copy of the image scaled down so that its longest edge fits the given size. """
+
+    rendition = image.copy()
+    rendition.thumbnail((size, size), Image.LANCZOS)
+    return rendition
+
+
+def encode_image(image, image_format):
+    """
+    Returns the bytes of image encoded in its original format when it is a web format, JPEG otherwise, along with
+    the format used.
+    """
+
+    if image_format not in RENDITION_FORMATS:
+        image_format = 'JPEG'
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    content = BytesIO()
+    image.save(content, image_format, quality=RENDITION_QUALITY, optimize=True)
+    return content.getvalue(), image_format
+
+
+def generate_renditions(post_id):
+    """ Generates and stores every configured rendition of the image of a post, replacing the previous ones. """
+
+    from photogenie.models import UserPost
+
+    post = UserPost.objects.filter(pk=post_id).only('id', 'image', 'renditions').first()
+    if post is None or not post.image:
+        return
+
+    storage = post.image.storage
+    filename = posixpath.basename(post.image.name)
+    renditions = {}
+    with post.image.open('rb'), Image.open(post.image) as image:
+        image.load()
+        source = image
+        for size in get_rendition_sizes():
+            if max(source.size) <= size:
+                continue
+            source = render_image(source, size)
+            content, image_format = encode_image(source, image.format)
+            if image_format != image.format:
+                filename = f'{posixpath.splitext(filename)[0]}.jpg'
+            name = storage.save(posixpath.join(RENDITION_PATH, str(size), filename), ContentFile(content))
+            renditions[str(size)] = {
+                'name': name,
+                'width': source.width,
+                'height': source.height,
+                'hash': hashlib.sha256(content).hexdigest(),
+            }
+
+    delete_renditions(post.renditions, storage)
+    UserPost.objects.filter(pk=post_id).update(renditions=renditions)
+    invalidate_responses()
+
+
+def delete_renditions(renditions, storage):
+    """ Deletes the stored files of the given renditions. """
+
+    for rendition in renditions.values():
+        storage.delete(rendition['name'])
+
+
+def delete_renditions_on_commit(renditions, storage):
+    """ Deletes the stored files of the given renditions once the current transaction commits. """
+
+    if renditions:
+        transaction.on_commit(lambda: delete_renditions(renditions, storage))
+
+
+def run_inline(function, *args):
+    """ Runs the function right away in the current thread. """
+
+    function(*args)
+
+
+def run_in_background(function, *args):
+    """ Runs the function in a shared pool of background threads with their own database connections. """
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'POST_RENDITION_WORKERS', RENDITION_WORKERS),
+            thread_name_prefix='renditions',
+        )
+    _executor.submit(_run_with_connections, function, *args)
+
+
+def _run_with_connections(function, *args):
+    close_old_connections()
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Generating renditions failed for %s.', args)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(post_id):
+    """ Hands rendition generation of the post to the configured runner once the current transaction commits. """
+
+    runner = import_string(getattr(settings, 'POST_RENDITION_RUNNER', RENDITION_RUNNER))
+    transaction.on_commit(lambda: runner(generate_renditions, post_id))
@@ -0,0 +1,136 @@
+"""
+Versioned cache of the public post list and detail responses.
+
+Responses are stored under keys made of a generation number and the validated query parameters. Any change to
+posts, their categories, tags or publishers bumps the generation, which makes every stored response unreachable at
+once instead of tracking which lists a post appears in, and the orphaned entries expire with their timeout.
+
+The generation is bumped right away and once more when the transaction commits. Views and downloads are written by
+the counter buffer without bumping the generation, so cached responses show counts that are at most the timeout old.
+
+Compressed bodies of cached responses are kept as well, so that repeated hits are not compressed again.
+
+The cache is off until POST_RESPONSE_CACHE_TIMEOUT is set, and the generation has to live in a shared cache, otherwise
+the workers that did not handle a change keep serving their outdated responses.
+"""
+
+import hashlib
+import json
+import threading
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from drf_project.caches import CacheGeneration
+from photogenie.constants import RESPONSE_CACHE_ALIAS, RESPONSE_CACHE_KEY_PREFIX, RESPONSE_CACHE_TIMEOUT
+
+STATS = ('hits', 'misses')
+
+
+class ResponseCache:
+    """ Stores response data under generation versioned keys and counts hits and misses across processes. """
+
+    def __init__(self, cache_alias=RESPONSE_CACHE_ALIAS, key_prefix=RESPONSE_CACHE_KEY_PREFIX,
+                 timeout=RESPONSE_CACHE_TIMEOUT):
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.generation = CacheGeneration(self.cache, self._key('generation'))
+
+    def _key(self, *parts):
+        return ':'.join([self.key_prefix, *map(str, parts)])
+
+    def build_key(self, name, params):
+        """ Returns the key of a response of the named endpoint for the given parameters in current generation. """
+
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return self._key(self.generation.get(), name, digest)
+
+    def get(self, key):
+        """ Returns the value stored under the key or None, and records the lookup as a hit or a miss. """
+
+        value = self.cache.get(key)
+        self._record('misses' if value is None else 'hits')
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def get_compressed(self, key, encoding, content, compress):
+        """
+        Returns the content of the response stored under key compressed with the encoding, compressing and storing
+        it first when it is not stored yet. The length and checksum of the content are part of the key, so a stored
+        body is never served for other content.
+        """
+
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        compressed_key = self._key('compressed', encoding, digest, len(content), f'{zlib.crc32(content):08x}')
+        compressed = self.cache.get(compressed_key)
+        if compressed is None:
+            compressed = compress(content)
+            self.cache.set(compressed_key, compressed, self.timeout)
+        return compressed
+
+    def _record(self, stat):
+        key = self._key('stats', stat)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            if not self.cache.add(key, 1, None):
+                self.cache.incr(key)
+
+    def get_stats(self):
+        """ Returns the number of hits and misses along with the hit ratio. """
+
+        values = self.cache.get_many([self._key('stats', stat) for stat in STATS])
+        stats = {stat: values.get(self._key('stats', stat), 0) for stat in STATS}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        self.cache.delete_many([self._key('stats', stat) for stat in STATS])
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the process wide response cache configured through POST_RESPONSE_CACHE_ALIAS and
+    POST_RESPONSE_CACHE_TIMEOUT settings, or None when the timeout is 0.
+    """
+
+    global _response_cache
+    timeout = getattr(settings, 'POST_RESPONSE_CACHE_TIMEOUT', RESPONSE_CACHE_TIMEOUT)
+    if not timeout:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    cache_alias=getattr(settings, 'POST_RESPONSE_CACHE_ALIAS', RESPONSE_CACHE_ALIAS),
+                    timeout=timeout,
+                )
+    return _response_cache
+
+
+def invalidate_responses():
+    """ Invalidates every cached response now and again when the current transaction commits. """
+
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.generation.invalidate()
+
+
+@receiver(setting_changed)
+def reset_response_cache(setting, **kwargs):
+    """ Drops the configured response cache when one of its settings changes, mostly useful in tests. """
+
+    global _response_cache
+    if setting.startswith('POST_RESPONSE_CACHE_') or setting == 'CACHES':
+        _response_cache = None
@@ -0,0 +1,134 @@
+"""
+Routing of read-only API traffic to database replicas.
+
+Views mixing in ReplicaReadMixin run the actions named in their ``replica_actions`` against one of the aliases of
+POST_DATABASE_REPLICAS, picked at random per request, once authentication and permission checks ran on the primary.
+ReplicaRouter sends the reads of such requests to the picked replica and every write to the primary, whatever
+database the written instance was read from. Everything else reads from the primary.
+
+Replicas lag behind the primary, so StickyPrimaryMiddleware remembers users whose unsafe requests succeeded in the
+configured cache for POST_DATABASE_STICKY_SECONDS, and their reads stay on the primary meanwhile so that they see
+their own changes. Only a cache shared between worker processes remembers writes handled by other workers, with a
+cache local to each process every authenticated user reads from the primary and only anonymous reads go to replicas.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from drf_project.caches import is_shared_cache
+from photogenie.constants import (REPLICA_CACHE_ALIAS, REPLICA_DATABASES, REPLICA_STICKY_KEY_PREFIX,
+                                  REPLICA_STICKY_SECONDS)
+
+_read_database = ContextVar('read_database', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_replica_aliases():
+    return tuple(getattr(settings, 'POST_DATABASE_REPLICAS', REPLICA_DATABASES))
+
+
+def get_sticky_cache_alias():
+    return getattr(settings, 'POST_DATABASE_REPLICA_CACHE_ALIAS', REPLICA_CACHE_ALIAS)
+
+
+def get_sticky_cache():
+    return caches[get_sticky_cache_alias()]
+
+
+def get_sticky_key(user_id):
+    return f'{REPLICA_STICKY_KEY_PREFIX}:{user_id}'
+
+
+def stick_to_primary(user_id):
+    """ Keeps the reads of the user on the primary while replicas may not have caught up with a write of theirs. """
+
+    timeout = getattr(settings, 'POST_DATABASE_STICKY_SECONDS', REPLICA_STICKY_SECONDS)
+    if timeout:
+        get_sticky_cache().set(get_sticky_key(user_id), True, timeout)
+
+
+def is_stuck_to_primary(user_id):
+    """
+    Returns whether reads of the user stay on the primary, which they always do when the sticky cache is local to the
+    process since writes of the user handled by other workers are not remembered there.
+    """
+
+    if user_id is None:
+        return False
+    if not is_shared_cache(get_sticky_cache_alias()):
+        return True
+    return get_sticky_cache().get(get_sticky_key(user_id), False)
+
+
+def choose_replica(user_id=None):
+    """ Returns a random replica alias, or None when there are none or the user has to read from the primary. """
+
+    replicas = get_replica_aliases()
+    if not replicas or is_stuck_to_primary(user_id):
+        return None
+    return random.choice(replicas)
+
+
+def get_read_database():
+    """ Returns the replica alias that reads of the current request go to, or None for the primary. """
+
+    return _read_database.get()
+
+
+class ReplicaRouter:
+    """ Sends reads of requests routed to a replica there and every write to the primary. """
+
+    def db_for_read(self, model, **hints):
+        return get_read_database()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """ Allows relations between instances of the primary and its replicas, which hold the same data. """
+
+        databases = {DEFAULT_DB_ALIAS, *get_replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """ Runs the actions of a view named in replica_actions against a replica, reading from the primary otherwise. """
+
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and getattr(self, 'action', None) in self.replica_actions:
+            alias = choose_replica(request.user.pk if request.user.is_authenticated else None)
+            if alias is not None:
+                self._replica_token = _read_database.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _read_database.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class StickyPrimaryMiddleware:
+    """ Keeps the reads of users on the primary for a short while after an unsafe request of theirs succeeded. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # REST framework sets the user it authenticated on the request, which the session user is for other views.
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS and response.status_code < 400 and user is not None
+                and user.is_authenticated and get_replica_aliases()):
+            stick_to_primary(user.pk)
+        return response
@@ -0,0 +1,182 @@
+"""
+Full-text search over the search document maintained for every UserPost.
+
+The search document joins the description, author username, category names and tags of a post. PostgreSQL searches
+it through a GIN indexed tsvector expression and SQLite through an FTS5 table kept in sync by triggers, both ranking
+the matches into a rank column and ordering by it and the primary key, which cursor pages seek past. Other databases
+fall back to a plain containment filter.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+from photogenie.constants import SEARCH_CONFIG, SEARCH_FTS_TABLE, SEARCH_REFRESH_BATCH_SIZE
+
+SEARCH_TERM_PATTERN = re.compile(r'\w+')
+
+
+SQLITE_TRIGGERS = {
+    'insert': (
+        'AFTER INSERT ON {posts} BEGIN '
+        'INSERT INTO {fts}(rowid, search_document) VALUES (new.id, new.search_document); END'
+    ),
+    'delete': (
+        'AFTER DELETE ON {posts} BEGIN '
+        "INSERT INTO {fts}({fts}, rowid, search_document) VALUES ('delete', old.id, old.search_document); END"
+    ),
+    'update': (
+        'AFTER UPDATE OF search_document ON {posts} BEGIN '
+        "INSERT INTO {fts}({fts}, rowid, search_document) VALUES ('delete', old.id, old.search_document); "
+        'INSERT INTO {fts}(rowid, search_document) VALUES (new.id, new.search_document); END'
+    ),
+}
+
+
+def build_search_document(description, username, category_names, tag_names):
+    """ Returns the text that is indexed for a post with the given attributes. """
+
+    return ' '.join([username, *sorted(category_names), *sorted(tag_names), description])
+
+
+def set_search_document(post, category_names, tag_names):
+    """
+    Builds the search document of the post from its description, publisher and the given names without saving it.
+    The next save of the post stores this document instead of rebuilding it from the database.
+    """
+
+    post.search_document = build_search_document(post.description, post.published_by.username, category_names,
+                                                 tag_names)
+    post._search_document_built = True
+
+
+def refresh_search_documents(post_ids):
+    """ Rebuilds and stores the search documents of posts with given IDs in batches. """
+
+    from photogenie.models import UserPost
+
+    post_ids = list(post_ids)
+    for start in range(0, len(post_ids), SEARCH_REFRESH_BATCH_SIZE):
+        posts = list(
+            UserPost.objects.filter(pk__in=post_ids[start:start + SEARCH_REFRESH_BATCH_SIZE])
+            .select_related('published_by')
+            .prefetch_related('categories', 'tags')
+            .only('id', 'description', 'search_document', 'published_by__username')
+        )
+        for post in posts:
+            post.search_document = build_search_document(
+                post.description,
+                post.published_by.username,
+                [category.name for category in post.categories.all()],
+                [tag.name for tag in post.tags.all()],
+            )
+        UserPost.objects.bulk_update(posts, ['search_document'])
+
+
+def get_search_terms(query):
+    """ Returns the words of the search query, punctuation is ignored so user input cannot alter the query syntax. """
+
+    return SEARCH_TERM_PATTERN.findall(query)
+
+
+def search_posts(queryset, query):
+    """ Filters the queryset to posts matching every word of the query, ordered by relevance. """
+
+    terms = get_search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return _search_postgresql(queryset, terms)
+    if vendor == 'sqlite':
+        return _search_sqlite(queryset, terms)
+    for term in terms:
+        queryset = queryset.filter(search_document__icontains=term)
+    return queryset
+
+
+def is_ranked(queryset):
+    """ Returns whether the queryset holds search results ordered by their rank column. """
+
+    return 'rank' in queryset.query.annotations or 'rank' in queryset.query.extra
+
+
+def seek_ranked(queryset, rank, pk):
+    """ Filters ranked search results to those ordered after the result with given rank and primary key. """
+
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.filter(Q(rank__lt=rank) | Q(rank=rank, pk__gt=pk))
+    rank_column, id_column = f'bm25({SEARCH_FTS_TABLE})', f'{queryset.model._meta.db_table}.id'
+    return queryset.extra(where=[f'({rank_column} > %s OR ({rank_column} = %s AND {id_column} > %s))'],
+                          params=[rank, rank, pk])
+
+
+def get_search_vector():
+    """ Returns the tsvector expression that the GIN index of the search document is built on. """
+
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector('search_document', config=SEARCH_CONFIG)
+
+
+def install_sqlite_search_index(connection, posts_table='photogenie_userpost'):
+    """
+    Creates the FTS5 table and the triggers that keep it in sync with the posts table if any of them is missing,
+    rebuilding the index in that case. SQLite drops triggers whenever a migration rebuilds the posts table, so this
+    runs after every migration.
+    """
+
+    trigger_names = [f'{SEARCH_FTS_TABLE}_{action}' for action in SQLITE_TRIGGERS]
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(trigger_names))
+        cursor.execute(f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})",
+                       trigger_names)
+        if len(cursor.fetchall()) == len(trigger_names):
+            return
+
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_FTS_TABLE} USING fts5("
+            f"search_document, content='{posts_table}', content_rowid='id')"
+        )
+        for action, body in SQLITE_TRIGGERS.items():
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {SEARCH_FTS_TABLE}_{action} '
+                + body.format(posts=posts_table, fts=SEARCH_FTS_TABLE)
+            )
+        cursor.execute(f"INSERT INTO {SEARCH_FTS_TABLE}({SEARCH_FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_sqlite_search_index(connection):
+    """ Drops the FTS5 table and its triggers. """
+
+    with connection.cursor() as cursor:
+        for action in SQLITE_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {SEARCH_FTS_TABLE}_{action}')
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_FTS_TABLE}')
+
+
+def _search_postgresql(queryset, terms):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    search_query = SearchQuery(' '.join(terms), config=SEARCH_CONFIG, search_type='plain')
+    vector = get_search_vector()
+    return (
+        queryset.alias(search_vector=vector)
+        .annotate(rank=SearchRank(vector, search_query))
+        .filter(search_vector=search_query)
+        .order_by('-rank', 'pk')
+    )
+
+
+def _search_sqlite(queryset, terms):
+    table = queryset.model._meta.db_table
+    match = ' '.join(f'"{term}"' for term in terms)
+    return queryset.extra(
+        tables=[SEARCH_FTS_TABLE],
+        where=[f'{SEARCH_FTS_TABLE}.rowid = {table}.id', f'{SEARCH_FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={'rank': f'bm25({SEARCH_FTS_TABLE})'},
+        order_by=['rank', 'pk'],
+    )
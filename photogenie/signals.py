@@ -0,0 +1,214 @@
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from taggit.models import Tag
+
+from authentication.models import User
+from photogenie.catalogue import invalidate_category_catalogue
+from photogenie.constants import FACETS
+from photogenie.facets import adjust_facet_counts, create_facet_counts, get_facet_links, uncount_post_links
+from photogenie.models import Category, UserPost
+from photogenie.renditions import delete_renditions_on_commit
+from photogenie.responses import invalidate_responses
+from photogenie.search import install_sqlite_search_index, refresh_search_documents
+
+SEARCH_DOCUMENT_SOURCE_FIELDS = {'description', 'published_by', 'published_by_id'}
+PUBLISHER_FIELDS = {'username'}
+RELATION_FACETS = {UserPost.categories.through: 'categories', UserPost.tags.through: 'tags'}
+
+
+def restore_sqlite_search_index(sender, using, plan=None, **kwargs):
+    """ Recreates the SQLite full-text index triggers that migrations rebuilding the posts table have dropped. """
+
+    connection = connections[using]
+    applied = plan is None or any(migration.app_label == 'photogenie' for migration, _ in plan)
+    if connection.vendor == 'sqlite' and applied and 'photogenie_userpost' in connection.introspection.table_names():
+        install_sqlite_search_index(connection)
+
+
+@receiver(post_save, sender=UserPost)
+def refresh_post_search_document(sender, instance, update_fields=None, **kwargs):
+    """
+    Rebuilds the search document of a saved post unless none of its searchable fields were saved, or the document
+    was built along with the save by set_search_document.
+    """
+
+    if instance.__dict__.pop('_search_document_built', False):
+        return
+    if update_fields is None or SEARCH_DOCUMENT_SOURCE_FIELDS.intersection(update_fields):
+        refresh_search_documents([instance.pk])
+
+
+@receiver(m2m_changed, sender=UserPost.categories.through)
+@receiver(m2m_changed, sender=UserPost.tags.through)
+def refresh_search_documents_on_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Rebuilds the search documents of posts whose categories or tags were changed. """
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, UserPost):
+        refresh_search_documents([instance.pk])
+    elif reverse and isinstance(instance, Category):
+        if action == 'post_clear':
+            pk_set = instance._search_post_ids
+        refresh_search_documents(pk_set or [])
+
+
+@receiver(m2m_changed, sender=UserPost.categories.through)
+def remember_category_posts_before_clear(sender, instance, action, reverse, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._search_post_ids = list(instance.userpost_set.values_list('pk', flat=True))
+
+
+def get_name_field(model):
+    return 'username' if model is User else 'name'
+
+
+@receiver(post_init, sender=Category)
+@receiver(post_init, sender=Tag)
+@receiver(post_init, sender=User)
+def remember_saved_name(sender, instance, **kwargs):
+    """ Remembers the name a category, tag or user was loaded with, unless the name was deferred. """
+
+    instance._saved_name = instance.__dict__.get(get_name_field(sender))
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=User)
+def detect_rename(sender, instance, update_fields=None, **kwargs):
+    """
+    Marks a category, tag or user whose save writes a name other than the one it was loaded or last saved with.
+    Instances that were not loaded from the database may rename an existing row and are marked as well.
+    """
+
+    name_field = get_name_field(sender)
+    name_saved = name_field in instance.__dict__ and (update_fields is None or name_field in update_fields)
+    instance._renamed = name_saved and (
+        instance._state.adding or instance.__dict__[name_field] != instance._saved_name
+    )
+    if name_saved:
+        instance._saved_name = instance.__dict__[name_field]
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=User)
+def refresh_search_documents_on_rename(sender, instance, created, **kwargs):
+    """ Rebuilds the search documents of posts that show the name of a renamed category, tag or user. """
+
+    if not created and getattr(instance, '_renamed', False):
+        refresh_search_documents(get_related_post_ids(instance))
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Tag)
+def remember_posts_before_delete(sender, instance, **kwargs):
+    instance._search_post_ids = list(get_related_post_ids(instance))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def refresh_search_documents_on_delete(sender, instance, **kwargs):
+    """ Rebuilds the search documents of posts that lost a deleted category or tag. """
+
+    refresh_search_documents(getattr(instance, '_search_post_ids', []))
+
+
+def get_related_post_ids(instance):
+    """ Returns the IDs of posts that are linked to the given category, tag or user. """
+
+    if isinstance(instance, Category):
+        posts = UserPost.objects.filter(categories=instance)
+    elif isinstance(instance, Tag):
+        posts = UserPost.objects.filter(tags=instance)
+    else:
+        posts = UserPost.objects.filter(published_by=instance)
+    return posts.values_list('pk', flat=True)
+
+
+@receiver(post_save, sender=UserPost)
+@receiver(post_delete, sender=UserPost)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_responses_on_change(sender, **kwargs):
+    """ Invalidates cached post responses when a post, category or tag is saved or deleted. """
+
+    invalidate_responses()
+
+
+@receiver(m2m_changed, sender=UserPost.categories.through)
+@receiver(m2m_changed, sender=UserPost.tags.through)
+def invalidate_responses_on_relation_change(sender, action, **kwargs):
+    """ Invalidates cached post responses when categories or tags of posts are changed. """
+
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_responses()
+
+
+@receiver(post_save, sender=User)
+def invalidate_responses_on_publisher_change(sender, instance, created, update_fields=None, **kwargs):
+    """ Invalidates cached post responses when a user shown as publisher of posts is changed. """
+
+    if created or (update_fields is not None and not PUBLISHER_FIELDS.intersection(update_fields)):
+        return
+    invalidate_responses()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_catalogue_on_change(sender, **kwargs):
+    """ Outdates the cached category catalogue when a category is saved or deleted. """
+
+    invalidate_category_catalogue()
+
+
+@receiver(m2m_changed, sender=UserPost.categories.through)
+@receiver(m2m_changed, sender=UserPost.tags.through)
+def count_facets_on_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keeps the post counts of categories and tags in step with links added through or removed through the related
+    managers. Removed links are counted before they are deleted, since only those that exist are taken off.
+    """
+
+    facet = RELATION_FACETS[sender]
+    if not reverse and isinstance(instance, UserPost):
+        if action == 'post_add':
+            adjust_facet_counts(facet, dict.fromkeys(pk_set, 1))
+        elif action in ('pre_remove', 'pre_clear'):
+            uncount_post_links(facet, instance.pk, pk_set if action == 'pre_remove' else None)
+    elif reverse and isinstance(instance, Category):
+        if action == 'post_add':
+            adjust_facet_counts(facet, {instance.pk: len(pk_set)})
+        elif action in ('pre_remove', 'pre_clear'):
+            links, post_column, value_column = get_facet_links(facet)
+            links = links.filter(**{value_column: instance.pk})
+            if action == 'pre_remove':
+                links = links.filter(**{f'{post_column}__in': pk_set})
+            adjust_facet_counts(facet, {instance.pk: -links.count()})
+
+
+@receiver(pre_delete, sender=UserPost)
+def uncount_facets_of_deleted_post(sender, instance, **kwargs):
+    """ Takes a deleted post off the post counts of its categories and tags, whose links are deleted with it. """
+
+    for facet in FACETS:
+        uncount_post_links(facet, instance.pk)
+
+
+@receiver(pre_delete, sender=UserPost)
+def delete_renditions_of_deleted_post(sender, instance, **kwargs):
+    """ Deletes the rendition files of a deleted post once its deletion commits. """
+
+    delete_renditions_on_commit(instance.renditions, instance.image.storage)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def create_facet_counts_on_create(sender, instance, created, **kwargs):
+    """ Creates the post count of a new category or tag. """
+
+    if created:
+        create_facet_counts('categories' if sender is Category else 'tags', [instance.pk])
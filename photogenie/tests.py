@@ -1,11 +1,59 @@
-from rest_framework.test import APITestCase
+import gzip
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from threading import Thread
+from unittest import mock
+from uuid import UUID
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.checks import run_checks
+from django.core.management import CommandError, call_command
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import DatabaseError, connection, connections
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from PIL import Image
 from rest_framework import status
-from photogenie.models import Category
+from taggit.models import Tag, TaggedItem
+from authentication.api.authentication import cache_user
+from authentication.api.views import LoginAPIView, SignupAPIView
+from photogenie.api.views import DownloadImageView, UserPostViewSet
+from photogenie import compression
+from photogenie.api.renderers import FastJSONRenderer
+from photogenie.benchmarks import seed_dataset
+from photogenie.budgets import QueryBudgetExceeded, get_query_budget
+from photogenie.catalogue import get_category_catalogue
+from photogenie.metrics import Histogram, registry
+from photogenie.counters import (CacheCounterBuffer, LocalCounterBuffer, flush_counters, flush_counters_at_exit,
+                                 get_counter_buffer, increment_counter)
+from photogenie.responses import get_response_cache
+from photogenie.plans import QueryPlanProblem, analyze_tables, check_query_plans
+from photogenie.routers import ReplicaRouter, get_sticky_cache, stick_to_primary
+from photogenie.search import search_posts
+from photogenie.transfer import export_posts
+from photogenie.models import Category, CategoryPostCount, TagPostCount
 from photogenie.api.serializers import CategorySerializer
+from photogenie.api.utils import bulk_add_categories, set_post_tags
 from django.urls import reverse
 from authentication.models import User
+from authentication.utils import get_user_tokens
+from drf_project.caches import CacheGeneration
 from photogenie.models import UserPost
-from photogenie.api.serializers import PostSerializer
+from photogenie.api.serializers import PostRowSerializer, PostSerializer
 
 
 class CategoryViewSetTestCase(APITestCase):
@@ -55,6 +103,7 @@ class UserPostTestCase(APITestCase):
     def setUp(self):
         """ Creates sample UserPost objects for testing """
 
+        self.addCleanup(get_counter_buffer().drain)
         self.first_user = User.objects.create(username='first_user', password='password1')
         self.second_user = User.objects.create(username='second_user', password='password2')
 
@@ -237,6 +286,7 @@ class UserPostTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response['Content-Type'], 'image/*')
         self.assertEqual(response['Content-Disposition'], f'attachment; filename="{self.first_post.image.name}"')
+        flush_counters()
         self.first_post.refresh_from_db()
         self.assertEqual(self.first_post.downloads, current_downloads + 1)
 
@@ -251,3 +301,2374 @@ class UserPostTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         self.first_post.refresh_from_db()
         self.assertEqual(self.first_post.downloads, current_downloads)
+
+
+@override_settings(POST_COUNTER_FLUSH_THRESHOLD=10 ** 6, POST_COUNTER_FLUSH_INTERVAL=10 ** 6)
+class PostCounterTestCase(TestCase):
+    """ Test cases for buffered view and download counters of UserPost """
+
+    thread_count = 20
+    increments_per_thread = 250
+
+    def setUp(self):
+        """ Creates a sample post whose counters are incremented """
+
+        user = User.objects.create(username='counter_user', password='password1')
+        self.post = UserPost.objects.create(published_by=user, description='Counter post', image='images/messi.jpg',
+                                            views=3, downloads=1)
+
+    def run_threads(self, target):
+        threads = [Thread(target=target) for _ in range(self.thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_increments_are_not_written_before_flush(self):
+        """ Tests that the database row is untouched until the buffer is flushed """
+
+        increment_counter(self.post.id, 'views')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 3)
+
+        flush_counters()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 4)
+
+    def test_flush_is_a_single_query(self):
+        """ Tests that increments of both counters for many posts are written in one query """
+
+        other_post = UserPost.objects.create(published_by=self.post.published_by, description='Other post',
+                                             image='images/superman.jpg')
+        increment_counter(self.post.id, 'views')
+        increment_counter(self.post.id, 'downloads', 2)
+        increment_counter(other_post.id, 'views', 5)
+
+        with self.assertNumQueries(1):
+            flush_counters()
+
+        self.post.refresh_from_db()
+        other_post.refresh_from_db()
+        self.assertEqual((self.post.views, self.post.downloads), (4, 3))
+        self.assertEqual((other_post.views, other_post.downloads), (5, 0))
+
+    def test_concurrent_increments_are_not_lost(self):
+        """ Tests that increments from many threads hitting the same post all reach the database """
+
+        def hit_post():
+            for _ in range(self.increments_per_thread):
+                increment_counter(self.post.id, 'views')
+                increment_counter(self.post.id, 'downloads')
+
+        self.run_threads(hit_post)
+        flush_counters()
+
+        self.post.refresh_from_db()
+        expected = self.thread_count * self.increments_per_thread
+        self.assertEqual(self.post.views, 3 + expected)
+        self.assertEqual(self.post.downloads, 1 + expected)
+
+    def test_concurrent_drains_do_not_lose_increments(self):
+        """ Tests that draining the buffer while other threads increment it keeps every increment """
+
+        buffer = LocalCounterBuffer(flush_threshold=10 ** 6, flush_interval=10 ** 6)
+        drained = []
+
+        def hit_post():
+            for number in range(self.increments_per_thread):
+                buffer.increment(self.post.id, 'views')
+                if number % 50 == 0:
+                    drained.append(buffer.drain())
+
+        self.run_threads(hit_post)
+        drained.append(buffer.drain())
+
+        total = sum(batch.get('views', {}).get(self.post.id, 0) for batch in drained)
+        self.assertEqual(total, self.thread_count * self.increments_per_thread)
+
+    def test_cache_buffer_flushes_closed_buckets(self):
+        """ Tests that the cache backed buffer writes only buckets that are no longer incremented """
+
+        buffer = CacheCounterBuffer(flush_interval=10)
+        with mock.patch.object(CacheCounterBuffer, '_bucket', return_value=100):
+            self.run_threads(lambda: [buffer.increment(self.post.id, 'views') for _ in range(10)])
+            buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 3)
+
+        with mock.patch.object(CacheCounterBuffer, '_bucket', return_value=101):
+            buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 3 + self.thread_count * 10)
+
+    def test_unknown_field(self):
+        """ Tests that only views and downloads can be incremented """
+
+        with self.assertRaises(ValueError):
+            increment_counter(self.post.id, 'description')
+
+    @override_settings(POST_COUNTER_BUFFER='photogenie.counters.CacheCounterBuffer')
+    def test_flush_command(self):
+        """ Tests that the management command writes the increments buffered in the cache """
+
+        with mock.patch.object(CacheCounterBuffer, '_bucket', return_value=100):
+            increment_counter(self.post.id, 'downloads', 4)
+        with mock.patch.object(CacheCounterBuffer, '_bucket', return_value=101):
+            call_command('flush_post_counters', stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.downloads, 5)
+
+    def test_flush_command_needs_cache_buffer(self):
+        """ Tests that the management command refuses to flush the buffer local to its own process """
+
+        increment_counter(self.post.id, 'downloads', 4)
+        self.addCleanup(get_counter_buffer().drain)
+
+        with self.assertRaises(CommandError):
+            call_command('flush_post_counters', stdout=StringIO())
+
+    def test_local_buffer_is_flushed_at_exit(self):
+        """ Tests that increments left in the local buffer are written when the process exits """
+
+        increment_counter(self.post.id, 'views', 2)
+        flush_counters_at_exit()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 5)
+        self.assertEqual(get_counter_buffer().pending, 0)
+
+
+class TemporaryMediaMixin:
+    """ Points media storage to a temporary directory that is removed after each test """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+def create_image_file(name='photo.png', size=(40, 30), image_format='PNG'):
+    """ Returns an uploadable in-memory image of given size and format. """
+
+    content = BytesIO()
+    Image.new('RGB', size, 'green').save(content, image_format)
+    return SimpleUploadedFile(name, content.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class ImageMetadataTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for image metadata stored on UserPost at upload time """
+
+    def setUp(self):
+        """ Creates a sample user """
+
+        super().setUp()
+
+        self.user = User.objects.create(username='photographer', password='password1')
+        self.category = Category.objects.create(name='nature')
+
+    def test_create_stores_metadata(self):
+        """ Tests that creating a post stores width, height, byte size and format of the image """
+
+        self.client.force_authenticate(user=self.user)
+        image = create_image_file(size=(40, 30))
+        data = {'description': 'Landscape', 'categories[0]': self.category.id, 'tags': '["green"]', 'image': image}
+
+        response = self.client.post(reverse('userpost-list'), data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        post = UserPost.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (40, 30))
+        self.assertEqual(post.image_size, image.size)
+        self.assertEqual(post.image_format, 'PNG')
+
+    def test_update_stores_metadata(self):
+        """ Tests that replacing the image of a post refreshes its stored metadata """
+
+        post = UserPost(published_by=self.user, description='Portrait', image=create_image_file(size=(10, 10)))
+        post.set_image_metadata()
+        post.save()
+
+        self.client.force_authenticate(user=self.user)
+        data = {'description': 'Portrait', 'categories[0]': self.category.id, 'tags': '["blue"]',
+                'image': create_image_file(name='new.jpg', size=(64, 48), image_format='JPEG')}
+        response = self.client.put(reverse('userpost-detail', kwargs={'pk': post.id}), data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height, post.image_format), (64, 48, 'JPEG'))
+
+    def test_dimensions_do_not_open_the_file(self):
+        """ Tests that dimensions are built from stored metadata once they are available """
+
+        post = UserPost.objects.create(published_by=self.user, description='Missing file', image='images/gone.png',
+                                       image_width=800, image_height=600)
+
+        self.assertEqual(post.dimensions, '600x800')
+
+    def test_backfill_command(self):
+        """ Tests that the backfill command stores metadata of existing posts and reports missing files """
+
+        stored = UserPost(published_by=self.user, description='Stored', image=create_image_file(size=(20, 15)))
+        stored.save()
+        missing = UserPost.objects.create(published_by=self.user, description='Missing', image='images/gone.png')
+
+        stderr = StringIO()
+        call_command('backfill_image_metadata', batch_size=1, stdout=StringIO(), stderr=stderr)
+
+        stored.refresh_from_db()
+        missing.refresh_from_db()
+        self.assertEqual((stored.image_width, stored.image_height, stored.image_format), (20, 15, 'PNG'))
+        self.assertIsNone(missing.image_width)
+        self.assertIn(f'Post {missing.id}', stderr.getvalue())
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'PAGE_SIZE': 3})
+class KeysetPaginationTestCase(APITestCase):
+    """ Test cases for cursor pagination of the user posts list """
+
+    def setUp(self):
+        """ Creates posts with repeated view counts so that ordering ties have to be broken by ID """
+
+        self.user = User.objects.create(username='keyset_user', password='password1')
+        self.other_user = User.objects.create(username='other_user', password='password2')
+        self.category = Category.objects.create(name='street')
+        self.posts = []
+        for number in range(8):
+            post = UserPost.objects.create(
+                published_by=self.user if number % 2 else self.other_user,
+                description=f'Post {number}',
+                image='images/messi.jpg',
+                views=number % 3,
+                downloads=8 - number,
+            )
+            if number % 2:
+                post.categories.add(self.category)
+            self.posts.append(post)
+
+    def collect_pages(self, params):
+        """ Follows next links from the first page and returns the IDs of all posts along with the page count """
+
+        ids, pages = [], 0
+        url = reverse('userpost-list')
+        params = {**params, 'pagination': 'cursor'}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(post['id'] for post in response.data['results'])
+            url, params = response.data['next'], None
+            pages += 1
+        return ids, pages
+
+    def test_default_ordering(self):
+        """ Tests that cursor pages follow the publishing order without repeating or skipping posts """
+
+        ids, pages = self.collect_pages({})
+
+        self.assertEqual(ids, [post.id for post in self.posts])
+        self.assertEqual(pages, 3)
+
+    def test_ordering_with_ties(self):
+        """ Tests that posts with the same view count are neither repeated nor skipped across pages """
+
+        ids, _ = self.collect_pages({'ordering': 'views'})
+
+        expected = sorted(self.posts, key=lambda post: (post.views, post.id))
+        self.assertEqual(ids, [post.id for post in expected])
+
+    def test_filters(self):
+        """ Tests that cursor pagination keeps the published by and category filters """
+
+        ids, _ = self.collect_pages({'published_by': self.user.username, 'ordering': 'downloads'})
+        user_posts = [post for post in self.posts if post.published_by == self.user]
+        expected = sorted(user_posts, key=lambda post: post.downloads)
+        self.assertEqual(ids, [post.id for post in expected])
+
+        ids, _ = self.collect_pages({'category': self.category.name})
+        self.assertEqual(ids, [post.id for post in self.posts if post.published_by == self.user])
+
+    def test_search(self):
+        """ Tests that cursor pagination keeps the search filter """
+
+        ids, _ = self.collect_pages({'search': self.other_user.username})
+
+        self.assertEqual(ids, [post.id for post in self.posts if post.published_by == self.other_user])
+
+    def test_search_rank(self):
+        """ Tests that cursor pages of search results follow their rank without repeating or skipping posts """
+
+        for number in range(7):
+            UserPost.objects.create(published_by=self.user, description=' '.join(['heron'] * (number % 3 + 1)),
+                                    image='images/messi.jpg')
+        expected = list(search_posts(UserPost.objects.all(), 'heron').values_list('id', flat=True))
+
+        for row_serializer in (True, False):
+            with self.settings(POST_ROW_SERIALIZER_ENABLED=row_serializer):
+                ids, pages = self.collect_pages({'search': 'heron'})
+            self.assertEqual(ids, expected)
+            self.assertEqual(pages, 3)
+
+    def test_invalid_cursor(self):
+        """ Tests that a tampered cursor is rejected with 404 Not Found """
+
+        response = self.client.get(reverse('userpost-list'), {'pagination': 'cursor', 'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PostSearchTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for full-text search over the search documents of posts """
+
+    def setUp(self):
+        """ Creates posts whose words are spread over description, tags, categories and usernames """
+
+        super().setUp()
+        self.user = User.objects.create(username='lens_master', password='password1')
+        self.other_user = User.objects.create(username='wanderer', password='password2')
+        self.mountains = Category.objects.create(name='mountains')
+        self.sea = Category.objects.create(name='sea')
+
+        self.sunset_post = UserPost.objects.create(published_by=self.user, description='Sunset over the alps',
+                                                   image='images/messi.jpg')
+        self.sunset_post.categories.add(self.mountains, self.sea)
+        self.sunset_post.tags.add('golden hour', 'sunset')
+
+        self.beach_post = UserPost.objects.create(published_by=self.other_user, description='Quiet beach morning',
+                                                  image='images/superman.jpg')
+        self.beach_post.categories.add(self.sea)
+        self.beach_post.tags.add('sunset')
+
+    def search(self, query):
+        response = self.client.get(reverse('userpost-list'), {'search': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['id'] for post in response.data['results']]
+
+    def test_search_fields(self):
+        """ Tests that description, tags, categories and usernames are all searchable """
+
+        self.assertEqual(self.search('alps'), [self.sunset_post.id])
+        self.assertEqual(self.search('golden'), [self.sunset_post.id])
+        self.assertEqual(self.search('mountains'), [self.sunset_post.id])
+        self.assertEqual(self.search('wanderer'), [self.beach_post.id])
+        self.assertEqual(self.search('lens_master'), [self.sunset_post.id])
+
+    def test_no_duplicates(self):
+        """ Tests that a post matching through several categories is returned once """
+
+        self.assertEqual(sorted(self.search('sea')), sorted([self.sunset_post.id, self.beach_post.id]))
+
+    def test_ranking(self):
+        """ Tests that the post mentioning the terms more often is ranked first """
+
+        self.assertEqual(self.search('sunset'), [self.sunset_post.id, self.beach_post.id])
+
+    def test_all_terms_required(self):
+        """ Tests that every word of the query has to match """
+
+        self.assertEqual(self.search('sunset beach'), [self.beach_post.id])
+        self.assertEqual(self.search('alps beach'), [])
+
+    def test_query_syntax_is_ignored(self):
+        """ Tests that operators of the search engine in user input are treated as plain words """
+
+        self.assertEqual(self.search('alps" OR "beach'), [])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_document_follows_changes(self):
+        """ Tests that renaming or removing categories and tags updates the search results """
+
+        self.mountains.name = 'peaks'
+        self.mountains.save()
+        self.assertEqual(self.search('peaks'), [self.sunset_post.id])
+        self.assertEqual(self.search('mountains'), [])
+
+        self.sunset_post.tags.remove('golden hour')
+        self.assertEqual(self.search('golden'), [])
+
+        self.sea.delete()
+        self.assertEqual(self.search('sea'), [])
+
+        self.sunset_post.description = 'Dawn over the fjords'
+        self.sunset_post.save()
+        self.assertEqual(self.search('fjords'), [self.sunset_post.id])
+
+    def test_deleted_posts_are_not_found(self):
+        """ Tests that deleting a post removes it from the search index """
+
+        self.beach_post.delete()
+
+        self.assertEqual(list(search_posts(UserPost.objects.all(), 'wanderer')), [])
+
+    def test_saving_without_rename_keeps_documents(self):
+        """ Tests that saving a user, category or tag refreshes search documents only when its name changed """
+
+        tag = Tag.objects.get(name='sunset')
+        with mock.patch('photogenie.signals.refresh_search_documents') as refresh:
+            self.user.save()
+            User.objects.get(pk=self.user.pk).save()
+            self.mountains.save()
+            tag.save()
+            self.user.first_name = 'Lens'
+            self.user.save()
+        refresh.assert_not_called()
+
+        self.user.username = 'shutterbug'
+        self.user.save()
+        self.assertEqual(self.search('shutterbug'), [self.sunset_post.id])
+
+        self.user.username = 'lens_master'
+        self.user.save(update_fields=['first_name'])
+        self.assertEqual(self.search('lens_master'), [])
+
+    def test_create_builds_document_once(self):
+        """ Tests that a post created through the API is indexed with its relations without refreshing the document """
+
+        self.client.force_authenticate(user=self.user)
+        data = {'description': 'Misty valley', 'categories[0]': self.mountains.id, 'tags': '["fog"]',
+                'image': create_image_file()}
+
+        with mock.patch('photogenie.signals.refresh_search_documents') as refresh:
+            response = self.client.post(reverse('userpost-list'), data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        refresh.assert_not_called()
+        post = UserPost.objects.get(description='Misty valley')
+        for query in ('misty', 'lens_master', 'mountains', 'fog'):
+            self.assertIn(post.id, self.search(query))
+
+    def test_update_builds_document(self):
+        """ Tests that a post updated through the API is indexed with its new relations without a refresh """
+
+        self.client.force_authenticate(user=self.user)
+        data = {'description': 'Storm over the alps', 'categories[0]': self.sea.id, 'tags': '["thunder"]',
+                'image': create_image_file()}
+        url = reverse('userpost-detail', kwargs={'pk': self.sunset_post.id})
+
+        with mock.patch('photogenie.signals.refresh_search_documents') as refresh:
+            response = self.client.put(url, data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        refresh.assert_not_called()
+        self.assertEqual(self.search('storm thunder sea lens_master'), [self.sunset_post.id])
+        self.assertEqual(self.search('golden'), [])
+        self.assertEqual(self.search('mountains'), [])
+
+
+@override_settings(POST_RENDITION_SIZES=(16, 64), POST_RENDITION_RUNNER='photogenie.renditions.run_inline')
+class RenditionTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for downscaled renditions generated for uploaded images """
+
+    def setUp(self):
+        """ Creates a sample user and category """
+
+        super().setUp()
+
+        self.addCleanup(get_counter_buffer().drain)
+        self.user = User.objects.create(username='renderer', password='password1')
+        self.category = Category.objects.create(name='portraits')
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, size, image_format='PNG'):
+        """ Creates a post through the API, running the commit hooks that generate renditions """
+
+        data = {'description': 'Rendered', 'categories[0]': self.category.id, 'tags': '["render"]',
+                'image': create_image_file(size=size, image_format=image_format)}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('userpost-list'), data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return UserPost.objects.latest('id')
+
+    def test_renditions_are_generated(self):
+        """ Tests that every rendition smaller than the original is stored with its dimensions """
+
+        post = self.upload((100, 50))
+
+        self.assertEqual(set(post.renditions), {'16', '64'})
+        self.assertEqual((post.renditions['64']['width'], post.renditions['64']['height']), (64, 32))
+        self.assertEqual((post.renditions['16']['width'], post.renditions['16']['height']), (16, 8))
+        with post.image.storage.open(post.renditions['16']['name']) as file, Image.open(file) as image:
+            self.assertEqual((image.size, image.format), ((16, 8), 'PNG'))
+
+    def test_larger_sizes_are_skipped(self):
+        """ Tests that no rendition is generated for sizes the original image already fits in """
+
+        post = self.upload((40, 30), image_format='JPEG')
+
+        self.assertEqual(set(post.renditions), {'16'})
+
+    def test_rendition_urls(self):
+        """ Tests that the post payload carries the URLs of renditions """
+
+        post = self.upload((100, 50))
+
+        response = self.client.get(reverse('userpost-detail', kwargs={'pk': post.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['renditions']['64'].endswith(post.renditions['64']['name']))
+
+    def test_download_rendition(self):
+        """ Tests that a requested size is served from the rendition """
+
+        post = self.upload((100, 50))
+        url = reverse('download-image', kwargs={'pk': post.id})
+
+        response = self.client.get(url, {'size': 16})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['dimensions'], '8x16')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (16, 8))
+
+    def test_download_invalid_size(self):
+        """ Tests that sizes which are not configured are rejected """
+
+        post = self.upload((100, 50))
+
+        response = self.client.get(reverse('download-image', kwargs={'pk': post.id}), {'size': 32})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_generate_command(self):
+        """ Tests that the management command generates renditions of posts that have none """
+
+        post = UserPost.objects.create(published_by=self.user, description='Old upload',
+                                       image=create_image_file(size=(100, 50)))
+
+        call_command('generate_renditions', stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(set(post.renditions), {'16', '64'})
+
+    def test_image_update_drops_renditions(self):
+        """ Tests that replacing the image drops the previous renditions and deletes their files on commit """
+
+        post = self.upload((100, 50))
+        names = [rendition['name'] for rendition in post.renditions.values()]
+        data = {'description': 'Replaced', 'categories[0]': self.category.id, 'tags': '["render"]',
+                'image': create_image_file(size=(80, 40))}
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.put(reverse('userpost-detail', kwargs={'pk': post.id}), data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        post.refresh_from_db()
+        self.assertEqual(post.renditions, {})
+        self.assertEqual(self.client.get(reverse('userpost-detail', kwargs={'pk': post.id})).data['renditions'], {})
+        self.assertTrue(all(post.image.storage.exists(name) for name in names))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(any(post.image.storage.exists(name) for name in names))
+        post.refresh_from_db()
+        self.assertEqual(set(post.renditions), {'16', '64'})
+
+    def test_delete_removes_rendition_files(self):
+        """ Tests that the rendition files of a deleted post are deleted once the deletion commits """
+
+        post = self.upload((100, 50))
+        names = [rendition['name'] for rendition in post.renditions.values()]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('userpost-detail', kwargs={'pk': post.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(any(post.image.storage.exists(name) for name in names))
+
+    def test_generation_waits_for_commit(self):
+        """ Tests that renditions are not generated inside the upload transaction """
+
+        data = {'description': 'Deferred', 'categories[0]': self.category.id, 'tags': '["render"]',
+                'image': create_image_file(size=(100, 50))}
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.client.post(reverse('userpost-list'), data, format='multipart')
+
+        self.assertEqual(UserPost.objects.get().renditions, {})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(set(UserPost.objects.get().renditions), {'16', '64'})
+
+
+class ImageDownloadTestCase(TemporaryMediaMixin, APITestCase):
+    """ Provides a stored sample image and its post for download test cases """
+
+    def setUp(self):
+        """ Stores a sample image in a temporary media directory and creates its post """
+
+        super().setUp()
+        self.addCleanup(get_counter_buffer().drain)
+
+        self.user = User.objects.create(username='downloader', password='password1')
+        self.post = UserPost(published_by=self.user, description='Download me', image=create_image_file())
+        self.post.set_image_metadata()
+        self.post.save()
+        with self.post.image.open('rb'):
+            self.content = self.post.image.read()
+
+        self.url = reverse('download-image', kwargs={'pk': self.post.id})
+        self.client.force_authenticate(user=self.user)
+
+    def downloads(self):
+        flush_counters()
+        self.post.refresh_from_db()
+        return self.post.downloads
+
+
+class ConditionalDownloadTestCase(ImageDownloadTestCase):
+    """ Test cases for ETag, conditional and byte range handling of image downloads """
+
+    def test_full_download_validators(self):
+        """ Tests that a full download carries a content hash ETag, Last-Modified and Accept-Ranges """
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{self.post.image_hash}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(self.downloads(), 1)
+
+    def test_if_none_match(self):
+        """ Tests that a matching ETag is answered with 304 which does not count as a download """
+
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.downloads(), 1)
+
+    def test_if_modified_since(self):
+        """ Tests that an unchanged Last-Modified is answered with 304 """
+
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range(self):
+        """ Tests that byte ranges are answered with 206 and only ranges from the first byte are counted """
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[:10])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:])
+        self.assertEqual(self.downloads(), 1)
+
+    def test_suffix_range(self):
+        """ Tests that a suffix range serves the last bytes of the file """
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+    def test_unsatisfiable_range(self):
+        """ Tests that a range beyond the end of the file is answered with 416 """
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+        self.assertEqual(self.downloads(), 0)
+
+    def test_if_range_mismatch(self):
+        """ Tests that a range for an outdated representation is answered with the whole file """
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-', HTTP_IF_RANGE='"outdated"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_hash_of_older_posts(self):
+        """ Tests that the content hash of posts stored without one is computed and stored on first download """
+
+        UserPost.objects.filter(pk=self.post.pk).update(image_hash='')
+
+        with mock.patch('photogenie.signals.invalidate_responses') as invalidate_responses:
+            response = self.client.get(self.url)
+
+        self.post.refresh_from_db()
+        self.assertEqual(response['ETag'], f'"{self.post.image_hash}"')
+        self.assertEqual(len(self.post.image_hash), 64)
+        invalidate_responses.assert_not_called()
+
+
+class OffloadedDownloadTestCase(ImageDownloadTestCase):
+    """ Test cases for download backends that let the front-end server send the file """
+
+    def test_x_accel_redirect(self):
+        """ Tests that nginx is pointed at the internal location of the image and the download is counted """
+
+        with self.settings(POST_DOWNLOAD_BACKEND='photogenie.downloads.XAccelRedirectBackend',
+                           POST_DOWNLOAD_ACCEL_PREFIX='/internal/'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal/{self.post.image.name}')
+        self.assertEqual(response['ETag'], f'"{self.post.image_hash}"')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.downloads(), 1)
+
+    def test_x_sendfile(self):
+        """ Tests that the web server is pointed at the absolute path of the image """
+
+        with self.settings(POST_DOWNLOAD_BACKEND='photogenie.downloads.XSendfileBackend'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Sendfile'], self.post.image.path)
+        self.assertEqual(self.downloads(), 1)
+
+    def test_offloaded_conditional_and_resumed_requests(self):
+        """ Tests that revalidations and resumed ranges of offloaded downloads are not counted """
+
+        with self.settings(POST_DOWNLOAD_BACKEND='photogenie.downloads.XAccelRedirectBackend'):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.post.image_hash}"')
+            resumed = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('X-Accel-Redirect', resumed)
+        self.assertEqual(self.downloads(), 0)
+
+
+class BulkPostCreateTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for creating many posts in one request """
+
+    def setUp(self):
+        """ Creates a sample user and categories """
+
+        super().setUp()
+
+        self.user = User.objects.create(username='importer', password='password1')
+        ContentType.objects.get_for_model(UserPost)
+        self.categories = [Category.objects.create(name=f'category {number}') for number in range(3)]
+        self.url = reverse('userpost-bulk-create')
+        self.client.force_authenticate(user=self.user)
+
+    def post_items(self, items):
+        images = [create_image_file(f'{index}.png') for index in range(len(items))]
+        data = {'items': json.dumps(items), 'images': images}
+        return self.client.post(self.url, data, format='multipart')
+
+    def make_items(self, count):
+        return [
+            {
+                'description': f'Shot {number}',
+                'categories': [category.id for category in self.categories],
+                'tags': [f'tag{number}', 'shared'],
+            }
+            for number in range(count)
+        ]
+
+    def test_bulk_create(self):
+        """ Tests that every item is created with its categories, tags, image metadata and search document """
+
+        response = self.post_items(self.make_items(3))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ids = [result['id'] for result in response.data['results']]
+        posts = UserPost.objects.filter(id__in=ids).order_by('id')
+        self.assertEqual(len(posts), 3)
+        for number, post in enumerate(posts):
+            self.assertEqual(post.published_by, self.user)
+            self.assertEqual(set(post.categories.all()), set(self.categories))
+            self.assertEqual(set(post.tags.names()), {f'tag{number}', 'shared'})
+            self.assertEqual(post.image_format, 'PNG')
+        self.assertEqual(list(search_posts(UserPost.objects.all(), 'tag1')), [posts[1]])
+
+    def test_per_item_errors(self):
+        """ Tests that invalid items are reported while the valid ones are created """
+
+        items = self.make_items(3)
+        del items[1]['description']
+        items[2]['categories'] = [self.categories[0].id, 404]
+
+        response = self.post_items(items)
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        first, second, third = response.data['results']
+        self.assertIn('id', first)
+        self.assertIn('description', second['errors'])
+        self.assertIn('categories', third['errors'])
+        self.assertEqual(UserPost.objects.count(), 1)
+
+    def test_images_must_match_items(self):
+        """ Tests that the request is rejected when items and images do not line up """
+
+        data = {'items': json.dumps(self.make_items(2)), 'images': [create_image_file()]}
+
+        response = self.client.post(self.url, data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(UserPost.objects.exists())
+
+    def test_unauthenticated(self):
+        """ Tests that bulk creation requires authentication """
+
+        self.client.force_authenticate(user=None)
+
+        response = self.post_items(self.make_items(1))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_query_count_is_flat(self):
+        """ Tests that the number of queries does not grow with the number of posts, categories and tags """
+
+        query_counts = []
+        for count in (2, 20):
+            with CaptureQueriesContext(connection) as context:
+                response = self.post_items(self.make_items(count))
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+
+class PostRelationWriteTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for writing categories and tags of a post """
+
+    def setUp(self):
+        """ Creates a sample user, categories and post """
+
+        super().setUp()
+
+        self.user = User.objects.create(username='curator', password='password1')
+        ContentType.objects.get_for_model(UserPost)
+        self.categories = [Category.objects.create(name=f'category {number}') for number in range(20)]
+        self.post = UserPost(published_by=self.user, description='Harbour', image=create_image_file())
+        self.post.set_image_metadata()
+        self.post.save()
+        self.client.force_authenticate(user=self.user)
+
+    def make_data(self, count, tags=None):
+        data = {f'categories[{index}]': category.id for index, category in enumerate(self.categories[:count])}
+        data['tags'] = json.dumps(tags if tags is not None else [f'tag{number}' for number in range(count)])
+        data['description'] = 'Harbour'
+        data['image'] = create_image_file()
+        return data
+
+    def update(self, data):
+        url = reverse('userpost-detail', kwargs={'pk': self.post.id})
+        return self.client.put(url, data, format='multipart')
+
+    def get_relation_writes(self, context):
+        return [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'DELETE'))
+            and ('userpost_categories' in query['sql'] or 'taggit_taggeditem' in query['sql'])
+        ]
+
+    def test_create_query_count_is_flat(self):
+        """ Tests that the number of queries creating a post does not grow with its categories and tags """
+
+        query_counts = []
+        for count in (1, 20):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('userpost-list'), self.make_data(count), format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        post = UserPost.objects.latest('id')
+        self.assertEqual(set(post.categories.all()), set(self.categories))
+        self.assertEqual(list(search_posts(UserPost.objects.all(), 'tag19')), [post])
+
+    def test_update_query_count_is_flat(self):
+        """ Tests that the number of queries updating a post does not grow with its categories and tags """
+
+        query_counts = []
+        for count in (1, 20):
+            self.update(self.make_data(0))
+            with CaptureQueriesContext(connection) as context:
+                response = self.update(self.make_data(count))
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_update_writes_only_changes(self):
+        """ Tests that updating only inserts added and deletes removed categories and tags """
+
+        self.update(self.make_data(3, tags=['sea', 'boat']))
+        data = self.make_data(3, tags=['sea', 'boat'])
+        data['categories[2]'] = self.categories[5].id
+        data['tags'] = json.dumps(['sea', 'gull'])
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.update(data)
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(len(self.get_relation_writes(context)), 4)
+        self.assertEqual(set(self.post.categories.all()), {self.categories[0], self.categories[1], self.categories[5]})
+        self.assertEqual(set(self.post.tags.names()), {'sea', 'gull'})
+
+    def test_unchanged_relations_are_not_written(self):
+        """ Tests that updating with the same categories and tags writes no relation rows """
+
+        self.update(self.make_data(3))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.update(self.make_data(3))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.get_relation_writes(context))
+
+    def test_missing_categories(self):
+        """ Tests that unknown category IDs are reported as validation errors instead of a server error """
+
+        data = self.make_data(1)
+        data['categories[1]'] = 404
+
+        response = self.client.post(reverse('userpost-list'), data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['categories'], ['Category with ID 404 does not exist.'])
+        self.assertEqual(UserPost.objects.count(), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'response-cache-tests'}},
+                   POST_RESPONSE_CACHE_TIMEOUT=300)
+class ResponseCacheTestCase(APITestCase):
+    """ Test cases for cached post list and detail responses """
+
+    def setUp(self):
+        """ Starts from an empty cache and creates a sample user, category and post """
+
+        get_response_cache().cache.clear()
+        self.addCleanup(get_counter_buffer().drain)
+        self.user = User.objects.create(username='cached_user', password='password1')
+        self.category = Category.objects.create(name='streets')
+        self.post = UserPost.objects.create(published_by=self.user, description='Crossing', image='images/messi.jpg')
+        self.post.categories.add(self.category)
+        self.list_url = reverse('userpost-list')
+        self.detail_url = reverse('userpost-detail', kwargs={'pk': self.post.id})
+
+    def assertCached(self, url, params=None):
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        return response
+
+    def assertNotCached(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        return response
+
+    def test_list_is_cached(self):
+        """ Tests that a repeated list is served from the cache without queries and counted as a hit """
+
+        first = self.assertNotCached(self.list_url, {'category': 'streets'})
+        second = self.assertCached(self.list_url, {'category': 'Streets'})
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(get_response_cache().get_stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_parameters_are_part_of_key(self):
+        """ Tests that lists with other filters or pages are cached separately """
+
+        self.assertNotCached(self.list_url)
+        self.assertNotCached(self.list_url, {'ordering': 'views'})
+        self.assertNotCached(self.list_url, {'page': 1})
+
+    def test_post_changes_invalidate(self):
+        """ Tests that saving and deleting a post invalidates cached lists """
+
+        self.assertNotCached(self.list_url)
+        self.post.description = 'Junction'
+        self.post.save()
+        response = self.assertNotCached(self.list_url)
+        self.assertEqual(response.data['results'][0]['description'], 'Junction')
+
+        self.post.delete()
+        response = self.assertNotCached(self.list_url)
+        self.assertEqual(response.data['results'], [])
+
+    def test_category_and_tag_changes_invalidate(self):
+        """ Tests that renaming a category and tagging a post invalidate the cached post """
+
+        self.assertNotCached(self.detail_url)
+        self.category.name = 'avenues'
+        self.category.save()
+        response = self.assertNotCached(self.detail_url)
+        self.assertEqual(response.data['categories'][0]['name'], 'avenues')
+
+        self.post.tags.add('night')
+        response = self.assertNotCached(self.detail_url)
+        self.assertEqual(list(response.data['tags']), ['night'])
+
+    def test_bulk_relation_writes_invalidate(self):
+        """ Tests that categories and tags linked by bulk inserts, which send no signals, invalidate the cache """
+
+        self.assertNotCached(self.detail_url)
+        set_post_tags(self.post, ['rain'])
+        response = self.assertNotCached(self.detail_url)
+        self.assertEqual(list(response.data['tags']), ['rain'])
+
+        bulk_add_categories([(self.post, [Category.objects.create(name='alleys').id])])
+        response = self.assertNotCached(self.detail_url)
+        self.assertEqual(len(response.data['categories']), 2)
+
+    def test_cached_retrieve_counts_views(self):
+        """ Tests that views of a post are still counted when it is served from the cache """
+
+        self.assertNotCached(self.detail_url)
+        response = self.assertCached(self.detail_url)
+
+        self.assertEqual(response.data['views'], 1)
+        self.assertEqual(get_counter_buffer().drain(), {'views': {self.post.id: 2}})
+
+    def test_disabled(self):
+        """ Tests that responses are not cached when the timeout is 0 """
+
+        with self.settings(POST_RESPONSE_CACHE_TIMEOUT=0):
+            response = self.client.get(self.list_url)
+
+        self.assertNotIn('X-Cache', response)
+
+
+class FileResponseCacheTestCase(ResponseCacheTestCase):
+    """ Runs the response cache test cases on the file based cache backend """
+
+    def setUp(self):
+        """ Points the default cache to a temporary directory """
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        cache_settings = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_dir,
+        }})
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        super().setUp()
+
+
+class CacheGenerationTestCase(TestCase):
+    """ Test cases for the cached numbers that outdate what was derived from earlier ones """
+
+    def setUp(self):
+        self.generation = CacheGeneration(caches['default'], 'photogenie:tests:generation')
+        self.addCleanup(caches['default'].delete, self.generation.key)
+
+    def test_missing_number_starts_from_time(self):
+        """ Tests that a missing number starts from the current time in milliseconds and then stays """
+
+        before = int(time.time() * 1000)
+        number = self.generation.get()
+
+        self.assertGreaterEqual(number, before)
+        self.assertEqual(self.generation.get(), number)
+        caches['default'].delete(self.generation.key)
+        self.assertGreaterEqual(self.generation.bump(), number)
+
+    def test_invalidate_bumps_again_on_commit(self):
+        """ Tests that invalidating bumps the number right away and once more when the transaction commits """
+
+        number = self.generation.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.generation.invalidate()
+            self.assertEqual(self.generation.get(), number + 1)
+
+        self.assertEqual(self.generation.get(), number + 2)
+
+
+class SharedCacheCheckTestCase(TestCase):
+    """ Test cases for the system checks of features that need a cache shared between worker processes """
+
+    local_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    def setUp(self):
+        """ Points a second cache alias to a temporary file based cache """
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        cache_settings = override_settings(CACHES={
+            **self.local_cache,
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir},
+        })
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+    def get_check_ids(self):
+        return [message.id for message in run_checks() if message.id.startswith('photogenie.')]
+
+    def test_response_cache(self):
+        """ Tests that caching responses is flagged only when it is turned on in a cache local to the process """
+
+        self.assertNotIn('photogenie.W001', self.get_check_ids())
+        with self.settings(POST_RESPONSE_CACHE_TIMEOUT=300):
+            self.assertIn('photogenie.W001', self.get_check_ids())
+        with self.settings(POST_RESPONSE_CACHE_TIMEOUT=300, POST_RESPONSE_CACHE_ALIAS='shared'):
+            self.assertNotIn('photogenie.W001', self.get_check_ids())
+
+    def test_catalogue_cache(self):
+        """ Tests that a catalogue version cache is flagged only when it is configured and local to the process """
+
+        self.assertNotIn('photogenie.W002', self.get_check_ids())
+        with self.settings(POST_CATALOGUE_CACHE_ALIAS='default'):
+            self.assertIn('photogenie.W002', self.get_check_ids())
+        with self.settings(POST_CATALOGUE_CACHE_ALIAS='shared'):
+            self.assertNotIn('photogenie.W002', self.get_check_ids())
+
+    def test_default_settings_pass(self):
+        """ Tests that the default settings raise none of these warnings """
+
+        self.assertEqual(self.get_check_ids(), [])
+
+    def test_replica_cache(self):
+        """ Tests that remembering writers in a cache local to the process is flagged when there are replicas """
+
+        self.assertNotIn('photogenie.W003', self.get_check_ids())
+        with self.settings(POST_DATABASE_REPLICAS=('replica',)):
+            self.assertIn('photogenie.W003', self.get_check_ids())
+        with self.settings(POST_DATABASE_REPLICAS=('replica',), POST_DATABASE_REPLICA_CACHE_ALIAS='shared'):
+            self.assertNotIn('photogenie.W003', self.get_check_ids())
+
+
+class CategoryCatalogueTestCase(APITestCase):
+    """ Test cases for the cached and ETag validated category catalogue """
+
+    def setUp(self):
+        """ Creates sample categories and a post in one of them """
+
+        self.categories = [Category.objects.create(name=name) for name in ('birds', 'insects', 'reptiles')]
+        user = User.objects.create(username='naturalist', password='password1')
+        self.post = UserPost.objects.create(published_by=user, description='Heron', image='images/messi.jpg')
+        self.post.categories.add(self.categories[0])
+        self.list_url = reverse('category-list')
+
+    def test_list_is_cached(self):
+        """ Tests that the catalogue is only queried once until a category changes """
+
+        self.client.get(self.list_url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url)
+
+        self.assertEqual([category['name'] for category in response.data['results']], ['birds', 'insects', 'reptiles'])
+
+    def test_changes_invalidate(self):
+        """ Tests that creating, renaming and deleting a category refresh the catalogue and its ETag """
+
+        etag = self.client.get(self.list_url)['ETag']
+        Category.objects.create(name='mammals')
+        self.categories[0].name = 'seabirds'
+        self.categories[0].save()
+        self.categories[1].delete()
+
+        response = self.client.get(self.list_url)
+
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([category['name'] for category in response.data['results']],
+                         ['seabirds', 'reptiles', 'mammals'])
+
+    def test_if_none_match(self):
+        """ Tests that a list or a category the client already holds is answered with 304 """
+
+        etag = self.client.get(self.list_url)['ETag']
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        detail_url = reverse('category-detail', kwargs={'pk': self.categories[2].pk})
+        etag = self.client.get(detail_url)['ETag']
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH='"other"').status_code, status.HTTP_200_OK)
+
+    def test_retrieve_missing(self):
+        """ Tests that a category missing from the catalogue is not found """
+
+        response = self.client.get(reverse('category-detail', kwargs={'pk': 404}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(POST_RESPONSE_CACHE_TIMEOUT=0)
+    def test_post_filter_resolves_category_from_catalogue(self):
+        """ Tests that filtering posts by category name does not join the category table """
+
+        get_category_catalogue()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('userpost-list'), {'category': 'Birds'})
+
+        self.assertEqual([post['id'] for post in response.data['results']], [self.post.id])
+        count_query = next(query['sql'] for query in context.captured_queries if 'COUNT' in query['sql'])
+        self.assertNotIn('"photogenie_category"', count_query)
+
+    def test_post_filter_with_unknown_category(self):
+        """ Tests that filtering posts by a category that does not exist returns no posts """
+
+        response = self.client.get(reverse('userpost-list'), {'category': 'fungi'})
+
+        self.assertEqual(response.data['results'], [])
+
+    def test_outdated_catalogue_falls_back_to_database(self):
+        """ Tests that categories another process created are found before this process reloads its catalogue """
+
+        get_category_catalogue()
+        with mock.patch('photogenie.signals.invalidate_category_catalogue'):
+            category = Category.objects.create(name='fungi')
+        self.post.categories.add(category)
+
+        response = self.client.get(reverse('userpost-list'), {'category': 'fungi'})
+        self.assertEqual([post['id'] for post in response.data['results']], [self.post.id])
+
+        response = self.client.get(reverse('category-detail', kwargs={'pk': category.pk}))
+        self.assertEqual(response.data['name'], 'fungi')
+        self.assertNotIn(category.pk, get_category_catalogue().by_id)
+
+    def test_catalogue_expires(self):
+        """ Tests that a catalogue older than the timeout is reloaded even though its version is current """
+
+        catalogue = get_category_catalogue()
+        with mock.patch('photogenie.signals.invalidate_category_catalogue'):
+            Category.objects.create(name='fungi')
+
+        self.assertIs(get_category_catalogue(), catalogue)
+        with mock.patch('photogenie.catalogue.time.monotonic', return_value=catalogue.loaded_at + 60):
+            self.assertIn('fungi', get_category_catalogue().ids_by_name)
+
+
+class BenchmarkCommandTestCase(TemporaryMediaMixin, TestCase):
+    """ Test cases for the API benchmark command """
+
+    def setUp(self):
+        """ Drains the counters incremented by benchmarked requests """
+
+        super().setUp()
+        self.addCleanup(get_counter_buffer().drain)
+
+    def benchmark(self, name, **options):
+        output = f'{self.media_root}/{name}.json'
+        call_command('benchmark_api', posts=30, categories=4, tags=6, users=3, iterations=3, warmup=1,
+                     no_test_database=True, output=output, stdout=StringIO(), **options)
+        with open(output) as output_file:
+            return json.load(output_file)
+
+    def test_results(self):
+        """ Tests that every scenario succeeds and reports latency percentiles, throughput and queries """
+
+        report = self.benchmark('results')
+
+        self.assertEqual(report['meta']['dataset'], {'posts': 30, 'categories': 4, 'tags': 6, 'users': 3})
+        self.assertIn('posts-list-search', report['results'])
+        self.assertIn('serialize-posts-100', report['results'])
+        self.assertIn('serialize-rows-100', report['results'])
+        self.assertLess(report['results']['compress-gzip-10']['bytes'], report['results']['render-orjson-10']['bytes'])
+        for name, result in report['results'].items():
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50'], result['p99'])
+            self.assertGreater(result['throughput'], 0)
+            self.assertIsNotNone(result['queries'])
+            self.assertTrue(all(code.startswith('2') for code in result['status_codes']), name)
+
+    def test_baseline_regressions(self):
+        """ Tests that metrics worse than the baseline beyond the threshold fail the run when asked to """
+
+        baseline = self.benchmark('baseline', scenario=['categories-list'])
+        for result in baseline['results'].values():
+            result.update(p50=0.0001, p95=0.0001, p99=0.0001, throughput=10 ** 9)
+        with open(f'{self.media_root}/baseline.json', 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+
+        with self.assertRaises(CommandError):
+            self.benchmark('current', scenario=['categories-list'], baseline=f'{self.media_root}/baseline.json',
+                           fail_on_regression=True)
+
+
+class HttpBenchmarkTestCase(TemporaryMediaMixin, LiveServerTestCase):
+    """ Test cases for benchmarking a running server over HTTP """
+
+    def setUp(self):
+        """ Drains the counters incremented by benchmarked requests """
+
+        super().setUp()
+        self.addCleanup(get_counter_buffer().drain)
+
+    def test_results(self):
+        """ Tests that the scenarios sent to the live server succeed and report the bytes received """
+
+        output = f'{self.media_root}/http.json'
+        call_command('benchmark_api', posts=10, categories=2, tags=3, users=2, iterations=2, warmup=0,
+                     base_url=self.live_server_url, output=output, stdout=StringIO())
+        with open(output) as output_file:
+            report = json.load(output_file)
+
+        self.assertEqual(report['meta']['mode'], 'http')
+        self.assertGreater(report['results']['posts-list']['bytes'], 0)
+        for name, result in report['results'].items():
+            self.assertIsNone(result['queries'])
+            self.assertTrue(all(code.startswith('2') for code in result['status_codes']), name)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'sparse-fieldset-tests'}},
+                   POST_RESPONSE_CACHE_TIMEOUT=300)
+class SparseFieldsetTestCase(APITestCase):
+    """ Test cases for selecting the fields and expanded relations of listed and retrieved posts """
+
+    def setUp(self):
+        """ Starts from an empty cache and creates a sample user with a post in two categories and a tag """
+
+        get_response_cache().cache.clear()
+        self.addCleanup(get_counter_buffer().drain)
+        ContentType.objects.get_for_model(UserPost)
+        self.user = User.objects.create(username='sparse_user', password='password1')
+        self.categories = [Category.objects.create(name=name) for name in ('lakes', 'hills')]
+        self.post = UserPost.objects.create(published_by=self.user, description='Shore', image='images/messi.jpg')
+        self.post.categories.set(self.categories)
+        self.post.tags.add('calm')
+        self.list_url = reverse('userpost-list')
+        self.detail_url = reverse('userpost-detail', kwargs={'pk': self.post.id})
+
+    def test_list_fields(self):
+        """ Tests that only the selected fields are listed """
+
+        response = self.client.get(self.list_url, {'fields': 'id, description,views'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'id': self.post.id, 'description': 'Shore', 'views': 0}])
+
+    def test_fields_skip_relations(self):
+        """ Tests that relations which are not selected are neither joined nor prefetched """
+
+        self.client.get(self.list_url)
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(self.list_url, {'page': 1})
+        with CaptureQueriesContext(connection) as sparse:
+            self.client.get(self.list_url, {'fields': 'id,image'})
+
+        self.assertEqual(len(sparse.captured_queries), len(full.captured_queries) - 2)
+        self.assertNotIn('JOIN', sparse.captured_queries[-1]['sql'])
+
+    def test_expand(self):
+        """ Tests that relations which are not expanded are shown by their IDs """
+
+        response = self.client.get(self.detail_url, {'expand': 'categories'})
+        self.assertEqual(response.data['published_by'], self.user.id)
+        self.assertEqual([category['name'] for category in response.data['categories']], ['lakes', 'hills'])
+
+        response = self.client.get(self.detail_url, {'expand': ''})
+        self.assertEqual(response.data['published_by'], self.user.id)
+        self.assertEqual(response.data['categories'], [category.id for category in self.categories])
+
+    def test_unknown_fields(self):
+        """ Tests that unknown fields and relations that cannot be expanded are rejected """
+
+        response = self.client.get(self.list_url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.detail_url, {'expand': 'tags'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_fields_counts_views(self):
+        """ Tests that views are counted and the selections are cached separately when retrieving a post """
+
+        response = self.client.get(self.detail_url, {'fields': 'id,views'})
+        self.assertEqual(response.data, {'id': self.post.id, 'views': 1})
+
+        response = self.client.get(self.detail_url, {'fields': 'id'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data, {'id': self.post.id})
+        self.assertEqual(get_counter_buffer().drain(), {'views': {self.post.id: 2}})
+
+
+@override_settings(POST_RESPONSE_CACHE_TIMEOUT=0)
+class PostRowSerializerTestCase(APITestCase):
+    """ Test cases for post lists built from plain rows being identical to the ones built by PostSerializer """
+
+    selections = [
+        {},
+        {'fields': ['id', 'image', 'renditions', 'tags']},
+        {'expand': []},
+        {'fields': ['published_by', 'categories', 'published_at'], 'expand': ['categories']},
+    ]
+
+    def setUp(self):
+        """ Creates posts with and without categories, tags and renditions by two users """
+
+        ContentType.objects.get_for_model(UserPost)
+        self.addCleanup(get_counter_buffer().drain)
+        users = [User.objects.create(username=f'row_user_{number}', password='password1') for number in range(2)]
+        categories = [Category.objects.create(name=name) for name in ('dunes', 'cliffs', 'caves')]
+        for number in range(5):
+            post = UserPost.objects.create(
+                published_by=users[number % 2], description=f'Rock "{number}" é', image=f'images/rock{number}.jpg',
+                views=number * 7, image_width=40, image_height=30, image_format='JPEG',
+                renditions={'64': {'name': f'renditions/rock{number}_64.jpg', 'width': 64, 'height': 48}} if number % 2
+                else {},
+            )
+            post.categories.set(categories[:number % 4])
+            post.tags.add(*[f'rock{tag}' for tag in range(number % 3)])
+        self.request = Request(APIRequestFactory().get('/posts/'))
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_same_data_as_post_serializer(self):
+        """ Tests that the rows render to the same bytes as PostSerializer for every selection """
+
+        for selection in self.selections:
+            with self.subTest(selection=selection):
+                context = {'request': self.request, **selection}
+                posts = PostSerializer.optimize_queryset(UserPost.objects.order_by('id'), **selection)
+                row_serializer = PostRowSerializer(context=context)
+                rows = row_serializer.get_rows(posts)
+
+                self.assertEqual(self.render(row_serializer.serialize(rows)),
+                                 self.render(PostSerializer(posts, many=True, context=context).data))
+
+    def test_same_list_responses(self):
+        """ Tests that list responses are identical with and without rows, including cursor pages and search """
+
+        url = reverse('userpost-list')
+        for params in ({}, {'ordering': 'views'}, {'pagination': 'cursor'}, {'search': 'rock'},
+                       {'fields': 'id,categories', 'expand': ''}, {'published_by': 'row_user_1'}):
+            with self.subTest(params=params):
+                with self.settings(POST_ROW_SERIALIZER_ENABLED=False), CaptureQueriesContext(connection) as serialized:
+                    expected = self.client.get(url, params)
+                with CaptureQueriesContext(connection) as rows:
+                    response = self.client.get(url, params)
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.content, expected.content)
+                self.assertLessEqual(len(rows.captured_queries), len(serialized.captured_queries))
+
+    def test_cursor_pages(self):
+        """ Tests that the next link of a cursor page of rows leads to the following posts """
+
+        url = reverse('userpost-list')
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'PAGE_SIZE': 2}):
+            response = self.client.get(url, {'pagination': 'cursor', 'ordering': 'views'})
+            ids = [post['id'] for post in response.data['results']]
+            while response.data['next']:
+                response = self.client.get(response.data['next'])
+                ids += [post['id'] for post in response.data['results']]
+
+        self.assertEqual(ids, list(UserPost.objects.order_by('views').values_list('id', flat=True)))
+
+
+class FastJSONRendererTestCase(TestCase):
+    """ Test cases for rendering JSON with orjson """
+
+    data = OrderedDict([
+        ('id', 7),
+        ('text', 'Café \u2028 line \u2029 "quoted" \\ </script>'),
+        ('published_at', datetime(2021, 5, 4, 3, 2, 1, 123456, tzinfo=dt_timezone.utc)),
+        ('day', date(2021, 5, 4)),
+        ('price', Decimal('10.50')),
+        ('uuid', UUID('12345678-1234-5678-1234-567812345678')),
+        ('ratio', 0.1),
+        ('nothing', None),
+        ('flags', [True, False]),
+        ('renditions', {64: 'a.jpg', '256': 'b.jpg'}),
+        ('categories', [OrderedDict([('id', 1), ('name', 'lakes')])]),
+    ])
+
+    def test_same_bytes_as_json_renderer(self):
+        """ Tests that orjson renders the same bytes as JSONRenderer, including types left to the encoder """
+
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(FastJSONRenderer().render([]), b'[]')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_fallback(self):
+        """ Tests that JSONRenderer renders without orjson, for indented output and for integers beyond 64 bits """
+
+        with mock.patch('photogenie.api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+        context = {'indent': 4}
+        self.assertEqual(FastJSONRenderer().render(self.data, renderer_context=context),
+                         JSONRenderer().render(self.data, renderer_context=context))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'compression-tests'}},
+                   POST_RESPONSE_CACHE_TIMEOUT=300, POST_COMPRESSION_ENCODINGS=('br', 'gzip'),
+                   POST_COMPRESSION_MIN_SIZE=512)
+class CompressionTestCase(APITestCase):
+    """ Test cases for compressing responses negotiated through Accept-Encoding """
+
+    def setUp(self):
+        """ Starts from an empty cache and creates posts filling a list beyond the minimum size """
+
+        get_response_cache().cache.clear()
+        self.addCleanup(get_counter_buffer().drain)
+        user = User.objects.create(username='compressed_user', password='password1')
+        for number in range(5):
+            UserPost.objects.create(published_by=user, description=f'Dune {number}', image='images/dune.jpg')
+        self.url = reverse('userpost-list')
+
+    def test_negotiate_encoding(self):
+        """ Tests that the encoding with the highest quality wins and ties go to the preferred encoding """
+
+        encodings = ['br', 'gzip']
+        self.assertEqual(compression.negotiate_encoding('gzip, deflate, br', encodings), 'br')
+        self.assertEqual(compression.negotiate_encoding('br;q=0.5, gzip;q=0.8', encodings), 'gzip')
+        self.assertEqual(compression.negotiate_encoding('*;q=0.1, br;q=0', encodings), 'gzip')
+        self.assertIsNone(compression.negotiate_encoding('gzip;q=0, identity', encodings))
+        self.assertIsNone(compression.negotiate_encoding(None, encodings))
+
+    def test_gzip(self):
+        """ Tests that lists are compressed with gzip when asked, which decompresses to the uncompressed body """
+
+        plain = self.client.get(self.url, {'page': 1})
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(plain.content))
+
+    def test_brotli_needs_package(self):
+        """ Tests that brotli is only offered when the brotli package is installed """
+
+        with mock.patch('photogenie.compression.brotli', None):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        brotli = mock.Mock(compress=lambda content, quality: b'br')
+        with mock.patch('photogenie.compression.brotli', brotli):
+            response = self.client.get(self.url, {'page': 1}, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual((response['Content-Encoding'], response.content), ('br', b'br'))
+
+    def test_not_compressed(self):
+        """ Tests that small responses and clients not accepting any encoding get uncompressed bodies """
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.client.get(reverse('userpost-detail', kwargs={'pk': 404}), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_precompressed(self):
+        """ Tests that the compressed body of a cached list is reused and a new post compresses it again """
+
+        compress_gzip = mock.Mock(side_effect=compression.compress_gzip)
+        with mock.patch.dict(compression.COMPRESSORS, {'gzip': compress_gzip}):
+            first = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+            second = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(compress_gzip.call_count, 1)
+            self.assertEqual((second['X-Cache'], second.content), ('HIT', first.content))
+
+            UserPost.objects.first().delete()
+            self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(compress_gzip.call_count, 2)
+
+    def test_weak_etag(self):
+        """ Tests that compressed categories get a weak ETag that still validates the cached copy """
+
+        for number in range(10):
+            Category.objects.create(name=f'compressed category {number}')
+        with self.settings(POST_COMPRESSION_MIN_SIZE=200):
+            response = self.client.get(reverse('category-list'), HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertTrue(response['ETag'].startswith('W/"'))
+
+            response = self.client.get(reverse('category-list'), HTTP_ACCEPT_ENCODING='gzip',
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+@override_settings(POST_RESPONSE_CACHE_TIMEOUT=0)
+class FacetTestCase(APITestCase):
+    """ Test cases for the category and tag facets of the post list and the post counts behind them """
+
+    def setUp(self):
+        """ Creates two users with posts in a few categories and tags """
+
+        self.addCleanup(get_counter_buffer().drain)
+        ContentType.objects.get_for_model(UserPost)
+        self.users = [User.objects.create(username=name, password='password1') for name in ('ann', 'bob')]
+        self.categories = [Category.objects.create(name=name) for name in ('birds', 'trees', 'roads')]
+        self.posts = []
+        for user, description, categories, tags in (
+            (self.users[0], 'Heron by the river', self.categories[:2], ['water', 'calm']),
+            (self.users[0], 'Oak in the fog', self.categories[1:2], ['fog', 'calm']),
+            (self.users[1], 'Empty highway', self.categories[2:], ['fog']),
+        ):
+            post = UserPost.objects.create(published_by=user, description=description, image='images/messi.jpg')
+            post.categories.set(categories)
+            post.tags.set(tags)
+            self.posts.append(post)
+        self.url = reverse('userpost-list')
+
+    def get_facets(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['facets']
+
+    def assertCountsMatchLinks(self):
+        """ Asserts that the maintained post counts equal the counts of the links """
+
+        categories = {
+            category.id: UserPost.objects.filter(categories=category).count() for category in Category.objects.all()
+        }
+        tags = {tag.id: UserPost.objects.filter(tags=tag).count() for tag in Tag.objects.all()}
+        self.assertEqual(dict(CategoryPostCount.objects.values_list('category_id', 'posts')), categories)
+        self.assertEqual(dict(TagPostCount.objects.values_list('tag_id', 'posts')), tags)
+
+    def test_unfiltered_facets(self):
+        """ Tests that the facets of the unfiltered list are read from the post counts in one query each """
+
+        with CaptureQueriesContext(connection) as context:
+            facets = self.get_facets({'facets': 'categories,tags'})
+
+        self.assertEqual(facets['categories'], [
+            {'id': self.categories[1].id, 'name': 'trees', 'count': 2},
+            {'id': self.categories[0].id, 'name': 'birds', 'count': 1},
+            {'id': self.categories[2].id, 'name': 'roads', 'count': 1},
+        ])
+        self.assertEqual([(tag['name'], tag['count']) for tag in facets['tags']][:2], [('calm', 2), ('fog', 2)])
+        self.assertEqual(len(facets['tags']), 3)
+        facet_queries = [query for query in context.captured_queries if 'postcount' in query['sql']]
+        self.assertEqual(len(facet_queries), 2)
+
+    def test_filtered_facets(self):
+        """ Tests that the facets count only the posts matching the filters """
+
+        facets = self.get_facets({'facets': 'categories,tags', 'published_by': 'ann'})
+        self.assertEqual([(category['name'], category['count']) for category in facets['categories']],
+                         [('trees', 2), ('birds', 1)])
+        self.assertEqual(facets['tags'][0], {'name': 'calm', 'count': 2})
+
+        facets = self.get_facets({'facets': 'tags', 'category': 'roads'})
+        self.assertEqual(facets, {'tags': [{'name': 'fog', 'count': 1}]})
+
+        facets = self.get_facets({'facets': 'categories', 'search': 'fog'})
+        self.assertEqual([(category['name'], category['count']) for category in facets['categories']],
+                         [('trees', 1), ('roads', 1)])
+
+        facets = self.get_facets({'facets': 'categories,tags', 'category': 'unknown'})
+        self.assertEqual(facets, {'categories': [], 'tags': []})
+
+    def test_facet_limit(self):
+        """ Tests that the tags facet returns the given number of most used tags """
+
+        facets = self.get_facets({'facets': 'tags', 'facet_limit': 1})
+        self.assertEqual(facets['tags'], [{'name': 'calm', 'count': 2}])
+
+        for params in ({'facets': 'colors'}, {'facets': 'tags', 'facet_limit': 0}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_no_facets(self):
+        """ Tests that facets are only returned when requested """
+
+        response = self.client.get(self.url)
+        self.assertNotIn('facets', response.data)
+
+    def test_counts_follow_changes(self):
+        """ Tests that the post counts follow links added and removed in every way posts are written """
+
+        heron, oak, highway = self.posts
+        heron.categories.remove(self.categories[0], self.categories[2])
+        oak.tags.remove('calm', 'missing')
+        highway.categories.clear()
+        self.categories[0].userpost_set.add(oak, highway)
+        self.categories[1].userpost_set.remove(heron)
+        self.assertCountsMatchLinks()
+
+        set_post_tags(heron, ['water', 'night'])
+        bulk_add_categories([(highway, [self.categories[1].id])])
+        self.assertCountsMatchLinks()
+
+        heron.delete()
+        self.categories[2].userpost_set.clear()
+        Tag.objects.get(name='fog').delete()
+        self.assertCountsMatchLinks()
+
+    def test_rebuild_command(self):
+        """ Tests that rebuilding the post counts recounts links written without adjusting them """
+
+        CategoryPostCount.objects.update(posts=0)
+        TagPostCount.objects.all().delete()
+        out = StringIO()
+
+        call_command('rebuild_facet_counts', stdout=out)
+
+        self.assertIn('Stored post counts of 6 categories and tags.', out.getvalue())
+        self.assertCountsMatchLinks()
+
+
+@override_settings(POST_RESPONSE_CACHE_TIMEOUT=0)
+class QueryPlanTestCase(APITestCase):
+    """ Test cases for the query plans of post endpoints on a seeded dataset """
+
+    tables = [UserPost._meta.db_table, UserPost.categories.through._meta.db_table, TaggedItem._meta.db_table]
+    # Counting every post reads a whole index whatever the indexes are.
+    ignore = [r'^SELECT COUNT\(\*\) AS "__count" FROM "photogenie_userpost"$']
+
+    @classmethod
+    def setUpTestData(cls):
+        """ Seeds enough posts for the planner to prefer indexes and refreshes the table statistics """
+
+        cls.media_root = tempfile.mkdtemp()
+        with override_settings(MEDIA_ROOT=cls.media_root):
+            cls.dataset = seed_dataset(posts=2000, categories=40, tags=100, users=50, seed=1)
+        analyze_tables()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        self.addCleanup(get_counter_buffer().drain)
+        ContentType.objects.get_for_model(UserPost)
+
+    def assertPlansUseIndexes(self, url, params=None, allow_sorts=False):
+        with check_query_plans(self.tables, ignore=self.ignore, allow_sorts=allow_sorts):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list(self):
+        """ Tests that lists in every ordering and pagination read posts through indexes without sorting """
+
+        url = reverse('userpost-list')
+        for params in ({}, {'page': 3}, {'ordering': 'views'}, {'ordering': 'downloads'}, {'pagination': 'cursor'},
+                       {'pagination': 'cursor', 'ordering': 'views'}):
+            with self.subTest(params=params):
+                self.assertPlansUseIndexes(url, params)
+
+    def test_list_published_by(self):
+        """ Tests that posts of a publisher are read through indexes without sorting in every ordering """
+
+        url = reverse('userpost-list')
+        for ordering in (None, 'views', 'downloads'):
+            params = {'published_by': self.dataset.usernames[3], 'ordering': ordering}
+            for pagination in (None, 'cursor'):
+                with self.subTest(ordering=ordering, pagination=pagination):
+                    self.assertPlansUseIndexes(url, {key: value for key, value in
+                                                     {**params, 'pagination': pagination}.items() if value})
+
+    def test_list_category(self):
+        """
+        Tests that posts of a category are read through indexes. They are sorted once found, since avoiding that
+        would need the ordering columns on the table linking posts and categories.
+        """
+
+        url = reverse('userpost-list')
+        category = next(iter(self.dataset.category_ids))
+        for params in ({'category': category}, {'category': category, 'ordering': 'views'}):
+            with self.subTest(params=params):
+                self.assertPlansUseIndexes(url, params, allow_sorts=True)
+
+    def test_retrieve(self):
+        """ Tests that retrieving a post reads it, its categories and tags through indexes """
+
+        self.assertPlansUseIndexes(reverse('userpost-detail', kwargs={'pk': self.dataset.post_ids[10]}))
+
+    def test_problems_fail(self):
+        """ Tests that queries reading a whole table or sorting posts fail the check """
+
+        with self.assertRaisesMessage(QueryPlanProblem, 'full scan of photogenie_userpost'):
+            with check_query_plans(self.tables):
+                UserPost.objects.filter(description__contains='river').count()
+
+        with self.assertRaisesMessage(QueryPlanProblem, 'temp b-tree for order by'):
+            with check_query_plans(self.tables):
+                list(UserPost.objects.filter(published_by=self.dataset.author).order_by('description')[:5])
+
+
+@override_settings(POST_QUERY_BUDGET_MODE='raise', POST_RESPONSE_CACHE_TIMEOUT=0)
+class QueryBudgetTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for the SQL query budgets of API views across growing dataset sizes """
+
+    dataset_sizes = (1, 5, 10)
+    # Queries that budgets leave for the user lookup of JWT authentication and one more query the measured requests
+    # do not run.
+    budget_margin = 2
+
+    def setUp(self):
+        """ Creates a sample user """
+
+        super().setUp()
+        self.addCleanup(get_counter_buffer().drain)
+
+        self.user = User.objects.create_user(username='budgeted', password='budgeted12345')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {get_user_tokens(self.user)["access"]}')
+        cache_user(self.user)
+        ContentType.objects.get_for_model(UserPost)
+        size = max(self.dataset_sizes) + 1
+        self.categories = [Category.objects.create(name=f'budget {number}') for number in range(size)]
+        self.tags = [Tag.objects.create(name=f'budget{number}') for number in range(size)]
+
+    def create_post(self, size):
+        """ Creates a post with as many categories and tags as the dataset size """
+
+        post = UserPost(published_by=self.user, description='Budget', image=create_image_file())
+        post.set_image_metadata()
+        post.save()
+        post.categories.set(self.categories[:size])
+        post.tags.set(self.tags[:size])
+        return post
+
+    def post_data(self, size, first=0):
+        """
+        Returns post data holding as many categories as the dataset size starting from the first, and as many tags
+        that do not exist yet, which is the most expensive case
+        """
+
+        data = {f'categories[{index}]': category.id
+                for index, category in enumerate(self.categories[first:first + size])}
+        data.update(description='Budget', tags=json.dumps([f'new{size}-{number}' for number in range(size)]),
+                    image=create_image_file())
+        return data
+
+    def assertWithinBudget(self, view_class, action, send, most_expensive=True):
+        """
+        Sends the request for every dataset size and checks that its query count is flat and within budget. The budget
+        of the most expensive request of a view leaves at most budget_margin queries unused, so that budgets follow
+        the measured counts rather than hide extra queries.
+        """
+
+        budget = get_query_budget(view_class, action)
+        query_counts = []
+        for size in self.dataset_sizes:
+            request = send(size)
+            with CaptureQueriesContext(connection) as context:
+                response = request()
+            self.assertLess(response.status_code, 400)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertLessEqual(max(query_counts), budget)
+        self.assertEqual(len(set(query_counts)), 1, f'{view_class.__name__}.{action} ran {query_counts} queries.')
+        if most_expensive:
+            self.assertGreaterEqual(max(query_counts) + self.budget_margin, budget,
+                                    f'{view_class.__name__}.{action} ran {query_counts} queries of {budget}.')
+
+    def test_list(self):
+        """ Tests the query budget of listing posts """
+
+        def send(size):
+            for _ in range(size):
+                self.create_post(size)
+            return lambda: self.client.get(reverse('userpost-list'))
+
+        self.assertWithinBudget(UserPostViewSet, 'list', send, most_expensive=False)
+
+    def test_list_facets(self):
+        """ Tests the query budget of listing posts along with the facets of the filtered posts """
+
+        def send(size):
+            for _ in range(size):
+                self.create_post(size)
+            params = {'facets': 'categories,tags', 'published_by': 'budgeted'}
+            get_category_catalogue()
+            return lambda: self.client.get(reverse('userpost-list'), params)
+
+        self.assertWithinBudget(UserPostViewSet, 'list', send)
+
+    def test_retrieve(self):
+        """ Tests the query budget of retrieving a post """
+
+        def send(size):
+            url = reverse('userpost-detail', kwargs={'pk': self.create_post(size).id})
+            return lambda: self.client.get(url)
+
+        self.assertWithinBudget(UserPostViewSet, 'retrieve', send)
+
+    def test_create(self):
+        """ Tests the query budget of creating a post """
+
+        def send(size):
+            data = self.post_data(size)
+            return lambda: self.client.post(reverse('userpost-list'), data, format='multipart')
+
+        self.assertWithinBudget(UserPostViewSet, 'create', send)
+
+    def test_bulk_create(self):
+        """ Tests the query budget of creating many posts at once """
+
+        def send(size):
+            items = [{'description': 'Budget', 'categories': [category.id for category in self.categories[:size]],
+                      'tags': [f'new{size}-{number}' for number in range(size)]} for _ in range(size)]
+            data = {'items': json.dumps(items), 'images': [create_image_file() for _ in range(size)]}
+            return lambda: self.client.post(reverse('userpost-bulk-create'), data, format='multipart')
+
+        self.assertWithinBudget(UserPostViewSet, 'bulk_create', send)
+
+    def test_update(self):
+        """ Tests the query budget of updating a post """
+
+        def send(size):
+            url = reverse('userpost-detail', kwargs={'pk': self.create_post(1).id})
+            data = self.post_data(size, first=1)
+            return lambda: self.client.put(url, data, format='multipart')
+
+        self.assertWithinBudget(UserPostViewSet, 'update', send)
+
+    def test_destroy(self):
+        """ Tests the query budget of deleting a post """
+
+        def send(size):
+            url = reverse('userpost-detail', kwargs={'pk': self.create_post(size).id})
+            return lambda: self.client.delete(url)
+
+        self.assertWithinBudget(UserPostViewSet, 'destroy', send)
+
+    def test_download(self):
+        """ Tests the query budget of downloading an image """
+
+        def send(size):
+            url = reverse('download-image', kwargs={'pk': self.create_post(size).id})
+            return lambda: self.client.get(url)
+
+        self.assertWithinBudget(DownloadImageView, None, send)
+
+    def test_signup(self):
+        """ Tests the query budget of signing up """
+
+        def send(size):
+            data = {'username': f'newcomer{size}', 'email': f'newcomer{size}@example.com', 'password': 'newcomer12345'}
+            return lambda: self.client.post(reverse('signup'), data)
+
+        self.assertWithinBudget(SignupAPIView, None, send)
+
+    def test_login(self):
+        """ Tests the query budget of logging in """
+
+        self.client.credentials()
+
+        def send(size):
+            return lambda: self.client.post(reverse('login'), {'username': 'budgeted', 'password': 'budgeted12345'})
+
+        self.assertWithinBudget(LoginAPIView, None, send)
+
+    def test_strict_mode_raises(self):
+        """ Tests that a request over budget raises in strict mode and is only logged otherwise """
+
+        self.create_post(1)
+        with mock.patch.dict(UserPostViewSet.query_budgets, {'list': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('userpost-list'))
+
+            with self.settings(POST_QUERY_BUDGET_MODE='log'), self.assertLogs('photogenie.budgets', 'WARNING'):
+                response = self.client.get(reverse('userpost-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(POST_RESPONSE_CACHE_TIMEOUT=0)
+class RequestMetricsTestCase(APITestCase):
+    """ Test cases for request instrumentation and the Prometheus metrics endpoint """
+
+    def setUp(self):
+        """ Starts from empty histograms and creates a sample post """
+
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.addCleanup(get_counter_buffer().drain)
+        user = User.objects.create(username='measured', password='password1')
+        self.post = UserPost.objects.create(published_by=user, description='Gauge', image='images/messi.jpg')
+
+    def test_server_timing(self):
+        """ Tests that responses carry wall time, database time with query count, serializer time and size """
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('userpost-list'))
+
+        timing = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'app', 'db', 'serializer', 'size'})
+        self.assertIn(f'desc="{len(context.captured_queries)} queries"', timing['db'])
+        self.assertGreater(float(timing['serializer'].split('=')[1]), 0)
+        self.assertEqual(timing['size'], f'desc="{len(response.content)} bytes"')
+
+    def test_metrics_endpoint(self):
+        """ Tests that the histograms of every measured view are exposed in Prometheus text format """
+
+        self.client.get(reverse('userpost-list'))
+        self.client.get(reverse('userpost-list'))
+        self.client.get(reverse('userpost-detail', kwargs={'pk': self.post.id}))
+
+        with self.settings(POST_METRICS_ALLOWED_IPS='*'):
+            response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertNotIn('Server-Timing', response)
+        content = response.content.decode()
+        self.assertIn('# TYPE photogenie_request_duration_seconds histogram', content)
+        self.assertIn('photogenie_request_duration_seconds_count{view="UserPostViewSet.list",method="GET"} 2', content)
+        self.assertIn('photogenie_request_queries_bucket{view="UserPostViewSet.retrieve",method="GET",le="+Inf"} 1',
+                      content)
+        self.assertIn('photogenie_response_size_bytes_sum{view="UserPostViewSet.list",method="GET"}', content)
+
+    def test_allowed_ips(self):
+        """ Tests that only allowed addresses may read the metrics when they are restricted """
+
+        with self.settings(POST_METRICS_ALLOWED_IPS=('10.0.0.1',)):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_denied_by_default(self):
+        """ Tests that no client may read the metrics unless addresses are allowed, loopback included """
+
+        for address in ('127.0.0.1', '::1', '203.0.113.7'):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR=address).status_code,
+                             status.HTTP_403_FORBIDDEN)
+        with self.settings(POST_METRICS_ALLOWED_IPS='*'):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code,
+                             status.HTTP_200_OK)
+
+    @override_settings(POST_METRICS_TOKEN='scraper-token')
+    def test_token(self):
+        """ Tests that a client sending the configured bearer token may read the metrics from any address """
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper-token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer other-token')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_disabled(self):
+        """ Tests that nothing is measured when metrics are turned off """
+
+        with self.settings(POST_METRICS_ENABLED=False):
+            response = self.client.get(reverse('userpost-list'))
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(registry.histograms, {})
+
+    def test_histogram_buckets(self):
+        """ Tests that bucket counts are cumulative and values on a bound fall into that bucket """
+
+        histogram = Histogram((1, 5))
+        for value in (0.5, 1, 3, 7):
+            histogram.observe(value)
+
+        self.assertEqual(list(histogram.cumulative_counts()), [(1, 2), (5, 3), ('+Inf', 4)])
+        self.assertEqual((histogram.sum, histogram.count), (11.5, 4))
+
+
+class PostTransferTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for the NDJSON export and import of posts """
+
+    def setUp(self):
+        """ Creates two posts with an image, categories and tags """
+
+        super().setUp()
+
+        ContentType.objects.get_for_model(UserPost)
+        self.user = User.objects.create(username='photographer', password='password1')
+        self.categories = [Category.objects.create(name=name) for name in ('birds', 'trees')]
+        self.posts = []
+        for description, categories, tags, views in (
+            ('Heron by the river', self.categories, ['water', 'calm'], 7),
+            ('Oak in the fog', self.categories[1:], ['fog'], 3),
+        ):
+            post = UserPost.objects.create(published_by=self.user, description=description, image=create_image_file(),
+                                           views=views)
+            post.set_image_metadata()
+            post.save()
+            post.categories.set(categories)
+            post.tags.set(tags)
+            self.posts.append(post)
+        self.export_path = f'{self.media_root}/posts.ndjson'
+
+    def test_export_reads_links_per_chunk(self):
+        """ Tests that categories and tags are read with two queries per chunk of posts """
+
+        with CaptureQueriesContext(connection) as context:
+            records = [json.loads(line) for line in export_posts(chunk_size=1)]
+
+        self.assertEqual([record['description'] for record in records], ['Heron by the river', 'Oak in the fog'])
+        self.assertEqual(records[0]['categories'], ['birds', 'trees'])
+        self.assertEqual(records[0]['tags'], ['calm', 'water'])
+        self.assertEqual((records[0]['published_by'], records[0]['views']), ('photographer', 7))
+        self.assertNotIn('image_content', records[0])
+        link_queries = [query for query in context.captured_queries
+                        if 'photogenie_userpost_categories' in query['sql'] or 'taggit_taggeditem' in query['sql']]
+        self.assertEqual(len(link_queries), 4)
+
+    def test_round_trip_with_images(self):
+        """ Tests that exported posts are imported with their image, links, counters and publication time """
+
+        call_command('export_posts', '--output', self.export_path, '--images', stdout=StringIO())
+        published_at = [post.published_at for post in self.posts]
+        UserPost.objects.all().delete()
+        shutil.rmtree(f'{self.media_root}/images')
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_posts', self.export_path, '--batch-size', '1', stdout=out, stderr=StringIO())
+
+        self.assertIn('Imported 2 post(s), 0 line(s) failed.', out.getvalue())
+        posts = list(UserPost.objects.order_by('published_at'))
+        self.assertEqual([post.published_at for post in posts], published_at)
+        self.assertEqual([post.views for post in posts], [7, 3])
+        self.assertEqual(sorted(posts[0].categories.values_list('name', flat=True)), ['birds', 'trees'])
+        self.assertEqual(sorted(posts[0].tags.names()), ['calm', 'water'])
+        self.assertEqual(posts[0].image_width, 40)
+        with posts[0].image.open('rb') as image:
+            self.assertEqual(Image.open(image).size, (40, 30))
+        self.assertIn('heron', search_posts(UserPost.objects.all(), 'heron')[0].description.lower())
+        self.assertEqual(CategoryPostCount.objects.get(category__name='trees').posts, 2)
+        self.assertEqual(TagPostCount.objects.get(tag__name='fog').posts, 1)
+
+    def test_import_errors(self):
+        """ Tests that lines of unknown users and invalid lines are reported while the others are imported """
+
+        lines = list(export_posts())
+        lines[1] = lines[1].replace('"photographer"', '"nobody"')
+        with open(self.export_path, 'w') as export:
+            export.writelines([*lines, 'not json\n', '[1]\n'])
+        out, err = StringIO(), StringIO()
+
+        call_command('import_posts', self.export_path, stdout=out, stderr=err)
+
+        self.assertIn('Imported 1 post(s), 3 line(s) failed.', out.getvalue())
+        self.assertIn("Line 2: Unknown user 'nobody'.", err.getvalue())
+        self.assertIn('Line 3: Invalid JSON', err.getvalue())
+        self.assertIn('Line 4: Expected a JSON object.', err.getvalue())
+        self.assertEqual(UserPost.objects.count(), 3)
+
+    def test_import_invalid_types(self):
+        """ Tests that publishers, categories and tags of the wrong type are reported for their line """
+
+        record = json.loads(next(export_posts()))
+        lines = [json.dumps({**record, **change}) + '\n' for change in (
+            {'published_by': {'username': 'photographer'}}, {'categories': 'birds'}, {'tags': [['fog']]}, {},
+        )]
+        with open(self.export_path, 'w') as export:
+            export.writelines(lines)
+        out, err = StringIO(), StringIO()
+
+        call_command('import_posts', self.export_path, stdout=out, stderr=err)
+
+        self.assertIn('Imported 1 post(s), 3 line(s) failed.', out.getvalue())
+        self.assertIn('Line 1: Invalid post: ValueError(\'published_by must be a username\')', err.getvalue())
+        self.assertIn('Line 2: Invalid post: ValueError(\'categories must be a list of names\')', err.getvalue())
+        self.assertIn('Line 3: Invalid post: ValueError(\'tags must be a list of names\')', err.getvalue())
+        self.assertFalse(Category.objects.filter(name__in=['b', 'i', 'r', 'd', 's']).exists())
+
+    def test_import_counters(self):
+        """ Tests that missing counters start at zero and negative counters are reported for their line """
+
+        record = json.loads(next(export_posts()))
+        del record['views']
+        lines = [json.dumps(record) + '\n', json.dumps({**record, 'downloads': -1}) + '\n']
+        with open(self.export_path, 'w') as export:
+            export.writelines(lines)
+        out, err = StringIO(), StringIO()
+
+        call_command('import_posts', self.export_path, stdout=out, stderr=err)
+
+        self.assertIn('Imported 1 post(s), 1 line(s) failed.', out.getvalue())
+        self.assertIn('Line 2: Invalid post: ValueError(\'downloads must be a non-negative integer\')', err.getvalue())
+        self.assertEqual(UserPost.objects.order_by('id').last().views, 0)
+
+    def test_failed_batch_deletes_images(self):
+        """ Tests that images stored for a batch are deleted again when its transaction fails """
+
+        call_command('export_posts', '--output', self.export_path, '--images', stdout=StringIO())
+        UserPost.objects.all().delete()
+        shutil.rmtree(f'{self.media_root}/images')
+
+        with mock.patch.object(UserPost.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                call_command('import_posts', self.export_path, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(os.listdir(f'{self.media_root}/images'), [])
+
+
+class ArchiveDownloadTestCase(TemporaryMediaMixin, APITestCase):
+    """ Test cases for the streamed ZIP archive of many post images """
+
+    def setUp(self):
+        """ Stores images of three posts in a temporary media directory, two of them in a category """
+
+        super().setUp()
+
+        self.user = User.objects.create(username='downloader', password='password1')
+        self.category = Category.objects.create(name='birds')
+        self.posts = []
+        for name, image_format, categories in (('heron.png', 'PNG', [self.category]),
+                                               ('owl.jpg', 'JPEG', [self.category]), ('road.bmp', 'BMP', [])):
+            post = UserPost.objects.create(published_by=self.user, description=name,
+                                           image=create_image_file(name, image_format=image_format))
+            post.categories.set(categories)
+            self.posts.append(post)
+        self.url = reverse('download-archive')
+        self.client.force_authenticate(user=self.user)
+
+    def get_archive(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_archive_by_ids(self):
+        """ Tests that the images of the given posts are archived, stored or deflated by format, and counted once """
+
+        with CaptureQueriesContext(connection) as context:
+            archive = self.get_archive({'ids': ','.join(str(post.id) for post in self.posts)})
+
+        self.assertIsNone(archive.testzip())
+        entries = {entry.filename: entry for entry in archive.infolist()}
+        self.assertEqual(set(entries), {f'{post.id}-{posixpath.basename(post.image.name)}' for post in self.posts})
+        for post in self.posts:
+            entry = entries[f'{post.id}-{posixpath.basename(post.image.name)}']
+            expected = zipfile.ZIP_DEFLATED if post.image.name.endswith('.bmp') else zipfile.ZIP_STORED
+            self.assertEqual(entry.compress_type, expected)
+            with post.image.open('rb'):
+                self.assertEqual(archive.read(entry), post.image.read())
+        self.assertEqual(len([query for query in context.captured_queries if 'UPDATE' in query['sql']]), 1)
+        self.assertEqual(list(UserPost.objects.order_by('id').values_list('downloads', flat=True)), [1, 1, 1])
+
+    def test_archive_by_filter(self):
+        """ Tests that the posts matching list filters are archived, leaving out images that can not be read """
+
+        self.posts[1].image.storage.delete(self.posts[1].image.name)
+
+        with self.assertLogs('photogenie.archives', 'WARNING'):
+            archive = self.get_archive({'category': 'Birds'})
+
+        self.assertEqual([entry.filename for entry in archive.infolist()],
+                         [f'{self.posts[0].id}-{posixpath.basename(self.posts[0].image.name)}'])
+
+    def test_invalid_selection(self):
+        """ Tests that a missing or too large selection is rejected and one matching nothing is not found """
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'ids': '1,a'}).status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(POST_ARCHIVE_MAX_POSTS=1):
+            response = self.client.get(self.url, {'published_by': 'downloader'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'published_by': 'nobody'}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(list(UserPost.objects.values_list('downloads', flat=True)), [0, 0, 0])
+
+
+@override_settings(POST_DATABASE_REPLICAS=('replica',), POST_RESPONSE_CACHE_TIMEOUT=0)
+class ReplicaRoutingTestCase(APITestCase):
+    """ Test cases for routing reads of post lists and details to a replica, which is a second SQLite database """
+
+    @classmethod
+    def setUpClass(cls):
+        """ Adds a migrated SQLite database in a temporary directory as replica alias """
+
+        super().setUpClass()
+        cls.replica_directory = tempfile.mkdtemp()
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'{cls.replica_directory}/replica.sqlite3',
+        }
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.replica_directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        """
+        Creates posts of a user on the primary and the same user and first post with another description on the
+        replica
+        """
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        cache_settings = override_settings(POST_DATABASE_REPLICA_CACHE_ALIAS='shared', CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir},
+        })
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+        self.addCleanup(get_counter_buffer().drain)
+        self.user = User.objects.create(username='writer', password='password1')
+        self.posts = [
+            UserPost.objects.create(published_by=self.user, description=description, image='images/messi.jpg')
+            for description in ('On the primary', 'Deleted on the primary')
+        ]
+        User.objects.using('replica').bulk_create([User(id=self.user.id, username='writer', password='password1')])
+        UserPost.objects.using('replica').bulk_create([
+            UserPost(id=self.posts[0].id, published_by_id=self.user.id, description='On the replica',
+                     image='images/messi.jpg'),
+        ])
+        self.addCleanup(User.objects.using('replica').all().delete)
+
+    def get_descriptions(self):
+        response = self.client.get(reverse('userpost-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['description'] for post in response.data['results']]
+
+    def test_reads_go_to_replica(self):
+        """ Tests that lists and details are read from the replica and other views from the primary """
+
+        self.assertEqual(self.get_descriptions(), ['On the replica'])
+        response = self.client.get(reverse('userpost-detail', kwargs={'pk': self.posts[0].id}))
+        self.assertEqual(response.data['description'], 'On the replica')
+
+        with self.settings(POST_DATABASE_REPLICAS=()):
+            self.assertEqual(self.get_descriptions(), ['On the primary', 'Deleted on the primary'])
+
+    def test_reads_stick_to_primary_after_write(self):
+        """ Tests that a user reads from the primary for a while after a write while other users read the replica """
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.delete(reverse('userpost-detail', kwargs={'pk': self.posts[1].id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(UserPost.objects.filter(pk=self.posts[1].id).exists())
+
+        self.assertEqual(self.get_descriptions(), ['On the primary'])
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.get_descriptions(), ['On the replica'])
+
+        get_sticky_cache().clear()
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.get_descriptions(), ['On the replica'])
+
+    def test_local_cache_reads_authenticated_users_from_primary(self):
+        """ Tests that authenticated users read from the primary when writes are remembered in a local cache """
+
+        self.client.force_authenticate(user=self.user)
+        with self.settings(POST_DATABASE_REPLICA_CACHE_ALIAS='default'):
+            self.assertEqual(self.get_descriptions(), ['On the primary', 'Deleted on the primary'])
+            self.client.force_authenticate(user=None)
+            self.assertEqual(self.get_descriptions(), ['On the replica'])
+
+    @override_settings(POST_RESPONSE_CACHE_TIMEOUT=300)
+    def test_replica_responses_are_not_cached(self):
+        """ Tests that responses read from the replica are not cached for users reading from the primary """
+
+        get_response_cache().cache.clear()
+        self.assertEqual(self.get_descriptions(), ['On the replica'])
+        self.assertEqual(self.client.get(reverse('userpost-list'))['X-Cache'], 'MISS')
+
+        self.client.force_authenticate(user=self.user)
+        stick_to_primary(self.user.pk)
+        self.assertEqual(self.get_descriptions(), ['On the primary', 'Deleted on the primary'])
+        response = self.client.get(reverse('userpost-list'))
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_writes_go_to_primary(self):
+        """ Tests that instances read from the replica are written to the primary """
+
+        router = ReplicaRouter()
+        post = UserPost.objects.using('replica').get(pk=self.posts[0].id)
+
+        self.assertEqual(router.db_for_write(UserPost, instance=post), 'default')
+        self.assertIsNone(router.db_for_read(UserPost))
+        self.assertTrue(router.allow_relation(post, self.user))
@@ -0,0 +1,276 @@
+"""
+NDJSON export and import of posts.
+
+Every line of an export holds one post with its publisher username, categories and tags by name, counters, stored
+image metadata and the name of its image in the storage, or with --images the base64 encoded image bytes so that the
+export can be imported next to another storage. Posts are read with ``iterator(chunk_size=...)`` and their categories
+and tags with two queries per chunk, so memory stays the size of one chunk however many posts there are.
+
+Imports read the lines a batch at a time, resolve publishers, categories and tags with a few queries per batch and
+insert posts, category links and tagged items with one bulk_create each. Images carried by the lines of a batch are
+stored before its transaction and deleted again when it fails. Bulk inserts send no signals, so search
+documents, facet counts, the category catalogue and cached responses are kept in step here. Imported posts get new
+IDs and no renditions, which generate_renditions creates afterwards.
+"""
+
+import base64
+import json
+from collections import Counter
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from taggit.models import TaggedItem
+
+from authentication.models import User
+from photogenie.api.utils import get_or_create_tags
+from photogenie.catalogue import invalidate_category_catalogue
+from photogenie.constants import TRANSFER_BATCH_SIZE
+from photogenie.facets import adjust_facet_counts, create_facet_counts
+from photogenie.models import Category, UserPost
+from photogenie.responses import invalidate_responses
+from photogenie.search import build_search_document
+
+EXPORT_FIELDS = ('description', 'image', 'views', 'downloads', 'image_width', 'image_height', 'image_size',
+                 'image_format', 'image_hash')
+
+
+def batched(iterable, size):
+    """ Yields lists of up to size items of the iterable. """
+
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def get_post_links(post_ids):
+    """ Returns dictionaries of post ID and the category names and of post ID and the tag names of given posts. """
+
+    categories, tags = {}, {}
+    links = UserPost.categories.through.objects.filter(userpost_id__in=post_ids).order_by('category__name')
+    for post_id, name in links.values_list('userpost_id', 'category__name'):
+        categories.setdefault(post_id, []).append(name)
+
+    content_type = ContentType.objects.get_for_model(UserPost)
+    tagged_items = TaggedItem.objects.filter(content_type=content_type, object_id__in=post_ids).order_by('tag__name')
+    for post_id, name in tagged_items.values_list('object_id', 'tag__name'):
+        tags.setdefault(post_id, []).append(name)
+    return categories, tags
+
+
+def export_posts(queryset=None, chunk_size=TRANSFER_BATCH_SIZE, with_images=False):
+    """
+    Yields a JSON line for every post of the queryset, or of all posts when None, ordered by ID. With with_images the
+    lines carry the image bytes as image_content, posts whose image can not be read are exported without them.
+    """
+
+    queryset = UserPost.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('id').values('id', 'published_at', 'published_by__username', *EXPORT_FIELDS)
+    for chunk in batched(rows.iterator(chunk_size=chunk_size), chunk_size):
+        categories, tags = get_post_links([row['id'] for row in chunk])
+        for row in chunk:
+            post_id = row.pop('id')
+            row['published_at'] = row['published_at'].isoformat()
+            row['published_by'] = row.pop('published_by__username')
+            row['categories'] = categories.get(post_id, [])
+            row['tags'] = tags.get(post_id, [])
+            if with_images:
+                try:
+                    with default_storage.open(row['image'], 'rb') as image:
+                        row['image_content'] = base64.b64encode(image.read()).decode()
+                except OSError:
+                    pass
+            yield json.dumps(row) + '\n'
+
+
+def get_categories(names):
+    """ Returns a dictionary of category name and ID for the given names, creating the missing categories. """
+
+    names = set(names)
+    categories = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = names.difference(categories)
+    if missing:
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        created = dict(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+        create_facet_counts('categories', created.values())
+        categories.update(created)
+        transaction.on_commit(invalidate_category_catalogue)
+    return categories
+
+
+def is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def get_field_values(record):
+    """
+    Returns the values of the exported fields of a record, raising ValueError for values the database would reject.
+    Counters of older exports that lack them start at zero and missing image metadata is read again later.
+    """
+
+    values = {'views': record.get('views', 0), 'downloads': record.get('downloads', 0)}
+    for name in ('views', 'downloads'):
+        if not is_count(values[name]):
+            raise ValueError(f'{name} must be a non-negative integer')
+    for name in ('image_width', 'image_height', 'image_size'):
+        values[name] = record.get(name)
+        if values[name] is not None and not is_count(values[name]):
+            raise ValueError(f'{name} must be a non-negative integer')
+    for name in ('description', 'image'):
+        values[name] = record[name]
+        if not isinstance(values[name], str) or not values[name]:
+            raise ValueError(f'{name} must be a non-empty string')
+    for name in ('image_format', 'image_hash'):
+        values[name] = record.get(name) or ''
+        if not isinstance(values[name], str) or len(values[name]) > UserPost._meta.get_field(name).max_length:
+            raise ValueError(f'{name} must be a string of up to {UserPost._meta.get_field(name).max_length} characters')
+    return values
+
+
+def build_post(record, users):
+    """
+    Returns an unsaved post from an exported record along with the decoded bytes of its image, or None when the
+    record does not carry them, and the sets of its category and tag names.
+    """
+
+    for name in ('categories', 'tags'):
+        names = record.get(name, [])
+        if not isinstance(names, list) or not all(isinstance(item, str) for item in names):
+            raise ValueError(f'{name} must be a list of names')
+    if not isinstance(record.get('published_by'), str):
+        raise ValueError('published_by must be a username')
+    published_at = parse_datetime(record['published_at'])
+    if published_at is None:
+        raise ValueError('published_at must be a date and time')
+    post = UserPost(published_by_id=users[record['published_by']], published_at=published_at,
+                    **get_field_values(record))
+    image_content = base64.b64decode(record['image_content']) if 'image_content' in record else None
+    category_names, tag_names = set(record.get('categories', [])), set(record.get('tags', []))
+    post.search_document = build_search_document(post.description, record['published_by'], category_names,
+                                                 tag_names)
+    return post, image_content, category_names, tag_names
+
+
+def store_images(posts):
+    """
+    Saves the image bytes carried by records to the storage and points their posts to the stored names, which are
+    returned so that they can be deleted when the batch fails.
+    """
+
+    stored = []
+    try:
+        for post, image_content, _, _ in posts:
+            if image_content is not None:
+                post.image = default_storage.save(post.image.name, ContentFile(image_content))
+                stored.append(post.image.name)
+    except Exception:
+        delete_images(stored)
+        raise
+    return stored
+
+
+def delete_images(names):
+    """ Deletes stored images of a batch that was not imported. """
+
+    for name in names:
+        default_storage.delete(name)
+
+
+def import_batch(records):
+    """
+    Inserts the posts of exported records in one transaction and returns a dictionary of line number and error of
+    the records that were skipped, records are pairs of line number and the decoded line. Images stored for the batch
+    are deleted again when its transaction fails.
+    """
+
+    errors = {}
+    usernames = {record.get('published_by') for _, record in records if isinstance(record.get('published_by'), str)}
+    users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    posts = []
+    for line_number, record in records:
+        published_by = record.get('published_by')
+        if isinstance(published_by, str) and published_by not in users:
+            errors[line_number] = f'Unknown user {published_by!r}.'
+            continue
+        try:
+            posts.append(build_post(record, users))
+        except (KeyError, TypeError, ValueError) as error:
+            errors[line_number] = f'Invalid post: {error!r}.'
+    if not posts:
+        return errors
+
+    stored = store_images(posts)
+    try:
+        with transaction.atomic():
+            insert_posts(posts)
+    except Exception:
+        delete_images(stored)
+        raise
+    return errors
+
+
+def insert_posts(posts):
+    """ Inserts the built posts with their category links and tagged items and counts them in the facets. """
+
+    categories = get_categories(name for _, _, names, _ in posts for name in names)
+    tags = get_or_create_tags(name for _, _, _, names in posts for name in names)
+
+    published_at = [post.published_at for post, _, _, _ in posts]
+    UserPost.objects.bulk_create([post for post, _, _, _ in posts])
+    # auto_now_add replaced the exported publication times on insert.
+    for (post, _, _, _), value in zip(posts, published_at):
+        post.published_at = value
+    UserPost.objects.bulk_update([post for post, _, _, _ in posts], ['published_at'])
+
+    through = UserPost.categories.through
+    links = [
+        through(userpost_id=post.pk, category_id=categories[name])
+        for post, _, names, _ in posts for name in names
+    ]
+    through.objects.bulk_create(links)
+    content_type = ContentType.objects.get_for_model(UserPost)
+    tagged_items = [
+        TaggedItem(content_type=content_type, object_id=post.pk, tag=tags[name])
+        for post, _, _, names in posts for name in names
+    ]
+    TaggedItem.objects.bulk_create(tagged_items)
+    adjust_facet_counts('categories', Counter(link.category_id for link in links))
+    adjust_facet_counts('tags', Counter(tagged_item.tag_id for tagged_item in tagged_items))
+
+
+def import_posts(lines, batch_size=TRANSFER_BATCH_SIZE, on_batch=None):
+    """
+    Imports the posts of exported lines in batches, returns the number of posts imported and a dictionary of line
+    number and error of the lines that were skipped. on_batch is called with the number imported after every batch.
+    """
+
+    imported = 0
+    errors = {}
+
+    def decode(numbered_lines):
+        for line_number, line in numbered_lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                errors[line_number] = f'Invalid JSON: {error}'
+                continue
+            if not isinstance(record, dict):
+                errors[line_number] = 'Expected a JSON object.'
+                continue
+            yield line_number, record
+
+    for records in batched(decode(enumerate(lines, 1)), batch_size):
+        batch_errors = import_batch(records)
+        errors.update(batch_errors)
+        imported += len(records) - len(batch_errors)
+        if on_batch is not None:
+            on_batch(imported)
+
+    if imported:
+        invalidate_responses()
+    return imported, errors